@@ -0,0 +1,98 @@
+#! /usr/bin/env python
+"""Benchmarks the block-formatted grd writer against the previous per-line
+f-string writer and checks that both produce byte-identical output.
+
+Usage:
+    python benchmarks/grd_writer.py [path/to/hgrid.gr3] [--size N]
+
+When no mesh is given, a synthetic mesh of roughly N nodes with mixed
+triangles and quads is generated.
+"""
+import argparse
+import numbers
+import pathlib
+import tempfile
+from time import time
+
+import numpy as np
+
+from pyschism.mesh.parsers import grd
+
+
+def legacy_to_string(description, nodes, elements, boundaries=None, crs=None):
+    """Per-line writer used before the block-formatted implementation."""
+    NE, NP = len(elements), len(nodes)
+    out = [f"{description}", f"{NE} {NP}"]
+    for id, (coords, values) in nodes.items():
+        if isinstance(values, numbers.Number):
+            values = [values]
+        line = [f"{id}"]
+        line.extend([f"{x:<.8f}" for x in coords])
+        line.extend([f"{x:<.8f}" for x in values])
+        out.append(" ".join(line))
+    for id, element in elements.items():
+        line = [f"{id}"]
+        line.append(f"{len(element)}")
+        line.extend([f"{e}" for e in element])
+        out.append(" ".join(line))
+    if boundaries is None:
+        out.append('')
+        return "\n".join(out)
+    out.extend(grd._boundaries_to_lines(boundaries))
+    return "\n".join(out)
+
+
+def synthetic_mesh(size):
+    n = int(np.sqrt(size))
+    x, y = np.meshgrid(np.linspace(-80., -60., n), np.linspace(20., 45., n))
+    coords = np.column_stack([x.ravel(), y.ravel()])
+    values = np.random.default_rng(0).uniform(-10., 5000., coords.shape[0])
+    connectivity = []
+    for j in range(n - 1):
+        for i in range(n - 1):
+            a = j * n + i
+            if (i + j) % 5 == 0:
+                connectivity.append([a, a + 1, a + n + 1, a + n])
+            else:
+                connectivity.append([a, a + 1, a + n + 1, -1])
+                connectivity.append([a, a + n + 1, a + n, -1])
+    connectivity = np.array(connectivity, dtype=np.int32)
+    return {
+        'description': 'synthetic',
+        'nodes': {'id': np.arange(1, coords.shape[0] + 1), 'coords': coords,
+                  'values': values},
+        'elements': {'id': np.arange(1, connectivity.shape[0] + 1),
+                     'connectivity': connectivity},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('mesh', nargs='?')
+    parser.add_argument('--size', type=int, default=1000000)
+    args = parser.parse_args()
+
+    if args.mesh is not None:
+        _grd = grd.read(args.mesh, crs=False, arrays=True)
+        _dict = grd.read(args.mesh, crs=False)
+    else:
+        _grd = synthetic_mesh(args.size)
+        tmpfile = tempfile.NamedTemporaryFile(suffix='.gr3')
+        grd.write(_grd, tmpfile.name, overwrite=True, arrays=True)
+        _dict = grd.read(tmpfile.name, crs=False)
+
+    start = time()
+    reference = legacy_to_string(**_dict)
+    print(f'legacy writer: {time() - start:.2f} s')
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = pathlib.Path(tmpdir) / 'hgrid.gr3'
+        start = time()
+        grd.write(_grd, path, arrays=True)
+        print(f'block writer: {time() - start:.2f} s')
+        identical = path.read_text() == reference
+    print(f'byte-identical: {identical}')
+
+
+if __name__ == '__main__':
+    main()
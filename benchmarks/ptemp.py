@@ -0,0 +1,93 @@
+#! /usr/bin/env python
+"""Benchmarks the float32 potential temperature of HYCOM tiles against the
+previous seawater.ptmp conversion and reports the largest difference.
+
+Usage:
+    python benchmarks/ptemp.py [--shape NZ NY NX] [--points N] [--repeat R]
+
+A synthetic 40-level GOFS tile with a land mask is converted as a whole,
+then restricted to the cells used to interpolate N boundary points.
+"""
+import argparse
+from time import time
+
+import numpy as np
+import seawater as sw
+
+from pyschism.forcing.hycom.hycom2schism import GridInterpolator
+from pyschism.forcing.hycom.ptemp import potential_temperature
+
+# GOFS 3.1 depth levels
+DEPTHS = np.array([
+    0., 2., 4., 6., 8., 10., 12., 15., 20., 25., 30., 35., 40., 45., 50.,
+    60., 70., 80., 90., 100., 125., 150., 200., 250., 300., 350., 400., 500.,
+    600., 700., 800., 900., 1000., 1250., 1500., 2000., 2500., 3000., 4000.,
+    5000.])
+
+
+def legacy_convert_temp(salt, temp, dep):
+    """Conversion used before the float32 implementation."""
+    pr = np.ones(temp.shape)
+    pre = pr*dep[:, None, None]
+    Pr = np.zeros(temp.shape)
+    return sw.ptmp(salt, temp, pre, Pr)*1.00024
+
+
+def synthetic_tile(shape):
+    rng = np.random.default_rng(0)
+    dep = DEPTHS[:shape[0]] if shape[0] <= len(DEPTHS) \
+        else np.linspace(0., 5000., shape[0])
+    salt = rng.uniform(30., 38., shape)
+    temp = rng.uniform(-2., 30., shape)
+    # land and the cells below the sea bed hold the HYCOM fill value
+    bottom = rng.uniform(0., dep[-1], shape[1:])
+    land = dep[:, None, None] > bottom
+    land[:, :, :shape[2] // 4] = True
+    salt[land] = -30000.
+    temp[land] = -30000.
+    return np.ma.masked_equal(salt, -30000.), \
+        np.ma.masked_equal(temp, -30000.), dep
+
+
+def timeit(func, repeat):
+    start = time()
+    for _ in range(repeat):
+        out = func()
+    return out, (time() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--shape', type=int, nargs=3, default=[40, 250, 250])
+    parser.add_argument('--points', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    salt, temp, dep = synthetic_tile(tuple(args.shape))
+    valid = ~salt.mask
+
+    reference, elapsed = timeit(
+        lambda: legacy_convert_temp(salt, temp, dep), args.repeat)
+    reference = np.ma.filled(reference, np.nan)
+    print(f'seawater.ptmp: {elapsed:.3f} s')
+
+    ptemp, elapsed = timeit(
+        lambda: potential_temperature(salt, temp, dep), args.repeat)
+    print(f'float32, all cells: {elapsed:.3f} s')
+    print(f'max difference: {np.nanmax(np.abs(ptemp - reference)[valid]):.2e}')
+
+    rng = np.random.default_rng(1)
+    grid = (dep, np.arange(args.shape[1], dtype=float),
+            np.arange(args.shape[2], dtype=float))
+    points = np.c_[rng.uniform(0., 1000., args.points * 10),
+                   np.repeat(rng.uniform(0., args.shape[1] - 1, args.points), 10),
+                   np.repeat(rng.uniform(0., args.shape[2] - 1, args.points), 10)]
+    cells = GridInterpolator(grid, points).cells
+    ptemp, elapsed = timeit(
+        lambda: potential_temperature(salt, temp, dep, cells), args.repeat)
+    print(f'float32, {len(cells)} cells used by {len(points)} points: '
+          f'{elapsed:.3f} s')
+
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,7 @@ from pyschism.cmd.fluxflag import FluxflagCli
 from pyschism.cmd.forecast import ForecastCli
 from pyschism.cmd.grd2sms import Grd2SmsCli
 from pyschism.cmd.hgrid import HgridCli
+from pyschism.cmd._nudge import NudgeCli
 from pyschism.cmd.outputs import OutputsCli
 from pyschism.cmd.sflux import SfluxCli
 from pyschism.cmd.sms2grd import Sms2grdCli
@@ -22,6 +23,7 @@ __all__ = [
     "ForecastCli",
     "Grd2SmsCli",
     "HgridCli",
+    "NudgeCli",
     "OutputsCli",
     "SfluxCli",
     "Sms2grdCli",
@@ -1,27 +1,42 @@
 import argparse
+from datetime import timedelta
 import logging
+import pathlib
 import warnings
 
 from pyproj import CRS
 
-from pyschism.forcing.bctides.nudge import Nudge
-from pyschism.forcing.baroclinic import GOFS, RTOFS
-from pyschism.mesh import Hgrid, Vgrid
+from pyschism.cmd.common import add_dates_to_parser
+from pyschism.forcing.hycom.hycom2schism import Nudge
+from pyschism.forcing.hycom.rtofs2schism import NudgeTS
+from pyschism.mesh import Hgrid
 
 logger = logging.getLogger(__name__)
 
 
 class NudgeCli:
     def __init__(self, args: argparse.Namespace):
-        data_source = {
-            "gofs": GOFS,
-            "rtofs": RTOFS,
-        }[args.baroclinic_database]()
-        nudge = Nudge(args.hgrid, rlmax=args.rlmax, rnu_day=args.rnu_day)
-        temp = nudge(data_source.temperature, args.vgrid)
-        temp.write('TEM_nudge.gr3')
-        salt = nudge(data_source.salinity, args.vgrid)
-        salt.write('SAL_nudge.gr3')
+        outdir = pathlib.Path(args.output_directory)
+        outdir.mkdir(parents=True, exist_ok=True)
+        end_date = args.end_date
+        if not isinstance(end_date, timedelta):
+            end_date = end_date - args.start_date
+        rnday = end_date / timedelta(days=1)
+        nudge = Nudge()
+        include = nudge.gen_nudge(
+            outdir, args.hgrid, rlmax=args.rlmax, rnu_day=args.rnu_day)
+        if args.baroclinic_database == 'gofs':
+            nudge.fetch_data(
+                outdir, args.hgrid, args.vgrid, args.start_date, rnday,
+                workers=args.workers, prefetch=args.prefetch, include=include)
+        else:
+            NudgeTS().fetch_data(
+                outdir, args.hgrid, args.vgrid, args.start_date, rnday,
+                include)
+
+    @staticmethod
+    def add_subparser_action(subparsers):
+        add_nudge(subparsers)
 
 
 def add_nudge(subparsers):
@@ -30,16 +45,24 @@ def add_nudge(subparsers):
         "hgrid",
         action=HgridAction,
     )
-    nudge.add_argument(
-        "vgrid",
-        action=VgridAction,
-    )
+    nudge.add_argument("vgrid")
     nudge.add_argument(
         "--hgrid-crs",
         action=HgridCrsAction
     )
     nudge.add_argument('--rlmax', type=float, default=1.5)
     nudge.add_argument('--rnu_day', type=float, default=0.25)
+    add_dates_to_parser(nudge)
+    nudge.add_argument(
+        '--output-directory', '-o', default='.',
+        help='Directory where the *_nudge.gr3 and *_nu.nc files are written.')
+    nudge.add_argument(
+        '--workers', type=int, default=4,
+        help='Number of processes downloading and interpolating the daily '
+        'GOFS data. 1 processes the days serially.')
+    nudge.add_argument(
+        '--prefetch', type=int, default=2,
+        help='Number of days downloaded ahead of the interpolation.')
     nudge.add_argument(
         '--hycom',
         '--baroclinic-database',
@@ -69,8 +92,3 @@ class HgridCrsAction(argparse.Action):
         if values is not None:
             namespace.hgrid.nodes._crs = CRS.from_user_input(values)
         setattr(namespace, self.dest, values)
-
-
-class VgridAction(argparse.Action):
-    def __call__(self, parser, namespace, values, option_string=None):
-        setattr(namespace, self.dest, Vgrid.open(values))
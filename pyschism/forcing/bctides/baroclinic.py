@@ -0,0 +1,298 @@
+"""Single pass writer of the GOFS boundary time histories.
+
+:class:`BaroclinicBoundaries` writes elev2D.th.nc, uv3D.th.nc, TEM_3D.th.nc
+and SAL_3D.th.nc together. For each output time, every variable needed by
+any of the files is read once over a window covering the boundaries that
+use it, and the boundaries are interpolated from slices of that window: the
+salinity is read once for TEM_3D and SAL_3D, and a boundary region once for
+all the files. The interpolations run in a thread pool and the records are
+written from the calling thread. The time spent reading, interpolating and
+writing is logged and returned.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import timedelta
+import logging
+import pathlib
+from time import time
+
+import numpy as np
+import tqdm
+import tqdm_logging_wrapper
+
+from pyschism.forcing.bctides.ncwriter import ThNcWriter
+from pyschism.forcing.hycom.gofs import GOFSComponent
+from pyschism.forcing.hycom.interp import get_interpolator
+from pyschism.forcing.hycom.ptemp import potential_temperature
+
+logger = logging.getLogger(__name__)
+
+
+# name: (bctype, bctype values, 3D, nComponents, variables read)
+OUTPUTS = {
+    'elev2D': ('iettype', (4, 5), False, 1, ('surf_el',)),
+    'uv3D': ('ifltype', (4, 5), True, 2, ('water_u', 'water_v')),
+    'TEM_3D': ('itetype', (4,), True, 1, ('water_temp', 'salinity')),
+    'SAL_3D': ('isatype', (4,), True, 1, ('salinity',)),
+}
+
+
+def merge_windows(windows):
+    """Groups the (lon_idxs, lat_idxs) windows into the rectangles that are
+    read.
+
+    Two rectangles are merged when the rectangle covering both is not larger
+    than the two together, so overlapping boundaries share one read and
+    distant ones are read apart. Returns a list of (lat slice, lon slice,
+    keys of the windows) for a dict of windows.
+    """
+    boxes = [(min(lat), max(lat) + 1, min(lon), max(lon) + 1, [key])
+             for key, (lon, lat) in windows.items()]
+
+    def area(box):
+        return (box[1] - box[0]) * (box[3] - box[2])
+
+    def merge(a, b):
+        return (min(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]),
+                max(a[3], b[3]), a[4] + b[4])
+
+    merged = True
+    while merged:
+        merged = False
+        for a in range(len(boxes)):
+            for b in range(a + 1, len(boxes)):
+                box = merge(boxes[a], boxes[b])
+                if area(box) <= area(boxes[a]) + area(boxes[b]):
+                    boxes[a] = box
+                    del boxes[b]
+                    merged = True
+                    break
+            if merged:
+                break
+    return [(slice(box[0], box[1]), slice(box[2], box[3]), box[4])
+            for box in boxes]
+
+
+class BaroclinicBoundaries:
+    """Writes the GOFS boundary time histories of a Bctides in one pass.
+
+    Args:
+        bctides: The Bctides whose boundaries are written.
+        output_interval: Time step of the records.
+        pixel_buffer: Number of cells added around each boundary window.
+        workers: Number of threads interpolating the boundaries.
+    """
+
+    def __init__(
+            self,
+            bctides,
+            output_interval: timedelta = timedelta(days=1),
+            pixel_buffer: int = 10,
+            workers: int = 4,
+    ):
+        self.bctides = bctides
+        self.output_interval = output_interval
+        self.pixel_buffer = pixel_buffer
+        self.workers = workers
+
+    def write(
+            self,
+            paths: dict,
+            start_date,
+            rnday,
+            overwrite: bool = False,
+            progress_bar: bool = True,
+    ):
+        """Writes the files of paths, a dict of OUTPUTS names to paths or
+        None. A file that no boundary uses is not written.
+
+        Returns the seconds spent reading, interpolating and writing.
+        """
+        outputs = self._get_outputs(paths, overwrite)
+        timings = {'read': 0., 'interpolate': 0., 'write': 0.}
+        if not outputs:
+            return timings
+        boundaries = self._get_boundaries(outputs)
+        reader = next(iter(next(iter(outputs.values()))['components'].values()))
+        datasets = list(reader.get_datasets(
+            start_date, rnday, self.output_interval).values())
+
+        nOpenBndNodes = sum(len(b.indexes) for b in self.bctides.gdf.itertuples())
+        writers = {}
+        items = list(enumerate(datasets))
+        if progress_bar is True:
+            items = tqdm.tqdm(items)
+        try:
+            for name, output in outputs.items():
+                writers[name] = ThNcWriter(
+                    output['path'],
+                    nOpenBndNodes,
+                    self.bctides.vgrid.nvrt if output['3D'] else 1,
+                    output['nComponents'],
+                    int(self.output_interval.total_seconds()),
+                )
+                writers[name]['time'][:] = range(len(datasets))
+            with tqdm_logging_wrapper.wrap_logging_for_tqdm(items) \
+                    if progress_bar is True else nullcontext(), \
+                    ThreadPoolExecutor(self.workers) as executor:
+                grids = {}
+                for i, dataset in items:
+                    start = time()
+                    if id(dataset) not in grids:
+                        grids[id(dataset)] = self._get_grids(
+                            dataset, outputs, boundaries)
+                    time_idx = reader._record_time_idx(
+                        dataset, i, start_date, self.output_interval)
+                    values = self._read(
+                        dataset, time_idx, grids[id(dataset)], boundaries)
+                    timings['read'] += time() - start
+
+                    start = time()
+                    futures = [
+                        executor.submit(
+                            self._interpolate, i, name, output,
+                            boundaries[key], grids[id(dataset)][key],
+                            values[key])
+                        for name, output in outputs.items()
+                        for key in output['components']]
+                    results = [future.result() for future in futures]
+                    timings['interpolate'] += time() - start
+
+                    start = time()
+                    for name, offset, records in results:
+                        for record, component in records:
+                            writers[name].write(
+                                i, record, offset=offset, component=component)
+                    timings['write'] += time() - start
+        finally:
+            for writer in writers.values():
+                writer.close()
+        logger.info('GOFS boundaries written in: ' + ', '.join(
+            f'{stage} {seconds:.2f} s' for stage, seconds in timings.items()))
+        return timings
+
+    def _get_outputs(self, paths, overwrite):
+        """Returns the files to write, with the data component of each of
+        their boundaries."""
+        outputs = {}
+        for name, path in paths.items():
+            if path is None:
+                continue
+            bctype, values, is3d, nComponents, variables = OUTPUTS[name]
+            components = {}
+            for boundary in self.bctides.gdf.itertuples():
+                obj = getattr(boundary, bctype)
+                if obj is None:
+                    continue
+                if getattr(obj, bctype) in values:
+                    if not isinstance(obj.data_component, GOFSComponent):
+                        raise NotImplementedError(
+                            f'{name} can only be written from GOFS, not from '
+                            f'{type(obj.data_component)}.')
+                    components[boundary.Index] = obj.data_component
+            if not components:
+                continue
+            path = pathlib.Path(path)
+            if path.exists() and overwrite is not True:
+                raise IOError(f'File {path} exists and overwrite is not True.')
+            for boundary in self.bctides.gdf.itertuples():
+                if getattr(boundary, bctype) is None:
+                    raise NotImplementedError('Must write null data.')
+            outputs[name] = {
+                'path': path,
+                '3D': is3d,
+                'nComponents': nComponents,
+                'variables': variables,
+                'components': components,
+            }
+        return outputs
+
+    def _get_boundaries(self, outputs):
+        """Returns the boundaries used by the outputs, with their node offset,
+        the variables read for them and their vertical points."""
+        boundaries = {}
+        offset = 0
+        for boundary in self.bctides.gdf.itertuples():
+            used = [output for output in outputs.values()
+                    if boundary.Index in output['components']]
+            if used:
+                data = {
+                    'boundary': boundary,
+                    'offset': offset,
+                    'variables': {var for output in used
+                                  for var in output['variables']},
+                }
+                component = next(
+                    (output['components'][boundary.Index] for output in used
+                     if output['3D']), None)
+                if component is not None:
+                    data['points'] = component._boundary_points(
+                        self.bctides.hgrid, self.bctides.vgrid, boundary)
+                boundaries[boundary.Index] = data
+            offset += len(boundary.indexes)
+        return boundaries
+
+    def _get_grids(self, dataset, outputs, boundaries):
+        """Returns the window of each boundary in dataset, with its source
+        grids, and the rectangles read for them."""
+        grids = {}
+        for key, data in boundaries.items():
+            components = [output['components'][key] for output in outputs.values()
+                          if key in output['components']]
+            lon_idxs, lat_idxs = components[0]._boundary_window(
+                dataset, data['boundary'], self.pixel_buffer)
+            grids[key] = {'window': (lon_idxs, lat_idxs)}
+            if 'elev2D' in outputs and key in outputs['elev2D']['components']:
+                grids[key]['sources'] = outputs['elev2D']['components'][key] \
+                    ._boundary_sources(dataset, lon_idxs, lat_idxs)
+            if 'points' in data:
+                grid = components[0]._boundary_grid(dataset, lon_idxs, lat_idxs)
+                grids[key]['grid'] = grid
+                if 'TEM_3D' in outputs and key in outputs['TEM_3D']['components']:
+                    grids[key]['cells'] = get_interpolator(
+                        grid, data['points'][1]).cells
+        grids['reads'] = merge_windows(
+            {key: grids[key]['window'] for key in boundaries})
+        return grids
+
+    def _read(self, dataset, time_idx, grids, boundaries):
+        """Reads each variable once per rectangle and returns the values of
+        each boundary window."""
+        values = {key: {} for key in boundaries}
+        for lat_slice, lon_slice, keys in grids['reads']:
+            variables = set().union(*(boundaries[key]['variables'] for key in keys))
+            for var in sorted(variables):
+                if var == 'surf_el':
+                    block = dataset[var][time_idx, lat_slice, lon_slice]
+                else:
+                    block = dataset[var][time_idx, :, lat_slice, lon_slice]
+                for key in keys:
+                    if var not in boundaries[key]['variables']:
+                        continue
+                    lon_idxs, lat_idxs = grids[key]['window']
+                    rows = np.asarray(lat_idxs) - lat_slice.start
+                    cols = np.asarray(lon_idxs) - lon_slice.start
+                    values[key][var] = block[..., rows, :][..., cols]
+        return values
+
+    def _interpolate(self, i, name, output, data, grids, values):
+        """Returns (name, node offset, [(values, component)]) of the records
+        of output time i of one file on one boundary."""
+        component = output['components'][data['boundary'].Index]
+        if name == 'elev2D':
+            records = [(i, grids['sources'], values['surf_el'])]
+            return name, data['offset'], [
+                (record, None) for _, record in
+                component._interpolate_2d(data['boundary'], records)]
+        bz, bzyx = data['points']
+        if name == 'uv3D':
+            fields = [(values['water_u'], 0), (values['water_v'], 1)]
+        elif name == 'TEM_3D':
+            fields = [(potential_temperature(
+                values['salinity'], values['water_temp'], grids['grid'][0],
+                grids['cells']), None)]
+        else:
+            fields = [(values['salinity'], None)]
+        return name, data['offset'], [
+            (record, idx) for field, idx in fields for _, record in
+            component._interpolate_3d(bz, bzyx, [(i, grids['grid'], field)])]
@@ -7,9 +7,7 @@ from pyschism import dates
 
 from pyschism.mesh.vgrid import Vgrid
 from pyschism.forcing.bctides import iettype, ifltype, isatype, itetype, itrtype, Tides
-from pyschism.forcing.bctides.elev2d import Elev2D
-from pyschism.forcing.bctides.uv3d import UV3D
-from pyschism.forcing.bctides.mod3d import TEM_3D, SAL_3D
+from pyschism.forcing.bctides.baroclinic import BaroclinicBoundaries
 
 logger = logging.getLogger(__name__)
 
@@ -172,72 +170,24 @@ class Bctides(metaclass=BctidesMeta):
         #            )
         #            break
 
-        def write_elev2D():
-            _elev2D = output_directory / "elev2D.th.nc" if elev2D is True else elev2D
-            Elev2D(self).write(
-                _elev2D,
-                self.start_date,
-                self.rnday,
-                timedelta(days=1),
-                overwrite,
-                progress_bar=progress_bar,
-            )
-
-        def write_uv3D():
-            # write uv3D.th.nc
-            _uv3D = output_directory / "uv3D.th.nc" if uv3D is True else uv3D
-            UV3D(self).write(
-                _uv3D,
-                self.start_date,
-                self.rnday,
-                timedelta(days=1),
-                overwrite,
-                progress_bar=progress_bar,
-            )
-
-        def write_tem3D():
-            # write TEM_3D.th.nc
-            _tem3D = output_directory / "TEM_3D.th.nc" if tem3D is True else tem3D
-            TEM_3D(self).write(
-                _tem3D,
-                self.start_date,
-                self.rnday,
-                timedelta(days=1),
-                overwrite,
-                progress_bar=progress_bar,
-            )
-
-        def write_sal3D():
-            _sal3D = output_directory / "SAL_3D.th.nc" if sal3D is True else sal3D
-            SAL_3D(self).write(
-                _sal3D,
-                self.start_date,
-                self.rnday,
-                timedelta(days=1),
-                overwrite,
-                progress_bar=progress_bar,
-            )
-
-        if parallel_download is True:
-            from multiprocessing import Process
-
-            jobs = [
-                Process(target=f)
-                for f in (write_elev2D, write_uv3D, write_tem3D, write_sal3D)
-            ]
-            for job in jobs:
-                job.start()
-            for job in jobs:
-                job.join()
-        else:
-            if elev2D:
-                write_elev2D()
-            if uv3D:
-                write_uv3D()
-            if tem3D:
-                write_tem3D()
-            if sal3D:
-                write_sal3D()
+        # the GOFS boundary files are written in one pass over the records
+        paths = {
+            "elev2D": output_directory / "elev2D.th.nc" if elev2D is True else elev2D,
+            "uv3D": output_directory / "uv3D.th.nc" if uv3D is True else uv3D,
+            "TEM_3D": output_directory / "TEM_3D.th.nc" if tem3D is True else tem3D,
+            "SAL_3D": output_directory / "SAL_3D.th.nc" if sal3D is True else sal3D,
+        }
+        BaroclinicBoundaries(
+            self,
+            timedelta(days=1),
+            workers=4 if parallel_download is True else 1,
+        ).write(
+            {name: path if path else None for name, path in paths.items()},
+            self.start_date,
+            self.rnday,
+            overwrite,
+            progress_bar=progress_bar,
+        )
 
         # def write_tracer(tracer):
         #     tracer.write()
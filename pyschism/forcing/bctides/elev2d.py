@@ -2,7 +2,7 @@ from datetime import timedelta
 import pathlib
 
 # import geopandas as gpd
-from netCDF4 import Dataset
+from pyschism.forcing.bctides.ncwriter import ThNcWriter
 
 
 class Elev2D:
@@ -43,21 +43,14 @@ class Elev2D:
         for boundary in self.bctides.gdf.itertuples():
             nOpenBndNodes += len(boundary.indexes)
 
-        dst = Dataset(elev2D, 'w', format='NETCDF4')
-        # dimensions
-        dst.createDimension('nOpenBndNodes', nOpenBndNodes)
-        dst.createDimension('one', 1)
-        dst.createDimension('time', None)
-        dst.createDimension('nLevels', 1)
-        dst.createDimension('nComponents', 1)
-
-        # variables
-        dst.createVariable('time_step', 'f', ('one',))
-        dst['time_step'][:] = int(output_interval.total_seconds())
-        dst.createVariable('time', 'f', ('time',))
+        dst = ThNcWriter(
+            elev2D,
+            nOpenBndNodes,
+            1,
+            1,
+            int(output_interval.total_seconds()),
+        )
         dst['time'][:] = timevec
-        dst.createVariable('time_series', 'f',
-                           ('time', 'nOpenBndNodes', 'nLevels', 'nComponents'))
         offset = 0
         for boundary in self.bctides.gdf.itertuples():
             if boundary.iettype is not None:
@@ -69,6 +62,7 @@ class Elev2D:
             else:
                 self.put_null_boundary_data(dst, len(boundary.indexes))
             offset += len(boundary.indexes)
+        dst.close()
 
     def put_null_boundary_data(self, dst, np):
         raise NotImplementedError('Must write null data.')
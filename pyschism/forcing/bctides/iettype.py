@@ -45,10 +45,10 @@ class TidalElevation(Iettype):
 
     def get_boundary_string(self, hgrid, boundary, global_constituents: List[str] = None):
         f = []
+        vertices = hgrid.get_xy(crs="EPSG:4326")[boundary.indexes, :]
         if global_constituents is None:
             for constituent in self.tides.get_active_forcing_constituents():
                 f.append(f"{constituent}")
-                vertices = hgrid.get_xy(crs="EPSG:4326")[boundary.indexes, :]
                 amp, phase = self.tides.get_elevation(constituent, vertices)
                 for i in range(len(boundary.indexes)):
                     f.append(f"{amp[i]:.8e} {phase[i]:.8e}")
@@ -60,7 +60,6 @@ class TidalElevation(Iettype):
                     for i in range(len(boundary.indexes)):
                         f.append(f"{0:.8e} {0:.8e}")
                 else:
-                    vertices = hgrid.get_xy(crs="EPSG:4326")[boundary.indexes, :]
                     amp, phase = self.tides.get_elevation(constituent, vertices)
                     for i in range(len(boundary.indexes)):
                         f.append(f"{amp[i]:.8e} {phase[i]:.8e}")
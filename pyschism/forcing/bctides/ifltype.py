@@ -39,10 +39,10 @@ class TidalVelocity(Ifltype):
 
     def get_boundary_string(self, hgrid, boundary, global_constituents=None):
         f = []
+        vertices = hgrid.get_xy(crs="EPSG:4326")[boundary.indexes, :]
         if global_constituents is None:
             for constituent in self.tides.get_active_forcing_constituents():
                 f.append(f"{constituent}")
-                vertices = hgrid.get_xy(crs="EPSG:4326")[boundary.indexes, :]
                 uamp, uphase, vamp, vphase = self.tides.get_velocity(constituent, vertices)
                 for i in range(len(vertices)):
                     f.append(
@@ -56,7 +56,6 @@ class TidalVelocity(Ifltype):
                     for i in range(len(boundary.indexes)):
                         f.append(f"{0:.8e} {0:.8e} {0:.8e} {0:.8e}")
                 else:
-                    vertices = hgrid.get_xy(crs="EPSG:4326")[boundary.indexes, :]
                     uamp, uphase, vamp, vphase = self.tides.get_velocity(constituent, vertices)
                     for i in range(len(boundary.indexes)):
                         f.append(f"{uamp[i]:.8e} {uphase[i]:.8e} {vamp[i]:.8e} {vphase[i]:.8e}")
@@ -2,7 +2,7 @@ from abc import ABC, abstractmethod
 from datetime import timedelta
 import pathlib
 
-from netCDF4 import Dataset
+from pyschism.forcing.bctides.ncwriter import ThNcWriter
 
 
 class MOD_3D(ABC):
@@ -43,21 +43,14 @@ class MOD_3D(ABC):
         for boundary in self.bctides.gdf.itertuples():
             nOpenBndNodes += len(boundary.indexes)
 
-        dst = Dataset(path, 'w', format='NETCDF4')
-        # dimensions
-        dst.createDimension('nOpenBndNodes', nOpenBndNodes)
-        dst.createDimension('one', 1)
-        dst.createDimension('time', None)
-        dst.createDimension('nLevels', self.bctides.vgrid.nvrt)
-        dst.createDimension('nComponents', self.nComponents)
-
-        # variables
-        dst.createVariable('time_step', 'f', ('one',))
-        dst['time_step'][:] = int(output_interval.total_seconds())
-        dst.createVariable('time', 'f', ('time',))
+        dst = ThNcWriter(
+            path,
+            nOpenBndNodes,
+            self.bctides.vgrid.nvrt,
+            self.nComponents,
+            int(output_interval.total_seconds()),
+        )
         dst['time'][:] = timevec
-        dst.createVariable('time_series', 'f',
-                           ('time', 'nOpenBndNodes', 'nLevels', 'nComponents'))
         offset = 0
         for boundary in self.bctides.gdf.itertuples():
             obj = getattr(boundary, self.bctype)
@@ -80,6 +73,7 @@ class MOD_3D(ABC):
             else:
                 self.put_null_boundary_data(dst, len(boundary.indexes))
             offset += len(boundary.indexes)
+        dst.close()
 
     def put_null_boundary_data(self, dst, np):
         raise NotImplementedError('Must write null data.')
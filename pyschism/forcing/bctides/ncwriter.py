@@ -0,0 +1,140 @@
+"""Streaming writers of the SCHISM boundary and nudging NetCDF inputs.
+
+:class:`ThNcWriter` writes the ``*.th.nc`` boundary time histories
+(elev2D.th.nc, uv3D.th.nc, TEM_3D.th.nc and SAL_3D.th.nc) and
+:class:`NuNcWriter` the ``*_nu.nc`` nudging files. Both write one time
+record at a time into a float32 variable chunked by time record, so the
+whole time series never has to be held in memory and each record is
+written to a single chunk.
+"""
+import os
+import pathlib
+from typing import Union
+
+from netCDF4 import Dataset
+import numpy as np
+
+
+class TimeSeriesWriter:
+
+    def __init__(
+            self,
+            path: Union[str, os.PathLike],
+            dimensions: dict,
+            name: str,
+            zlib: bool = False,
+            complevel: int = 4,
+            shuffle: bool = True,
+    ):
+        self.path = pathlib.Path(path)
+        self.dataset = Dataset(self.path, 'w', format='NETCDF4')
+        self.dataset.createDimension('time', None)
+        for dim, size in dimensions.items():
+            self.dataset.createDimension(dim, size)
+        self.dataset.createVariable('time', 'f4', ('time',))
+        dims = ('time', *dimensions)
+        self.variable = self.dataset.createVariable(
+            name, 'f4', dims, zlib=zlib, complevel=complevel, shuffle=shuffle,
+            chunksizes=(1, *(max(size, 1) for size in dimensions.values())))
+        # keep a whole record in the chunk cache, for partial record writes
+        cache_size, nelems, preemption = self.variable.get_var_chunk_cache()
+        record = 4 * int(np.prod([max(size, 1) for size in dimensions.values()]))
+        self.variable.set_var_chunk_cache(max(cache_size, 2 * record), nelems, preemption)
+
+    def __getitem__(self, name):
+        return self.dataset[name]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, it: int, values, time=None, offset: int = 0,
+              component: int = None):
+        """Writes the values of the nodes offset:offset+len(values) at time
+        record it.
+
+        Args:
+            it: Index of the time record.
+            values: Array of shape (n,), (n, nLevels) or (n, nLevels,
+                nComponents).
+            time: Value of the time variable at it, if given.
+            offset: Index of the first node written.
+            component: If given, values are written to this component only.
+        """
+        values = np.asarray(values, dtype=np.float32)
+        nodes = slice(offset, offset + len(values))
+        shape = self.variable.shape[2:]
+        if component is None:
+            self.variable[it, nodes] = values.reshape((len(values), *shape))
+        else:
+            self.variable[it, nodes, ..., component] = values.reshape(
+                (len(values), *shape[:-1]))
+        if time is not None:
+            self.dataset['time'][it] = time
+
+    def close(self):
+        if self.dataset.isopen():
+            self.dataset.close()
+
+
+class ThNcWriter(TimeSeriesWriter):
+    """Writer of a ``*.th.nc`` boundary time history file.
+
+    Args:
+        path: Output file.
+        nOpenBndNodes: Total number of open boundary nodes.
+        nLevels: 1 for elev2D.th.nc, nvrt otherwise.
+        nComponents: 2 for uv3D.th.nc, 1 otherwise.
+        time_step: Time step of the records, in seconds.
+        zlib, complevel, shuffle: Compression of time_series.
+    """
+
+    def __init__(
+            self,
+            path: Union[str, os.PathLike],
+            nOpenBndNodes: int,
+            nLevels: int = 1,
+            nComponents: int = 1,
+            time_step: float = 86400.,
+            zlib: bool = False,
+            complevel: int = 4,
+            shuffle: bool = True,
+    ):
+        super().__init__(
+            path,
+            {'nOpenBndNodes': nOpenBndNodes,
+             'nLevels': nLevels, 'nComponents': nComponents},
+            'time_series', zlib, complevel, shuffle)
+        self.dataset.createDimension('one', 1)
+        self.dataset.createVariable('time_step', 'f4', ('one',))
+        self.dataset['time_step'][:] = time_step
+
+
+class NuNcWriter(TimeSeriesWriter):
+    """Writer of a ``*_nu.nc`` nudging file.
+
+    Args:
+        path: Output file.
+        include: 0-based indexes of the nudged nodes.
+        nLevels: Number of vertical levels.
+        zlib, complevel, shuffle: Compression of tracer_concentration.
+    """
+
+    def __init__(
+            self,
+            path: Union[str, os.PathLike],
+            include,
+            nLevels: int,
+            zlib: bool = False,
+            complevel: int = 4,
+            shuffle: bool = True,
+    ):
+        include = np.asarray(include)
+        super().__init__(
+            path,
+            {'node': len(include), 'nLevels': nLevels, 'one': 1},
+            'tracer_concentration', zlib, complevel, shuffle)
+        self.dataset.createVariable('map_to_global_node', 'i4', ('node',))
+        self.dataset['map_to_global_node'][:] = include + 1
@@ -1,75 +1,94 @@
 from abc import abstractmethod
 import logging
 from time import time
+import weakref
 
-
-from numba import prange, jit
 import numpy as np
+from scipy.spatial import cKDTree
 
+from pyschism.mesh.base import Elements, Nodes
 from pyschism.mesh.gridgr3 import Gr3Field
 
 
 logger = logging.getLogger(__name__)
 
 
+def get_nudge_zone(xy, connectivity, opbd, rlmax=1.5, rnu_day=0.25):
+    """Computes the nudging coefficients around the open boundary nodes.
+
+    The coefficient decreases linearly from 1/rnu_day (in 1/s) at the open
+    boundary nodes to zero at a distance rlmax from the nearest one. The
+    distances are found with a cKDTree over the boundary nodes, queried with
+    distance_upper_bound=rlmax for the nodes inside the boundary bounding
+    box grown by rlmax.
+
+    Returns:
+        The coefficient at every node, and the sorted indexes of the nodes
+        in the nudging zone, expanded to all the vertices of the elements
+        touching it.
+    """
+    rnu_max = 1.0 / rnu_day / 86400.0
+    rnu = np.zeros(len(xy))
+    opbd = np.asarray(opbd, dtype=np.int64)
+    if len(opbd) == 0:
+        return rnu, np.array([], dtype=np.int64)
+    xmin, ymin = xy[opbd].min(axis=0) - rlmax
+    xmax, ymax = xy[opbd].max(axis=0) + rlmax
+    candidates = np.flatnonzero(
+        (xy[:, 0] >= xmin) & (xy[:, 0] <= xmax)
+        & (xy[:, 1] >= ymin) & (xy[:, 1] <= ymax)
+    )
+    distance, _ = cKDTree(xy[opbd]).query(
+        xy[candidates], distance_upper_bound=rlmax, workers=-1)
+    inside = distance <= rlmax
+    rnu[candidates[inside]] = (1 - distance[inside] / rlmax) * rnu_max
+    # expand the nudging zone to the neighbors of the nudged nodes
+    nudged = np.append(rnu > 0, False)  # -1 padding maps onto False
+    elements = connectivity[np.any(nudged[connectivity], axis=1)]
+    nudged[elements[elements >= 0]] = True
+    return rnu, np.flatnonzero(nudged[:-1])
+
+
 class Nudge(Gr3Field):
+
+    # nudging zones already computed for a mesh, shared by TEM_Nudge and
+    # SAL_Nudge when both nudge the same boundaries
+    _zones = weakref.WeakKeyDictionary()
+
     def __init__(self, bctides, data_source, rlmax=1.5, rnu_day=0.25):
 
-        @jit(nopython=True, parallel=True)
-        def compute_nudge(lon, lat, opbd, out):
-
-            rnu_max = 1.0 / rnu_day / 86400.0
-
-            for idn in prange(lon.shape[0]):
-                if idn in opbd:
-                    rnu = rnu_max
-                    distmin = 0.0
-                else:
-                    distmin = np.finfo(np.float64).max
-                    for j in opbd:
-                        rl2 = np.sqrt(
-                            np.square(lon[idn] - lon[j]) + np.square(lat[idn] - lat[j])
-                        )
-                        if rl2 < distmin:
-                            distmin = rl2
-                rnu = 0.0
-                if distmin <= rlmax:
-                    rnu = (1 - distmin / rlmax) * rnu_max
-                out[idn] = rnu
-
-        out = np.zeros(bctides.hgrid.values.shape)
-        elnode = bctides.hgrid.elements.array
-        xy = bctides.hgrid.get_xy(crs="epsg:4326")
+        hgrid = bctides.hgrid
         opbd = []
         for boundary in bctides.gdf.itertuples():
             forcing = getattr(boundary, self.bctype)
             if forcing.nudge is True:
                 opbd.extend(list(boundary.indexes))
-        opbd = np.array(opbd)
-
-        if len(opbd) > 0:
-            logger.info(f"Begin compute_nudge for {self.name}.")
-            start = time()
-            compute_nudge(xy[:, 0], xy[:, 1], opbd, out)
-            
-            logger.info(f"Get the indexes for nudge.")
-            idxs_nudge = np.zeros(out.shape, dtype=int)
-            idxs = np.where(out > 0)[0]
-            idxs_nudge[idxs] = 1
-            idxs = np.where(np.max(out[elnode], axis=1) > 0)[0]
-            fp = elnode[idxs, -1] < 0
-            idxs_nudge[elnode[idxs[fp], :3]] = 1
-            idxs_nudge[elnode[idxs[~fp], :]] = 1
-            idxs = np.where(idxs_nudge == 1)[0]
-            include = idxs
-            logger.info(f'The shape of include is {len(include)}')
- 
-            logger.info(f"compute_nudge took {time()-start} seconds.")
+        opbd = np.array(opbd, dtype=np.int64)
+
+        logger.info(f"Begin compute_nudge for {self.name}.")
+        start = time()
+        zones = self._zones.setdefault(hgrid, {})
+        key = (opbd.tobytes(), rlmax, rnu_day)
+        if key not in zones:
+            zones[key] = get_nudge_zone(
+                hgrid.get_xy(crs="epsg:4326"),
+                hgrid.elements.connectivity,
+                opbd,
+                rlmax,
+                rnu_day,
+            )
+        out, self.include = zones[key]
+        logger.info(f'The shape of include is {len(self.include)}')
+        logger.info(f"compute_nudge took {time()-start} seconds.")
+
+        nodes = Nodes.from_arrays(
+            hgrid.coords, out.copy(), id=hgrid.nodes.to_arrays()["id"],
+            crs=hgrid.crs)
         super().__init__(
-            nodes={i: (coord, out[i]) for i, coord in enumerate(bctides.hgrid.coords)},
-            elements=bctides.hgrid.elements.elements,
+            nodes=nodes,
+            elements=Elements.from_array(nodes, **hgrid.elements.to_arrays()),
             description=f"{rlmax}, {rnu_day}",
-            crs=bctides.hgrid.crs,
+            crs=hgrid.crs,
         )
 
         self.data_source = data_source
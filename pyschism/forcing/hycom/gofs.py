@@ -1,21 +1,25 @@
 from abc import ABC, abstractmethod
+from contextlib import nullcontext
 from datetime import datetime, timedelta
 from functools import lru_cache
 import logging
+import os
 from typing import Dict, Union
 
 from matplotlib.transforms import Bbox
-import seawater as sw
 from netCDF4 import Dataset
 import numpy as np
 import requests
-from scipy.interpolate import griddata, RegularGridInterpolator, NearestNDInterpolator
 import tqdm
 import tqdm_logging_wrapper
 import xmltodict
 
 from pyschism import dates
 from pyschism.forcing.hycom.base import Hycom, HycomComponent
+from pyschism.forcing.hycom.interp import get_interpolator, get_triangulation_interpolator
+from pyschism.forcing.hycom.ptemp import potential_temperature
+from pyschism.forcing.hycom.tilecache import TileCache
+from pyschism.mesh.base import transform_ll_to_cpp
 
 logger = logging.getLogger(__name__)
 
@@ -29,8 +33,10 @@ class GofsDatasetCollection(ABC):
             self,
             start_date: datetime = None,
             end_date: Union[datetime, timedelta] = None,
-            output_interval: timedelta = None
+            output_interval: timedelta = None,
+            cache: TileCache = None,
     ):
+        self.cache = cache
         self.start_date = start_date
         self.end_date = self.maximum_end_date - self.sampling_interval if \
             end_date is None else end_date 
@@ -46,6 +52,12 @@ class GofsDatasetCollection(ABC):
     def datasets(self):
         '''Get the datasets based on the set start_date and end_date dates.'''
 
+    def open(self, url):
+        """Opens url through the tile cache, if any."""
+        if self.cache is None:
+            return Dataset(url)
+        return self.cache.dataset(url)
+
     @property
     def sampling_frequency(self):
         return 1./self.sampling_interval.total_seconds()
@@ -76,15 +88,15 @@ class GofsForecastDatasets(GofsDatasetCollection):
     @property
     def datasets(self):
         datasets = {}
+        opened = {}
         for required_date in self.required_datevector:
             for i, datevector in enumerate(self.datevectors):
                 if required_date in datevector:
                     opendap_url = self.base_url + self.xmlcatalog[
                         'catalog']['dataset']['dataset'][i]['@urlPath']
-                    datasets.setdefault(
-                        required_date,
-                        Dataset(opendap_url)
-                    )
+                    if opendap_url not in opened:
+                        opened[opendap_url] = self.open(opendap_url)
+                    datasets.setdefault(required_date, opened[opendap_url])
                     break
         return datasets
         
@@ -103,7 +115,23 @@ class GofsForecastDatasets(GofsDatasetCollection):
 
     @property
     def xmlcatalog(self):
-        return xmltodict.parse(requests.get(self.catalog_url).content)
+        """The FMRC runs catalog, fetched once. With a tile cache, the last
+        catalog fetched is kept there and used when the server cannot be
+        reached."""
+        if not hasattr(self, '_xmlcatalog'):
+            path = None if self.cache is None else self.cache.path / 'catalog.xml'
+            try:
+                content = requests.get(self.catalog_url).content
+            except requests.exceptions.ConnectionError:
+                if path is None or not path.is_file():
+                    raise
+                logger.info(f'Using the cached catalog {path}')
+                content = path.read_bytes()
+            else:
+                if path is not None:
+                    path.write_bytes(content)
+            self._xmlcatalog = xmltodict.parse(content)
+        return self._xmlcatalog
 
     @property
     def minimum_datetime(self):
@@ -151,6 +179,7 @@ class GofsHindcastDatasets(GofsDatasetCollection):
     @property
     def datasets(self):
         datasets = {}
+        opened = {}
         for required_date in self.required_datevector:
             database = get_database(required_date)
             print(f'Database for {required_date} is {database}')
@@ -167,10 +196,9 @@ class GofsHindcastDatasets(GofsDatasetCollection):
                 f'salinity[0:-1][0:-1][0:-1][0:-1],' + \
                 f'water_u[0:-1][0:-1][0:-1][0:-1],' + \
                 f'water_v[0:-1][0:-1][0:-1][0:-1]'
-            datasets.setdefault(
-                required_date,
-                Dataset(opendap_url)
-                    )
+            if opendap_url not in opened:
+                opened[opendap_url] = self.open(opendap_url)
+            datasets.setdefault(required_date, opened[opendap_url])
         return datasets
         #raise NotImplementedError('Need to return the datasets.')
 
@@ -185,14 +213,14 @@ class GofsHindcastDatasets(GofsDatasetCollection):
 
 class GofsDatasets:
 
-    def __init__(self, start_date, run_days, output_interval):
+    def __init__(self, start_date, run_days, output_interval, cache: TileCache = None):
         print(f'start_date is {start_date}')
         print(f'today is {datetime.now().strftime("%Y-%m-%d")}')
         self.start_date = start_date
         if start_date.strftime("%Y-%m-%d") < datetime.now().strftime("%Y-%m-%d"):
-            self.hindcast = GofsHindcastDatasets(start_date, run_days, output_interval)
+            self.hindcast = GofsHindcastDatasets(start_date, run_days, output_interval, cache)
         else:
-            self.forecast = GofsForecastDatasets(start_date, run_days, output_interval)
+            self.forecast = GofsForecastDatasets(start_date, run_days, output_interval, cache)
 
     @property
     def datasets(self):
@@ -204,8 +232,30 @@ class GofsDatasets:
         return datasets
 
 
+def _batches(records):
+    """Groups the consecutive (i, grid, values) records that have the same
+    grid, and yields (grid, indexes, values stacked along the last axis)."""
+    batch = []
+    for record in records:
+        if batch and not all(
+                np.array_equal(x, y) for x, y in zip(batch[0][1], record[1])):
+            yield _stack(batch)
+            batch = []
+        batch.append(record)
+    if batch:
+        yield _stack(batch)
+
+
+def _stack(batch):
+    return batch[0][1], [i for i, _, _ in batch], \
+        np.stack([np.ma.filled(values, np.nan) for _, _, values in batch], axis=-1)
+
+
 class GOFSComponent(HycomComponent):
 
+    def __init__(self, cache: TileCache = None):
+        self.cache = cache
+
     @lru_cache(maxsize=None)
     def get_datasets(
             self,
@@ -213,22 +263,123 @@ class GOFSComponent(HycomComponent):
             run_days: Union[float, timedelta],
             output_interval=timedelta(days=1)
     ) -> Dict[datetime, Dataset]:
-        return GofsDatasets(start_date, run_days, output_interval).datasets
-
-def transform_ll_to_cpp(lon, lat, lonc=-77.07, latc=24.0):
-    #lonc=(np.max(lon)+np.min(lon))/2.0
-    print(f'lonc is {lonc}')
-    #latc=(np.max(lat)+np.min(lat))/2.0
-    print(f'latc is {latc}')
-    longitude=lon/180*np.pi
-    latitude=lat/180*np.pi
-    radius=6378206.4
-    loncc=lonc/180*np.pi
-    latcc=latc/180*np.pi
-    lon_new=[radius*(longitude[i]-loncc)*np.cos(latcc) for i in np.arange(len(longitude))]
-    lat_new=[radius*latitude[i] for i in np.arange(len(latitude))]
-
-    return np.array(lon_new), np.array(lat_new)
+        return GofsDatasets(start_date, run_days, output_interval, self.cache).datasets
+
+    def _boundary_records(
+            self,
+            boundary,
+            start_date,
+            run_days,
+            output_interval,
+            pixel_buffer,
+            progress_bar
+    ):
+        """Yields (i, dataset, time_idx, lon_idxs, lat_idxs) of the records
+        covering boundary, for each output time i."""
+        items = list(enumerate(self.get_datasets(
+                start_date,
+                run_days,
+                output_interval
+            ).values()))
+        if progress_bar is True:
+            items = tqdm.tqdm(items)
+        with tqdm_logging_wrapper.wrap_logging_for_tqdm(items) \
+                if progress_bar is True else nullcontext():
+            for i, dataset in items:
+                time_idx = self._record_time_idx(
+                    dataset, i, start_date, output_interval)
+                lon_idxs, lat_idxs = self._boundary_window(
+                    dataset, boundary, pixel_buffer)
+                yield i, dataset, time_idx, lon_idxs, lat_idxs
+
+    def _record_time_idx(self, dataset, i, start_date, output_interval):
+        """Returns the index in dataset of the record of output time i."""
+        if start_date.strftime("%Y-%m-%d") < datetime.now().strftime("%Y-%m-%d"):
+            ds_base_date = datetime.strptime(
+                ''.join(dataset['time'].units.split()[2:]),
+                '%Y-%m-%d%H:%M:%S')
+        else:
+            ds_base_date = datetime.strptime(
+                ''.join(dataset['time'].units.split()[2:-1]),
+                '%Y-%m-%d%H:%M:%S.%f')
+        ds_timevector = [ds_base_date + timedelta(hours=x)
+                         for x in dataset['time'][:]]
+        requested_date = dates.nearest_cycle(
+            start_date + i*output_interval,
+            period=3).replace(tzinfo=None)
+        time_idx = ds_timevector.index(requested_date)
+        logger.info(
+            f'Saving GOFS {self.ncvar} data for date: '
+            f'{start_date+i*output_interval} '
+            f'approximated as {ds_timevector[time_idx]}'
+            )
+        return time_idx
+
+    def _boundary_window(self, dataset, boundary, pixel_buffer):
+        """Returns the lon and lat indexes of the cells of dataset covering
+        boundary."""
+        bounds = boundary.geometry.bounds
+        dx = (dataset['lon'][-1] - dataset['lon'][0]) / len(dataset['lon'])
+        dy = (dataset['lat'][-1] - dataset['lat'][0]) / len(dataset['lat'])
+        bounds = (
+            bounds[0] - 2*dx,
+            bounds[1] - 2*dy,
+            bounds[2] + 2*dx,
+            bounds[3] + 2*dy,
+            )
+        bbox = self._modified_bbox(
+            dataset, Bbox.from_extents(*bounds))
+        return self._modified_bbox_indexes(
+                bbox,
+                dataset,
+                pixel_buffer
+            )
+
+    def _boundary_grid(self, dataset, lon_idxs, lat_idxs):
+        """Returns the (depth, y, x) axes of a record, in the CPP projection."""
+        loni = np.array(dataset['lon'][lon_idxs])
+        loni[loni > 180] -= 360.
+        lati = dataset['lat'][lat_idxs]
+        xi, yi = transform_ll_to_cpp(loni, lati)
+        return np.asarray(dataset['depth'][:]), yi, xi
+
+    def _boundary_points(self, hgrid, vgrid, boundary):
+        """Returns the boundary zcor and its (z, y, x) points, in the CPP
+        projection."""
+        if vgrid.ivcor == 1:
+            bz = (hgrid.values[:, None]*vgrid.sigma)[boundary.indexes, :]
+            idxs = np.where(bz > 5000.0)
+            bz[idxs] = 5000.0 - 1.0e-6
+        else:
+            raise NotImplementedError('vgrid.ivcor!=1')
+
+        xy = hgrid.get_xy(crs='epsg:4326')
+        lonb = xy[boundary.indexes, 0]
+        latb = xy[boundary.indexes, 1]
+        xb, yb = transform_ll_to_cpp(lonb, latb)
+        bx = np.tile(xb, [bz.shape[1],1]).T
+        by = np.tile(yb, [bz.shape[1],1]).T
+        bzyx = np.c_[bz.reshape(np.size(bz)), by.reshape(np.size(by)), bx.reshape(np.size(bx))]
+        return bz, bzyx
+
+    def _interpolate_3d(self, bz, bzyx, records):
+        """Yields (i, values of shape bz.shape) of the (i, grid, values)
+        records interpolated onto bzyx, all the records on the same grid at
+        once."""
+        for grid, indexes, values in _batches(records):
+            interp = get_interpolator(grid, bzyx)(values).reshape(len(bzyx), -1)
+            if np.any(np.isnan(interp)):
+                raise ValueError(f'No boundary {self.ncvar} data for GOFS. '
+                                 'Try increasing pixel_buffer argument.')
+            for column, i in enumerate(indexes):
+                yield i, interp[:, column].reshape(bz.shape)
+
+    def _put_boundary_3d(self, dst, offset, bz, bzyx, records, component=None):
+        """Interpolates the (i, grid, values) records onto bzyx and writes
+        them to dst."""
+        for i, values in self._interpolate_3d(bz, bzyx, records):
+            dst.write(i, values, offset=offset, component=component)
+
 
 class GOFSElevation(GOFSComponent):
 
@@ -248,100 +399,33 @@ class GOFSElevation(GOFSComponent):
             pixel_buffer=10,
             progress_bar=True
     ):
-        for i, (time, dataset) in enumerate(
-            self.get_datasets(
-                start_date,
-                run_days,
-                output_interval
-            ).items()
-        ):
-            if start_date.strftime("%Y-%m-%d") < datetime.now().strftime("%Y-%m-%d"):
-                ds_base_date = datetime.strptime(
-                    ''.join(dataset['time'].units.split()[2:]), 
-                    '%Y-%m-%d%H:%M:%S')
-                #time1 = dataset['time']
-                #ds_timevector = nc4.num2date(
-                #    time1,
-                #    units=time1.units,
-                #    only_use_cftime_datetimes=False) 
-            else:
-                ds_base_date = datetime.strptime(
-                    ''.join(dataset['time'].units.split()[2:-1]),
-                    '%Y-%m-%d%H:%M:%S.%f')
-            ds_timevector = [ds_base_date + timedelta(hours=x)
-                         for x in dataset['time'][:]]
-            requested_date = dates.nearest_cycle(
-                start_date + i*output_interval,
-                period=3).replace(tzinfo=None)
-            time_idx = ds_timevector.index(requested_date)
-            logger.info(
-                'Saving GOFS elev data for date: '
-                f'{start_date+i*output_interval} '
-                f'approximated as {ds_timevector[time_idx]} for '
-                f'boundary id={boundary.id}'
-                )
-            bounds = boundary.geometry.bounds
-            dx = (dataset['lon'][-1] - dataset['lon'][0]) / len(dataset['lon'])
-            dy = (dataset['lat'][-1] - dataset['lat'][0]) / len(dataset['lat'])
-            bounds = (
-                bounds[0] - 2*dx,
-                bounds[1] - 2*dy,
-                bounds[2] + 2*dx,
-                bounds[3] + 2*dy,
-                )
-            bbox = self._modified_bbox(
-                dataset, Bbox.from_extents(*bounds))
-            lon_idxs, lat_idxs = self._modified_bbox_indexes(
-                    bbox,
-                    dataset,
-                    pixel_buffer
-                )
-            #zi = np.full((len(lat_idxs), len(lon_idxs)), np.nan)
-            if progress_bar is True:
-                items_iter = tqdm.tqdm(lat_idxs)
-                with tqdm_logging_wrapper.wrap_logging_for_tqdm(
-                        items_iter), items_iter:
-                    #for k, lat_idx in enumerate(items_iter):
-                    #    zi[k, :] = dataset[self.ncvar][
-                    #                        time_idx, lat_idx, lon_idxs]
-                    zi = dataset[self.ncvar][time_idx, lat_idxs, lon_idxs]
-            else:
-                #for k, lat_idx in enumerate(lat_idxs):
-                #    zi[k, :] = dataset[self.ncvar][
-                #                        time_idx, lat_idx, lon_idxs]
-                zi = dataset[self.ncvar][time_idx, lat_idxs, lon_idxs]
-            idxs = np.where(abs(zi) > 10000)
-            zi[idxs] = float('nan')
-
-            xi = dataset['lon'][lon_idxs]
-            for idx in range(len(xi)):
-                if xi[idx] > 180:
-                    xi[idx] = xi[idx]-360.
-            yi = dataset['lat'][lat_idxs]
-            xi, yi = np.meshgrid(xi, yi)
-            xi = xi.flatten()
-            yi = yi.flatten()
-            zi = zi.flatten()
-            xyq = np.array(boundary.geometry.coords)
-            zq = griddata(
-                (xi, yi),
-                zi,
-                (xyq[:, 0], xyq[:, 1]),
-                method='linear',
-                fill_value=np.nan,
-            )
-            nan_idxs = np.where(np.isnan(zq))
-            q_non_nan = np.where(~np.isnan(zi))
-            zq[nan_idxs] = griddata(
-                (xi[q_non_nan], yi[q_non_nan]),
-                zi[q_non_nan],
-                (xyq[nan_idxs, 0], xyq[nan_idxs, 1]),
-                method='nearest',
-            )
+        records = []
+        for i, dataset, time_idx, lon_idxs, lat_idxs in self._boundary_records(
+                boundary, start_date, run_days, output_interval, pixel_buffer,
+                progress_bar):
+            zi = dataset[self.ncvar][time_idx, lat_idxs, lon_idxs]
+            records.append((i, self._boundary_sources(dataset, lon_idxs, lat_idxs), zi))
+        for i, values in self._interpolate_2d(boundary, records):
+            dst.write(i, values, offset=offset)
+
+    def _boundary_sources(self, dataset, lon_idxs, lat_idxs):
+        """Returns the (lon, lat) of the cells of a record, as a 1-tuple."""
+        xi = np.array(dataset['lon'][lon_idxs])
+        xi[xi > 180] -= 360.
+        yi = dataset['lat'][lat_idxs]
+        xi, yi = np.meshgrid(xi, yi)
+        return (np.c_[xi.flatten(), yi.flatten()],)
+
+    def _interpolate_2d(self, boundary, records):
+        """Yields (i, values) of the (i, sources, values) records interpolated
+        onto the boundary nodes, all the records on the same sources at once."""
+        xyq = np.array(boundary.geometry.coords)
+        for (sources,), indexes, values in _batches(records):
+            zq = get_triangulation_interpolator(sources, xyq)(values).reshape(len(xyq), -1)
             if np.any(np.isnan(zq)):
                 raise ValueError('Boundary contains NaNs.')
-            print(f'the shape of zq is {len(zq)}, max zq is {np.max(zq)}, min zq is {np.min(zq)}')
-            dst['time_series'][i, offset:offset+len(zq)] = zq
+            for column, i in enumerate(indexes):
+                yield i, zq[:, column]
 
 
 class GOFSVelocity(GOFSComponent):
@@ -364,165 +448,17 @@ class GOFSVelocity(GOFSComponent):
             pixel_buffer=10,
             progress_bar=True
     ):
-
-        for i, (time, dataset) in enumerate(
-            self.get_datasets(
-                start_date,
-                run_days,
-                output_interval
-            ).items()
-        ):
-            if start_date.strftime("%Y-%m-%d") < datetime.now().strftime("%Y-%m-%d"):
-                ds_base_date = datetime.strptime(
-                    ''.join(dataset['time'].units.split()[2:]),
-                    '%Y-%m-%d%H:%M:%S')
-                #time1 = dataset['time']
-                #ds_timevector = nc4.num2date(
-                #    time1,
-                #    units=time1.units,
-                #    only_use_cftime_datetimes=False) 
-            else:
-                ds_base_date = datetime.strptime(
-                    ''.join(dataset['time'].units.split()[2:-1]),
-                    '%Y-%m-%d%H:%M:%S.%f')
-            ds_timevector = [ds_base_date + timedelta(hours=x)
-                             for x in dataset['time'][:]]
-            requested_date = dates.nearest_cycle(
-                start_date + i*output_interval,
-                period=3).replace(tzinfo=None)
-            time_idx = ds_timevector.index(requested_date)
-            logger.info(
-                'Saving GOFS water_uv data for date: '
-                f'{start_date+i*output_interval} '
-                f'approximated as {ds_timevector[time_idx]} for '
-                f'boundary id={boundary.id}'
-                )
-            bounds = boundary.geometry.bounds
-            dx = (dataset['lon'][-1] - dataset['lon'][0]) / len(dataset['lon'])
-            dy = (dataset['lat'][-1] - dataset['lat'][0]) / len(dataset['lat'])
-            bounds = (
-                bounds[0] - 2*dx,
-                bounds[1] - 2*dy,
-                bounds[2] + 2*dx,
-                bounds[3] + 2*dy,
-                )
-            bbox = self._modified_bbox(
-                dataset, Bbox.from_extents(*bounds))
-            lon_idxs, lat_idxs = self._modified_bbox_indexes(
-                    bbox,
-                    dataset,
-                    pixel_buffer
-                )
-            uvar, vvar = self.ncvar
-            # z_ui_idxs = list(range(dataset['depth'].shape[0]))
-            z_idxs = list(range(dataset['depth'].shape[0]))  # TODO: subset?
-            #ui = np.full((len(z_idxs), len(lat_idxs), len(lon_idxs)), np.nan)
-            #vi = np.full((len(z_idxs), len(lat_idxs), len(lon_idxs)), np.nan)
-            if progress_bar is True:
-                items_iter = tqdm.tqdm(lat_idxs)
-                with tqdm_logging_wrapper.wrap_logging_for_tqdm(
-                        items_iter), items_iter:
-                    #for k, lat_idx in enumerate(items_iter):
-                    #    ui[:, k, :] = dataset[uvar][time_idx, z_idxs, lat_idx, lon_idxs]
-                    #    vi[:, k, :] = dataset[vvar][time_idx, z_idxs, lat_idx, lon_idxs]
-                    ui = dataset[uvar][time_idx, :, lat_idxs, lon_idxs]
-                    vi = dataset[vvar][time_idx, :, lat_idxs, lon_idxs]
-            else:
-                #for k, lat_idx in enumerate(lat_idxs):
-                #    ui[:, k, :] = dataset[uvar][time_idx, z_idxs, lat_idx, lon_idxs]
-                #    vi[:, k, :] = dataset[vvar][time_idx, z_idxs, lat_idx, lon_idxs]
-                ui = dataset[uvar][time_idx, :, lat_idxs, lon_idxs]
-                vi = dataset[vvar][time_idx, :, lat_idxs, lon_idxs]
-            #change missing value to nan
-            idxs = np.where(abs(ui) > 10000)
-            ui[idxs] = float('nan')
-            idxs = np.where(abs(vi) > 10000)
-            vi[idxs] = float('nan')
-
-            loni = dataset['lon'][lon_idxs]
-            for idx in range(len(loni)):
-                if loni[idx] > 180:
-                    loni[idx] = loni[idx]-360.
-            lati = dataset['lat'][lat_idxs]
-            xi, yi = transform_ll_to_cpp(loni, lati)
-
-            if vgrid.ivcor == 1:
-                bz = (hgrid.values[:, None]*vgrid.sigma)[boundary.indexes, :]
-                idxs = np.where(bz > 5000.0)
-                bz[idxs] = 5000.0 - 1.0e-6 
-            else:
-                raise NotImplementedError('vgrid.ivcor!=1')
-
-            xy = hgrid.get_xy(crs='epsg:4326')
-            lonb = xy[boundary.indexes, 0]
-            latb = xy[boundary.indexes, 1]
-            xb, yb = transform_ll_to_cpp(lonb, latb)
-            bx = np.tile(xb, [bz.shape[1],1]).T
-            by = np.tile(yb, [bz.shape[1],1]).T
-            bzyx = np.c_[bz.reshape(np.size(bz)), by.reshape(np.size(by)), bx.reshape(np.size(bx))]
-            zi = dataset['depth'][z_idxs]
-
-            # First try with RegularGridInterpolator
-            ui_fd = RegularGridInterpolator(
-                (zi, yi, xi),
-                ui,
-                method='linear',
-                bounds_error=False,
-                fill_value=np.nan
-            )
-            u_interp = ui_fd(bzyx)
-
-            # the boundary and the data don't intersect
-            if np.all(np.isnan(u_interp)):
-                ui_idxs = np.where(~np.isnan(ui))
-                xyzi = np.vstack([
-                    np.tile(xi, ui.shape)[ui_idxs].flatten(),
-                    np.tile(yi, ui.shape)[ui_idxs].flatten(),
-                    np.tile(zi, ui.shape)[ui_idxs].flatten()
-                ]).T
-                ui_fd = NearestNDInterpolator(xyzi, ui[ui_idxs].flatten())
-                u_interp = ui_fd(np.vstack([bx, by, -bz.flatten()]).T)
-            # the boundary and the data partially intersect
-            elif np.any(np.isnan(u_interp)):
-                ui_idxs = np.where(~np.isnan(u_interp))
-                ui_fd = NearestNDInterpolator(bzyx[ui_idxs], u_interp[ui_idxs])
-                ui_idxs = np.where(np.isnan(u_interp))
-                u_interp[ui_idxs] = ui_fd(bzyx[ui_idxs])
-
-            if np.any(np.isnan(u_interp)):
-                raise ValueError('No boundary  u velocity data for GOFS. '
-                                 'Try increasing pixel_buffer argument.')
-
-            vi_fd = RegularGridInterpolator(
-                (zi, yi, xi),
-                vi,
-                method='linear',
-                bounds_error=False,
-                fill_value=np.nan
-            )
-
-            v_interp = vi_fd(bzyx)
-
-            if np.all(np.isnan(v_interp)):
-                vi_idxs = np.where(~np.isnan(vi))
-                xi = np.tile(xi, vi.shape)[vi_idxs].flatten()
-                yi = np.tile(yi, vi.shape)[vi_idxs].flatten()
-                zi = np.tile(zi, vi.shape)[vi_idxs].flatten()
-                xyzi = np.vstack([xi, yi, zi]).T
-                vi_fd = NearestNDInterpolator(xyzi, vi[ui_idxs].flatten())
-                v_interp = ui_fd(np.vstack([bx, by, -bz.flatten()]).T)
-
-            elif np.any(np.isnan(v_interp)):
-                vi_idxs = np.where(~np.isnan(v_interp))
-                vi_fd = NearestNDInterpolator(bzyx[vi_idxs], v_interp[vi_idxs])
-                vi_idxs = np.where(np.isnan(v_interp))
-                v_interp[vi_idxs] = vi_fd(bzyx[vi_idxs])
-
-            if np.any(np.isnan(v_interp)):
-                raise ValueError('No boundary data for GOFS. Try increasing pixel_buffer argument.')
-
-            dst['time_series'][i, offset:offset+bz.shape[0], :, 0] = u_interp.reshape(bz.shape)
-            dst['time_series'][i, offset:offset+bz.shape[0], :, 1] = v_interp.reshape(bz.shape)
+        bz, bzyx = self._boundary_points(hgrid, vgrid, boundary)
+        uvar, vvar = self.ncvar
+        urecords, vrecords = [], []
+        for i, dataset, time_idx, lon_idxs, lat_idxs in self._boundary_records(
+                boundary, start_date, run_days, output_interval, pixel_buffer,
+                progress_bar):
+            grid = self._boundary_grid(dataset, lon_idxs, lat_idxs)
+            urecords.append((i, grid, dataset[uvar][time_idx, :, lat_idxs, lon_idxs]))
+            vrecords.append((i, grid, dataset[vvar][time_idx, :, lat_idxs, lon_idxs]))
+        self._put_boundary_3d(dst, offset, bz, bzyx, urecords, component=0)
+        self._put_boundary_3d(dst, offset, bz, bzyx, vrecords, component=1)
 
 
 class GOFSTemperature(GOFSComponent):
@@ -545,145 +481,19 @@ class GOFSTemperature(GOFSComponent):
             pixel_buffer=10,
             progress_bar=True
     ):
-
-        for i, (time, dataset) in enumerate(
-            self.get_datasets(
-                start_date,
-                run_days,
-                output_interval
-            ).items()
-        ):
-            if start_date.strftime("%Y-%m-%d") < datetime.now().strftime("%Y-%m-%d"):
-                ds_base_date = datetime.strptime(
-                    ''.join(dataset['time'].units.split()[2:]),
-                    '%Y-%m-%d%H:%M:%S')
-                #time1 = dataset['time']
-                #ds_timevector = nc4.num2date(
-                #    time1,
-                #    units=time1.units,
-                #    only_use_cftime_datetimes=False) 
-            else:
-                ds_base_date = datetime.strptime(
-                    ''.join(dataset['time'].units.split()[2:-1]),
-                    '%Y-%m-%d%H:%M:%S.%f')
-            ds_timevector = [ds_base_date + timedelta(hours=x)
-                             for x in dataset['time'][:]]
-            requested_date = dates.nearest_cycle(
-                start_date + i*output_interval,
-                period=3).replace(tzinfo=None)
-            time_idx = ds_timevector.index(requested_date)
-            logger.info(
-                'Saving GOFS temp data for date: '
-                f'{start_date+i*output_interval} '
-                f'approximated as {ds_timevector[time_idx]} for '
-                f'boundary id={boundary.id}'
-                )
-            bounds = boundary.geometry.bounds
-            dx = (dataset['lon'][-1] - dataset['lon'][0]) / len(dataset['lon'])
-            dy = (dataset['lat'][-1] - dataset['lat'][0]) / len(dataset['lat'])
-            bounds = (
-                bounds[0] - 2*dx,
-                bounds[1] - 2*dy,
-                bounds[2] + 2*dx,
-                bounds[3] + 2*dy,
-                )
-            bbox = self._modified_bbox(
-                dataset, Bbox.from_extents(*bounds))
-            lon_idxs, lat_idxs = self._modified_bbox_indexes(
-                    bbox,
-                    dataset,
-                    pixel_buffer
-                )
-            # z_ui_idxs = list(range(dataset['depth'].shape[0]))
-            z_idxs = list(range(dataset['depth'].shape[0]))  # TODO: subset?
-            #temp = np.full((len(z_idxs), len(lat_idxs), len(lon_idxs)), np.nan)
-            if progress_bar is True:
-                items_iter = tqdm.tqdm(lat_idxs)
-                with tqdm_logging_wrapper.wrap_logging_for_tqdm(
-                        items_iter), items_iter:
-                    #for k, lat_idx in enumerate(items_iter):
-                    #    temp[:, k, :] = dataset[self.ncvar][time_idx, z_idxs, lat_idx, lon_idxs]
-                    temp = dataset[self.ncvar][time_idx, :, lat_idxs, lon_idxs]
-                    salt = dataset['salinity'][time_idx, :, lat_idxs, lon_idxs]
-            else:
-                #for k, lat_idx in enumerate(lat_idxs):
-                #    temp[:, k, :] = dataset[self.ncvar][time_idx, z_idxs, lat_idx, lon_idxs]
-                temp = np.squeeze(dataset[self.ncvar][time_idx, :, lat_idxs, lon_idxs])
-                salt = np.squeeze(dataset['salinity'][time_idx, :, lat_idxs, lon_idxs])
-
-            #convert in-situ temperature to potential temperature
-            print(f'The shape of temp is {temp.shape}')
-            nz = temp.shape[0]
-            ny = temp.shape[1]
-            nx = temp.shape[2]
-            dep = dataset['depth'][:]
-            pr=np.ones(temp.shape)
-            pre = pr*dep[:,None, None]
-            Pr = np.zeros(temp.shape)
-            ptemp = sw.ptmp(salt, temp, pre, Pr)*1.00024
-
-            #change missing value to nan
-            idxs = np.where(abs(ptemp) > 10000)
-            ptemp[idxs] = float('nan')
-
-            loni = dataset['lon'][lon_idxs]
-            for idx in range(len(loni)):
-                if loni[idx] > 180:
-                    loni[idx] = loni[idx]-360.
-            lati = dataset['lat'][lat_idxs]
-            xi, yi = transform_ll_to_cpp(loni, lati)
-
-            if vgrid.ivcor == 1:
-                bz = (hgrid.values[:, None]*vgrid.sigma)[boundary.indexes, :]
-                idxs = np.where(bz > 5000.0)
-                bz[idxs] = 5000.0 - 1.0e-6
-                print(f'zcor at 200 is {bz[200,:]}')
-            else:
-                raise NotImplementedError('vgrid.ivcor!=1')
-
-            xy = hgrid.get_xy(crs='epsg:4326')
-            lonb = xy[boundary.indexes, 0]
-            latb = xy[boundary.indexes, 1]
-            xb, yb = transform_ll_to_cpp(lonb, latb)
-            #bx = np.tile(xy[boundary.indexes, 0], [bz.shape[1],1])
-            #by = np.tile(xy[boundary.indexes, 1], [bz.shape[1],1])
-            #bzyx = np.vstack([bz.flatten(), by, bx]).T
-            bx = np.tile(xb, [bz.shape[1],1]).T
-            by = np.tile(yb, [bz.shape[1],1]).T
-            bzyx = np.c_[bz.reshape(np.size(bz)), by.reshape(np.size(by)), bx.reshape(np.size(bx))]
-            zi = dataset['depth'][z_idxs]
-
-            # First try with RegularGridInterpolator
-            ptemp_fd = RegularGridInterpolator(
-                (zi, yi, xi),
-                ptemp,
-                method='linear',
-                bounds_error=False,
-                fill_value=np.nan
-            )
-            ptemp_interp = ptemp_fd(bzyx)
-
-            # the boundary and the data don't intersect
-            if np.all(np.isnan(ptemp_interp)):
-                ptemp_idxs = np.where(~np.isnan(ptemp))
-                xyzi = np.vstack([
-                    np.tile(xi, ptemp.shape)[ptemp_idxs].flatten(),
-                    np.tile(yi, ptemp.shape)[ptemp_idxs].flatten(),
-                    np.tile(zi, ptemp.shape)[ptemp_idxs].flatten()
-                ]).T
-                ptemp_fd = NearestNDInterpolator(xyzi, ptemp[ptemp_idxs].flatten())
-                ptemp_interp = ptemp_fd(np.vstack([bx, by, -bz.flatten()]).T)
-            # the boundary and the data partially intersect
-            elif np.any(np.isnan(ptemp_interp)):
-                ptemp_idxs = np.where(~np.isnan(ptemp_interp))
-                ptemp_fd = NearestNDInterpolator(bzyx[ptemp_idxs], ptemp_interp[ptemp_idxs])
-                ptemp_idxs = np.where(np.isnan(ptemp_interp))
-                ptemp_interp[ptemp_idxs] = ptemp_fd(bzyx[ptemp_idxs])
-
-            if np.any(np.isnan(ptemp_interp)):
-                raise ValueError('No boundary  temperature data for GOFS. '
-                                 'Try increasing pixel_buffer argument.')
-            dst['time_series'][i, offset:offset+bz.shape[0], :, :] = ptemp_interp.reshape(bz.shape)
+        bz, bzyx = self._boundary_points(hgrid, vgrid, boundary)
+        records = []
+        for i, dataset, time_idx, lon_idxs, lat_idxs in self._boundary_records(
+                boundary, start_date, run_days, output_interval, pixel_buffer,
+                progress_bar):
+            grid = self._boundary_grid(dataset, lon_idxs, lat_idxs)
+            temp = dataset[self.ncvar][time_idx, :, lat_idxs, lon_idxs]
+            salt = dataset['salinity'][time_idx, :, lat_idxs, lon_idxs]
+            #convert in-situ temperature to potential temperature, only in
+            #the cells used by the boundary
+            cells = get_interpolator(grid, bzyx).cells
+            records.append((i, grid, potential_temperature(salt, temp, grid[0], cells)))
+        self._put_boundary_3d(dst, offset, bz, bzyx, records)
 
 
 class GOFSSalinity(GOFSComponent):
@@ -706,142 +516,35 @@ class GOFSSalinity(GOFSComponent):
             pixel_buffer=10,
             progress_bar=True
     ):
-
-        for i, (time, dataset) in enumerate(
-            self.get_datasets(
-                start_date,
-                run_days,
-                output_interval
-            ).items()
-        ):
-            if start_date.strftime("%Y-%m-%d") < datetime.now().strftime("%Y-%m-%d"):
-                ds_base_date = datetime.strptime(
-                    ''.join(dataset['time'].units.split()[2:]),
-                    '%Y-%m-%d%H:%M:%S')
-                #time1 = dataset['time']
-                #ds_timevector = nc4.num2date(
-                #    time1,
-                #    units=time1.units,
-                #    only_use_cftime_datetimes=False) 
-            else:
-                ds_base_date = datetime.strptime(
-                    ''.join(dataset['time'].units.split()[2:-1]),
-                    '%Y-%m-%d%H:%M:%S.%f')
-            ds_timevector = [ds_base_date + timedelta(hours=x)
-                             for x in dataset['time'][:]]
-            requested_date = dates.nearest_cycle(
-                start_date + i*output_interval,
-                period=3).replace(tzinfo=None)
-            time_idx = ds_timevector.index(requested_date)
-            print(f'time_idx for {requested_date} is {time_idx}')
-            logger.info(
-                'Saving GOFS salinity data for date: '
-                f'{start_date+i*output_interval} '
-                f'approximated as {ds_timevector[time_idx]} for '
-                f'boundary id={boundary.id}'
-                )
-            bounds = boundary.geometry.bounds
-            dx = (dataset['lon'][-1] - dataset['lon'][0]) / len(dataset['lon'])
-            dy = (dataset['lat'][-1] - dataset['lat'][0]) / len(dataset['lat'])
-            bounds = (
-                bounds[0] - 2*dx,
-                bounds[1] - 2*dy,
-                bounds[2] + 2*dx,
-                bounds[3] + 2*dy,
-                )
-            bbox = self._modified_bbox(
-                dataset, Bbox.from_extents(*bounds))
-            lon_idxs, lat_idxs = self._modified_bbox_indexes(
-                    bbox,
-                    dataset,
-                    pixel_buffer
-                )
-            print(f'lon_idxs is {lon_idxs}')
-            print(f'lat_idxs is {lat_idxs}')
-
-            # z_ui_idxs = list(range(dataset['depth'].shape[0]))
-            z_idxs = list(range(dataset['depth'].shape[0]))  # TODO: subset?
-            #salt = np.full((len(z_idxs), len(lat_idxs), len(lon_idxs)), np.nan)
-            if progress_bar is True:
-                items_iter = tqdm.tqdm(lat_idxs)
-                with tqdm_logging_wrapper.wrap_logging_for_tqdm(
-                        items_iter), items_iter:
-                    #for k, lat_idx in enumerate(items_iter):
-                    #    salt[:, k, :] = dataset[self.ncvar][time_idx, z_idxs, lat_idx, lon_idxs]
-                    salt = dataset[self.ncvar][time_idx, :, lat_idxs, lon_idxs]
-            else:
-                #for k, lat_idx in enumerate(lat_idxs):
-                #    salt[:, k, :] = dataset[self.ncvar][time_idx, z_idxs, lat_idx, lon_idxs]
-                salt = dataset[self.ncvar][time_idx, :, lat_idxs, lon_idxs]
-            #change missing value to nan
-            idxs = np.where(abs(salt) > 10000)
-            salt[idxs] = float('nan')
-
-            loni = dataset['lon'][lon_idxs]
-            for idx in range(len(loni)):
-                if loni[idx] > 180:
-                    loni[idx] = loni[idx]-360.
-            lati = dataset['lat'][lat_idxs]
-            xi, yi = transform_ll_to_cpp(loni, lati)
-
-            if vgrid.ivcor == 1:
-                bz = (hgrid.values[:, None]*vgrid.sigma)[boundary.indexes, :]
-                print(f'zcor is {bz[200,:]}')
-                idxs = np.where(bz > 5000.0)
-                bz[idxs] = 5000.0 - 1.0e-6
-            else:
-                raise NotImplementedError('vgrid.ivcor!=1')
-
-            xy = hgrid.get_xy(crs='epsg:4326')
-            lonb = xy[boundary.indexes, 0]
-            latb = xy[boundary.indexes, 1]
-            xb, yb = transform_ll_to_cpp(lonb, latb)
-            bx = np.tile(xb, [bz.shape[1],1]).T
-            by = np.tile(yb, [bz.shape[1],1]).T
-            bzyx = np.c_[bz.reshape(np.size(bz)), by.reshape(np.size(by)), bx.reshape(np.size(bx))]
-            zi = dataset['depth'][z_idxs]
-
-            # First try with RegularGridInterpolator
-            salt_fd = RegularGridInterpolator(
-                (zi, yi, xi),
-                salt,
-                method='linear',
-                bounds_error=False,
-                fill_value=np.nan
-            )
-            salt_interp = salt_fd(bzyx)
-
-            # the boundary and the data don't intersect
-            if np.all(np.isnan(salt_interp)):
-                salt_idxs = np.where(~np.isnan(salt))
-                xyzi = np.vstack([
-                    np.tile(xi, salt.shape)[salt_idxs].flatten(),
-                    np.tile(yi, salt.shape)[salt_idxs].flatten(),
-                    np.tile(zi, salt.shape)[salt_idxs].flatten()
-                ]).T
-                salt_fd = NearestNDInterpolator(xyzi, salt[salt_idxs].flatten())
-                salt_interp = salt_fd(np.vstack([bx, by, -bz.flatten()]).T)
-            # the boundary and the data partially intersect
-            elif np.any(np.isnan(salt_interp)):
-                salt_idxs = np.where(~np.isnan(salt_interp))
-                salt_fd = NearestNDInterpolator(bzyx[salt_idxs], salt_interp[salt_idxs])
-                salt_idxs = np.where(np.isnan(salt_interp))
-                salt_interp[salt_idxs] = salt_fd(bzyx[salt_idxs])
-
-            if np.any(np.isnan(salt_interp)):
-                raise ValueError('No boundary  salt data for GOFS. '
-                                 'Try increasing pixel_buffer argument.')
-            dst['time_series'][i, offset:offset + bz.shape[0], :, :] = salt_interp.reshape(bz.shape)
+        bz, bzyx = self._boundary_points(hgrid, vgrid, boundary)
+        records = []
+        for i, dataset, time_idx, lon_idxs, lat_idxs in self._boundary_records(
+                boundary, start_date, run_days, output_interval, pixel_buffer,
+                progress_bar):
+            grid = self._boundary_grid(dataset, lon_idxs, lat_idxs)
+            records.append((i, grid, dataset[self.ncvar][time_idx, :, lat_idxs, lon_idxs]))
+        self._put_boundary_3d(dst, offset, bz, bzyx, records)
 
 
 class GOFS(Hycom):
-    '''Public interface for GOFS model forcings.'''
-
-    def __init__(self):
-        self._elevation = GOFSElevation()
-        self._velocity = GOFSVelocity()
-        self._temperature = GOFSTemperature()
-        self._salinity = GOFSSalinity()
+    '''Public interface for GOFS model forcings.
+
+    Args:
+        cache: Directory of the GOFS tile cache shared by the components.
+            True uses the user cache directory and False or None reads
+            OPeNDAP directly.
+        cache_size: Maximum size of the tile cache in bytes.
+    '''
+
+    def __init__(self, cache: Union[str, os.PathLike, bool, None] = True, cache_size: int = 5 * 2**30):
+        if cache is None or cache is False:
+            self.cache = None
+        else:
+            self.cache = TileCache(cache, cache_size)
+        self._elevation = GOFSElevation(self.cache)
+        self._velocity = GOFSVelocity(self.cache)
+        self._temperature = GOFSTemperature(self.cache)
+        self._salinity = GOFSSalinity(self.cache)
 
     @property
     def elevation(self) -> GOFSElevation:
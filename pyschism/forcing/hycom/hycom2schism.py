@@ -1,3 +1,9 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack, closing
+from functools import lru_cache
+import hashlib
+import itertools
 import os
 import sys
 from datetime import datetime,timedelta
@@ -9,16 +15,19 @@ import shutil
 from typing import Union
 from time import time
 
+import appdirs
 import numpy as np
 import scipy as sp
-from numba import jit, prange
 import netCDF4 as nc
 from netCDF4 import Dataset
 from matplotlib.transforms import Bbox
-import seawater as sw
 import xarray as xr
 
-from pyschism.mesh.base import Nodes, Elements
+from pyschism.forcing.bctides.ncwriter import NuNcWriter, ThNcWriter
+from pyschism.forcing.bctides.nudge import get_nudge_zone
+from pyschism.forcing.hycom.interp import GridInterpolator, get_interpolator
+from pyschism.forcing.hycom.ptemp import potential_temperature
+from pyschism.mesh.base import Nodes, Elements, transform_ll_to_cpp
 from pyschism.mesh.vgrid import Vgrid
 
 logger = logging.getLogger(__name__)
@@ -58,41 +67,53 @@ def get_database(date, Bbox=None):
         logger.info('No data for {date}')
     return database
 
-def get_idxs(date, database, bbox):
-
+def get_baseurl(date, database):
     if date.strftime("%Y-%m-%d") >= datetime.now().strftime("%Y-%m-%d"):
         date2 = datetime.now() - timedelta(days=1)
-        baseurl = f'https://tds.hycom.org/thredds/dodsC/{database}/FMRC/runs/GLBy0.08_930_FMRC_RUN_{date2.strftime("%Y-%m-%dT12:00:00Z")}?depth[0:1:-1],lat[0:1:-1],lon[0:1:-1],time[0:1:-1]'
-    else:
-        baseurl=f'https://tds.hycom.org/thredds/dodsC/{database}?lat[0:1:-1],lon[0:1:-1],time[0:1:-1],depth[0:1:-1]'
-
-    ds=Dataset(baseurl)
-    time1=ds['time']
-    times=nc.num2date(time1,units=time1.units,only_use_cftime_datetimes=False)
-    
-    lon=ds['lon'][:]
-    lat=ds['lat'][:]
-    dep=ds['depth'][:]
+        return f'https://tds.hycom.org/thredds/dodsC/{database}/FMRC/runs/GLBy0.08_930_FMRC_RUN_{date2.strftime("%Y-%m-%dT12:00:00Z")}'
+    return f'https://tds.hycom.org/thredds/dodsC/{database}'
+
+@lru_cache(maxsize=None)
+def open_catalog(url):
+    """Reads the time, lon, lat and depth axes of a HYCOM dataset.
+
+    The axes are cached, so that each THREDDS aggregation is opened once
+    however many days, boundaries or variables are subset from it.
+    """
+    with Dataset(url) as ds:
+        time1 = ds['time']
+        times = nc.num2date(time1[:], units=time1.units, only_use_cftime_datetimes=False)
+        lon = np.asarray(ds['lon'][:])
+        lat = np.asarray(ds['lat'][:])
+        dep = np.asarray(ds['depth'][:])
+    for array in (times, lon, lat, dep):
+        array.flags.writeable = False
+    return times, lon, lat, dep
+
+def get_hycom_bbox(date, xmin, ymin, xmax, ymax):
+    """Returns the bbox in the longitude convention of the database used for date."""
+    if date.strftime("%Y-%m-%d") >= datetime(2017, 2, 1).strftime("%Y-%m-%d") and  \
+        date.strftime("%Y-%m-%d") < datetime(2017, 6, 1).strftime("%Y-%m-%d") or \
+        date.strftime("%Y-%m-%d") >= datetime(2017, 10, 1).strftime("%Y-%m-%d"):
+        xmin = xmin + 360. if xmin < 0 else xmin
+        xmax = xmax + 360. if xmax < 0 else xmax
+    return Bbox.from_extents(xmin, ymin, xmax, ymax)
+
+def get_idxs(date, database, bbox, url=None):
+
+    url = get_baseurl(date, database) if url is None else url
+    times, lon, lat, dep = open_catalog(url)
+
     lat_idxs=np.where((lat>=bbox.ymin-2.0)&(lat<=bbox.ymax+2.0))[0]
     lon_idxs=np.where((lon>=bbox.xmin-2.0) & (lon<=bbox.xmax+2.0))[0]
     lon=lon[lon_idxs]
     lat=lat[lat_idxs]
-    #logger.info(lon_idxs)
-    #logger.info(lat_idxs)
     lon_idx1=lon_idxs[0].item()
     lon_idx2=lon_idxs[-1].item()
-    #logger.info(f'lon_idx1 is {lon_idx1}, lon_idx2 is {lon_idx2}')
     lat_idx1=lat_idxs[0].item()
     lat_idx2=lat_idxs[-1].item()
-    #logger.info(f'lat_idx1 is {lat_idx1}, lat_idx2 is {lat_idx2}')
-    
-    for ilon in np.arange(len(lon)):
-        if lon[ilon] > 180:
-            lon[ilon] = lon[ilon]-360.
-    #lonc=(np.max(lon)+np.min(lon))/2.0
-    #logger.info(f'lonc is {lonc}')
-    #latc=(np.max(lat)+np.min(lat))/2.0
-    #logger.info(f'latc is {latc}')
+
+    lon[lon > 180] -= 360.
     x2, y2=transform_ll_to_cpp(lon, lat)
 
     idxs=np.where( date == times)[0]
@@ -112,64 +133,136 @@ def get_idxs(date, database, bbox):
         sys.exit()
     time_idx=idxs.item()  
 
-    ds.close()
-
     return time_idx, lon_idx1, lon_idx2, lat_idx1, lat_idx2, x2, y2
 
-def transform_ll_to_cpp(lon, lat, lonc=-77.07, latc=24.0):
-    #lonc=(np.max(lon)+np.min(lon))/2.0
-    #logger.info(f'lonc is {lonc}')
-    #latc=(np.max(lat)+np.min(lat))/2.0
-    #logger.info(f'latc is {latc}')
-    longitude=lon/180*np.pi
-    latitude=lat/180*np.pi
-    radius=6378206.4
-    loncc=lonc/180*np.pi
-    latcc=latc/180*np.pi
-    lon_new=[radius*(longitude[i]-loncc)*np.cos(latcc) for i in np.arange(len(longitude))]
-    lat_new=[radius*latitude[i] for i in np.arange(len(latitude))]
-
-    return np.array(lon_new), np.array(lat_new)
-
-def interp_to_points_3d(dep, y2, x2, bxyz, val):
-    idxs = np.where(abs(val) > 10000)
-    val[idxs] = float('nan')
-
-    val_fd = sp.interpolate.RegularGridInterpolator((dep,y2,x2),np.squeeze(val),'linear', bounds_error=False, fill_value = float('nan'))
-    val_int = val_fd(bxyz)
-    idxs = np.isnan(val_int)
-    if np.sum(idxs) != 0:
-        val_int[idxs] = sp.interpolate.griddata(bxyz[~idxs,:], val_int[~idxs], bxyz[idxs,:],'nearest')
-    idxs = np.isnan(val_int)
-    if np.sum(idxs) != 0:
+def stage_subset(url, path, time_idx, lat_idxs, lon_idxs, variables):
+    """Downloads one time record of variables over a lat/lon window into a
+    local NetCDF file.
+
+    Variables keep their names, packing and attributes, so the staged file
+    reads the same as the remote dataset. The file is written under a
+    temporary name and renamed once complete.
+    """
+    path = pathlib.Path(path)
+    if path.is_file():
+        return path
+    index = {
+        'time': slice(time_idx, time_idx + 1),
+        'lat': slice(lat_idxs[0], lat_idxs[1] + 1),
+        'lon': slice(lon_idxs[0], lon_idxs[1] + 1),
+    }
+    tmp = path.parent / f'.{path.name}.{os.getpid()}'
+    with Dataset(url) as src, Dataset(tmp, 'w', format='NETCDF4') as dst:
+        for name in ['time', 'depth', 'lat', 'lon', *variables]:
+            var = src[name]
+            for dim in var.dimensions:
+                if dim not in dst.dimensions:
+                    dst.createDimension(dim, len(range(*index.get(dim, slice(None)).indices(len(src.dimensions[dim])))))
+            attrs = {k: var.getncattr(k) for k in var.ncattrs()}
+            out = dst.createVariable(name, var.dtype, var.dimensions, zlib=True, fill_value=attrs.pop('_FillValue', None))
+            out.setncatts(attrs)
+            var.set_auto_maskandscale(False)
+            out.set_auto_maskandscale(False)
+            out[:] = var[tuple(index.get(dim, slice(None)) for dim in var.dimensions)]
+    os.replace(tmp, path)
+    return path
+
+class HycomInventory:
+    """Stages the daily HYCOM subsets needed by a set of points.
+
+    Each day is subset once, over the merged bbox of all the points, with
+    only the requested variables. The days are downloaded by a pool of
+    worker processes into NetCDF files of the cache directory, and a file
+    already in the cache is not downloaded again.
+
+    Args:
+        lon, lat: Coordinates of the points to cover.
+        variables: Names of the HYCOM variables to download.
+        cache: Directory of the staged files. True uses the user cache
+            directory and False or None a temporary directory.
+        workers: Number of concurrent downloads.
+        prefetch: Maximum number of days downloaded ahead of the one being
+            consumed. None downloads all the days as fast as possible.
+    """
+
+    def __init__(self, lon, lat, variables, cache: Union[str, os.PathLike, bool, None] = True, workers: int = 4, prefetch: int = None):
+        self.extents = (np.min(lon), np.min(lat), np.max(lon), np.max(lat))
+        self.variables = list(variables)
+        self.cache = cache
+        self.workers = workers
+        self.prefetch = prefetch
+
+    @property
+    def cache(self):
+        return self._cache
+
+    @cache.setter
+    def cache(self, cache: Union[str, os.PathLike, bool, None]):
+        if cache is None or cache is False:
+            self._tmpdir = tempfile.TemporaryDirectory()
+            self._cache = pathlib.Path(self._tmpdir.name)
+        elif cache is True:
+            self._cache = pathlib.Path(appdirs.user_cache_dir('pyschism/hycom'))
+        elif isinstance(cache, (str, os.PathLike)):
+            self._cache = pathlib.Path(cache)
+        else:
+            raise TypeError(
+                f"Unhandled argument cache={cache} of type {type(cache)}.")
+        self._cache.mkdir(exist_ok=True, parents=True)
+
+    def get_url(self, date):
+        return get_baseurl(date, get_database(date))
+
+    def request(self, date):
+        """Returns the staging arguments and the projected lon/lat axes of
+        the subset for date."""
+        url = self.get_url(date)
+        bbox = get_hycom_bbox(date, *self.extents)
+        time_idx, lon_idx1, lon_idx2, lat_idx1, lat_idx2, x2, y2 = get_idxs(date, None, bbox, url)
+        key = f'{url}|{open_catalog(url)[0][time_idx]}|{lat_idx1}:{lat_idx2}|{lon_idx1}:{lon_idx2}|{",".join(self.variables)}'
+        path = self.cache / f'hycom_{date.strftime("%Y%m%d")}_{hashlib.md5(key.encode()).hexdigest()[:12]}.nc'
+        args = (url, path, time_idx, (lat_idx1, lat_idx2), (lon_idx1, lon_idx2), self.variables)
+        return args, x2, y2
+
+    def fetch(self, dates):
+        """Yields (path, x2, y2) for each date, in order, while the next
+        days are being downloaded."""
+        requests = [self.request(date) for date in dates]
+        if self.workers <= 1:
+            for args, x2, y2 in requests:
+                yield stage_subset(*args), x2, y2
+            return
+        prefetch = len(requests) if self.prefetch is None else max(self.prefetch, 1)
+        requests = iter(requests)
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            futures = deque(
+                (executor.submit(stage_subset, *args), x2, y2)
+                for args, x2, y2 in itertools.islice(requests, prefetch))
+            while futures:
+                future, x2, y2 = futures.popleft()
+                path = future.result()
+                for args, _x2, _y2 in itertools.islice(requests, 1):
+                    futures.append((executor.submit(stage_subset, *args), _x2, _y2))
+                yield path, x2, y2
+
+def interp_to_points_3d(dep, y2, x2, bxyz, val, cache=None):
+    val_int = get_interpolator((dep, y2, x2), bxyz, cache)(val)
+    if np.any(np.isnan(val_int)):
         logger.info(f'There is still missing value for {val}')
         sys.exit()
     return val_int
 
-def interp_to_points_2d(y2, x2, bxy, val):
-    idxs = np.where(abs(val) > 10000)
-    val[idxs] = float('nan')
-
-    val_fd = sp.interpolate.RegularGridInterpolator((y2,x2),np.squeeze(val),'linear', bounds_error=False, fill_value = float('nan'))
-    val_int = val_fd(bxy)
-    idxs = np.isnan(val_int)
-    if np.sum(idxs) != 0:
-        val_int[idxs] = sp.interpolate.griddata(bxy[~idxs,:], val_int[~idxs], bxy[idxs,:],'nearest')
-    idxs = np.isnan(val_int)
-    if np.sum(idxs) != 0:
+def interp_to_points_2d(y2, x2, bxy, val, cache=None):
+    val_int = get_interpolator((y2, x2), bxy, cache)(val)
+    if np.any(np.isnan(val_int)):
         logger.info(f'There is still missing value for {val}')
         sys.exit()
     return val_int
 
-def ConvertTemp(salt, temp, dep):
-    nz = temp.shape[0]
-    ny = temp.shape[1]
-    nx = temp.shape[2]
-    pr = np.ones(temp.shape)
-    pre = pr*dep[:,None, None]
-    Pr = np.zeros(temp.shape)
-    ptemp = sw.ptmp(salt, temp, pre, Pr)*1.00024
-    return ptemp
+def ConvertTemp(salt, temp, dep, cells=None):
+    """Converts the in-situ temp to potential temperature, nan on land and,
+    if cells is given, outside of the cells used."""
+    return potential_temperature(salt, temp, dep, cells)
 
 class OpenBoundaryInventory:
 
@@ -177,8 +270,9 @@ class OpenBoundaryInventory:
         self.hgrid = hgrid
         self.vgrid = Vgrid.default() if vgrid is None else vgrid
 
-    def fetch_data(self, outdir: Union[str, os.PathLike], start_date, rnday, elev2D=True, TS=True, UV=True, adjust2D=False, lats=None, msl_shifts=None): 
+    def fetch_data(self, outdir: Union[str, os.PathLike], start_date, rnday, elev2D=True, TS=True, UV=True, adjust2D=False, lats=None, msl_shifts=None, cache=True, workers=4, zlib=False): 
         outdir = pathlib.Path(outdir)
+        dst_elev = dst_salt = dst_temp = dst_uv = None
 
         self.start_date = start_date
         self.rnday=rnday
@@ -220,215 +314,100 @@ class OpenBoundaryInventory:
             #logger.info('Computing SCHISM zcor is done!')
 
         #create netcdf
-        ntimes=self.rnday+1
-        nComp1=1
-        nComp2=2
-        one=1
-        #ndt=np.zeros([ntimes])
-
         if elev2D:
-            #timeseries_el=np.zeros([ntimes,NOP,nComp1])
-            #create netcdf 
-            dst_elev = Dataset(outdir / 'elev2D.th.nc', 'w', format='NETCDF4')
-            #dimensions
-            dst_elev.createDimension('nOpenBndNodes', NOP)
-            dst_elev.createDimension('one', one)
-            dst_elev.createDimension('time', None)
-            dst_elev.createDimension('nLevels', one)
-            dst_elev.createDimension('nComponents', nComp1)
-
-            #variables
-            dst_elev.createVariable('time_step', 'f', ('one',))
-            dst_elev['time_step'][:] = 86400
-
-            dst_elev.createVariable('time', 'f', ('time',))
-            #dst_elev['time'][:] = ndt
-
-            dst_elev.createVariable('time_series', 'f', ('time', 'nOpenBndNodes', 'nLevels', 'nComponents'))
-            #dst_elev['time_series'][:,:,:,:] = timeseries_el
-
+            dst_elev = ThNcWriter(outdir / 'elev2D.th.nc', NOP, zlib=zlib)
         if TS:
-            #timeseries_s=np.zeros([ntimes,NOP,nvrt,nComp1])
-            dst_salt = Dataset(outdir / 'SAL_3D.th.nc', 'w', format='NETCDF4')
-            #dimensions
-            dst_salt.createDimension('nOpenBndNodes', NOP)
-            dst_salt.createDimension('one', one)
-            dst_salt.createDimension('time', None)
-            dst_salt.createDimension('nLevels', nvrt)
-            dst_salt.createDimension('nComponents', nComp1)
-            #variables
-            dst_salt.createVariable('time_step', 'f', ('one',))
-            dst_salt['time_step'][:] = 86400
-
-            dst_salt.createVariable('time', 'f', ('time',))
-            #dst_salt['time'][:] = ndt
-
-            dst_salt.createVariable('time_series', 'f', ('time', 'nOpenBndNodes', 'nLevels', 'nComponents'))
-
-            #temp
-            #timeseries_t=np.zeros([ntimes,NOP,nvrt,nComp1])
-
-            dst_temp =  Dataset(outdir / 'TEM_3D.th.nc', 'w', format='NETCDF4')
-            #dimensions
-            dst_temp.createDimension('nOpenBndNodes', NOP)
-            dst_temp.createDimension('one', one)
-            dst_temp.createDimension('time', None)
-            dst_temp.createDimension('nLevels', nvrt)
-            dst_temp.createDimension('nComponents', nComp1)
-            #variables
-            dst_temp.createVariable('time_step', 'f', ('one',))
-            dst_temp['time_step'][:] = 86400
-
-            dst_temp.createVariable('time', 'f', ('time',))
-            #dst_temp['time'][:] = ndt
-
-            dst_temp.createVariable('time_series', 'f', ('time', 'nOpenBndNodes', 'nLevels', 'nComponents'))
-            #dst_temp['time_series'][:,:,:,:] = timeseries_t
+            dst_salt = ThNcWriter(outdir / 'SAL_3D.th.nc', NOP, nvrt, zlib=zlib)
+            dst_temp = ThNcWriter(outdir / 'TEM_3D.th.nc', NOP, nvrt, zlib=zlib)
+        if UV:
+            dst_uv = ThNcWriter(outdir / 'uv3D.th.nc', NOP, nvrt, 2, zlib=zlib)
 
+        #one subset per day covering all the open boundaries
+        variables = []
+        if elev2D:
+            variables.append('surf_el')
+        if TS:
+            variables.extend(['salinity', 'water_temp'])
         if UV:
-            #timeseries_uv=np.zeros([ntimes,NOP,nvrt,nComp2])
-            dst_uv = Dataset(outdir / 'uv3D.th.nc', 'w', format='NETCDF4')
-            #dimensions
-            dst_uv.createDimension('nOpenBndNodes', NOP)
-            dst_uv.createDimension('one', one)
-            dst_uv.createDimension('time', None)
-            dst_uv.createDimension('nLevels', nvrt)
-            dst_uv.createDimension('nComponents', nComp2)
-            #variables
-            dst_uv.createVariable('time_step', 'f', ('one',))
-            dst_uv['time_step'][:] = 86400
-
-            dst_uv.createVariable('time', 'f', ('time',))
-            #dst_uv['time'][:] = ndt
-            
-            dst_uv.createVariable('time_series', 'f', ('time', 'nOpenBndNodes', 'nLevels', 'nComponents'))
-            #dst_uv['time_series'][:,:,:,:] = timeseries_uv
+            variables.extend(['water_u', 'water_v'])
+        inventory = HycomInventory(blon, blat, variables, cache=cache, workers=workers)
+
+        #points of each open boundary, which do not change from day to day
+        boundaries = []
+        ind2 = 0
+        for boundary in gdf.itertuples():
+
+            opbd = list(boundary.indexes)
+            ind1 = ind2
+            ind2 = ind1 + len(opbd)
+            blat = self.hgrid.coords[opbd,1]
+            xi,yi = transform_ll_to_cpp(self.hgrid.coords[opbd,0], blat)
+            bxy = np.c_[yi, xi]
+
+            zcor2 = bxyz = None
+            if TS or UV:
+                zcor2=zcor[opbd,:]
+                idxs=np.where(zcor2 > 5000)
+                zcor2[idxs]=5000.0-1.0e-6
+
+                #construct schism grid
+                x2i=np.tile(xi,[nvrt,1]).T
+                y2i=np.tile(yi,[nvrt,1]).T
+                bxyz=np.c_[zcor2.reshape(np.size(zcor2)),y2i.reshape(np.size(y2i)),x2i.reshape(np.size(x2i))]
+
+            boundaries.append((ind1, ind2, blat, bxy, zcor2, bxyz))
 
         logger.info('**** Accessing GOFS data*****')
         t0=time()
-        for it, date in enumerate(self.timevector):
+        for it, (path, x2, y2) in enumerate(inventory.fetch(self.timevector)):
 
-            database=get_database(date)
-            logger.info(f'Fetching data for {date} from database {database}')
+            logger.info(f'Interpolating data for {self.timevector[it]} from {path}')
+            ds=Dataset(path)
+            dep=ds['depth'][:]
+
+            if elev2D:
+                ssh=np.squeeze(ds['surf_el'][:,:])
+            if TS:
+                salt = np.squeeze(ds['salinity'][:,:,:])
+                temp = np.squeeze(ds['water_temp'][:,:,:])
+                #Convert temp to potential temp, only in the cells used by the boundaries
+                cells = np.unique(np.concatenate([
+                    get_interpolator((dep, y2, x2), bxyz, inventory.cache).cells
+                    for _, _, _, _, _, bxyz in boundaries]))
+                ptemp = ConvertTemp(salt, temp, dep, cells)
+            if UV:
+                uvel=np.squeeze(ds['water_u'][:,:,:])
+                vvel=np.squeeze(ds['water_v'][:,:,:])
+            ds.close()
+
+            logger.info('****Interpolation starts****')
 
             #loop over each open boundary
-            ind1 = 0
-            ind2 = 0
-            for boundary in gdf.itertuples():
-
-                opbd = list(boundary.indexes)
-                ind1 = ind2
-                ind2 = ind1 + len(opbd)
-                #logger.info(f'ind1 = {ind1}, ind2 = {ind2}')
-                blon = self.hgrid.coords[opbd,0]
-                blat = self.hgrid.coords[opbd,1]
-                xi,yi = transform_ll_to_cpp(blon, blat)
-                bxy = np.c_[yi, xi]
-
-                if TS or UV:
-                    zcor2=zcor[opbd,:]
-                    idxs=np.where(zcor2 > 5000)
-                    zcor2[idxs]=5000.0-1.0e-6
-
-                    #construct schism grid
-                    x2i=np.tile(xi,[nvrt,1]).T
-                    y2i=np.tile(yi,[nvrt,1]).T
-                    bxyz=np.c_[zcor2.reshape(np.size(zcor2)),y2i.reshape(np.size(y2i)),x2i.reshape(np.size(x2i))]
-
-                xmin, xmax = np.min(blon), np.max(blon)
-                ymin, ymax = np.min(blat), np.max(blat)
-
-                if date.strftime("%Y-%m-%d") >= datetime(2017, 2, 1).strftime("%Y-%m-%d") and  \
-                    date.strftime("%Y-%m-%d") < datetime(2017, 6, 1).strftime("%Y-%m-%d") or \
-                    date.strftime("%Y-%m-%d") >= datetime(2017, 10, 1).strftime("%Y-%m-%d"):
-                    xmin = xmin + 360. if xmin < 0 else xmin
-                    xmax = xmax + 360. if xmax < 0 else xmax
-                    bbox = Bbox.from_extents(xmin, ymin, xmax, ymax)
-                else:
-                    bbox = Bbox.from_extents(xmin, ymin, xmax, ymax)
-                #logger.info(f'xmin is {xmin}, xmax is {xmax}')
-
-                time_idx, lon_idx1, lon_idx2, lat_idx1, lat_idx2, x2, y2 = get_idxs(date, database, bbox)
-
-                if date.strftime("%Y-%m-%d") >= datetime.now().strftime("%Y-%m-%d"):
-                    date2 = datetime.now() - timedelta(days=1)
-                    url = f'https://tds.hycom.org/thredds/dodsC/{database}/FMRC/runs/GLBy0.08_930_FMRC_RUN_' + \
-                        f'{date2.strftime("%Y-%m-%dT12:00:00Z")}?depth[0:1:-1],lat[{lat_idx1}:1:{lat_idx2}],' + \
-                        f'lon[{lon_idx1}:1:{lon_idx2}],time[{time_idx}],' + \
-                        f'surf_el[{time_idx}][{lat_idx1}:1:{lat_idx2}][{lon_idx1}:1:{lon_idx2}],' + \
-                        f'water_temp[{time_idx}][0:1:39][{lat_idx1}:1:{lat_idx2}][{lon_idx1}:1:{lon_idx2}],' + \
-                        f'salinity[{time_idx}][0:1:39][{lat_idx1}:1:{lat_idx2}][{lon_idx1}:1:{lon_idx2}],' + \
-                        f'water_u[{time_idx}][0:1:39][{lat_idx1}:1:{lat_idx2}][{lon_idx1}:1:{lon_idx2}],' + \
-                        f'water_v[{time_idx}][0:1:39][{lat_idx1}:1:{lat_idx2}][{lon_idx1}:1:{lon_idx2}]'
-                        
-                else:
-                    url=f'https://tds.hycom.org/thredds/dodsC/{database}?lat[{lat_idx1}:1:{lat_idx2}],' + \
-                        f'lon[{lon_idx1}:1:{lon_idx2}],depth[0:1:-1],time[{time_idx}],' + \
-                        f'surf_el[{time_idx}][{lat_idx1}:1:{lat_idx2}][{lon_idx1}:1:{lon_idx2}],' + \
-                        f'water_temp[{time_idx}][0:1:39][{lat_idx1}:1:{lat_idx2}][{lon_idx1}:1:{lon_idx2}],' + \
-                        f'salinity[{time_idx}][0:1:39][{lat_idx1}:1:{lat_idx2}][{lon_idx1}:1:{lon_idx2}],' + \
-                        f'water_u[{time_idx}][0:1:39][{lat_idx1}:1:{lat_idx2}][{lon_idx1}:1:{lon_idx2}],' + \
-                        f'water_v[{time_idx}][0:1:39][{lat_idx1}:1:{lat_idx2}][{lon_idx1}:1:{lon_idx2}]'
-                #logger.info(url)
-                 
-                ds=Dataset(url)
-                dep=ds['depth'][:]
-
-                logger.info('****Interpolation starts****')
-
-                #ndt[it]=it*24*3600.
+            for ind1, ind2, blat, bxy, zcor2, bxyz in boundaries:
 
                 if elev2D:
-                    #ssh
-                    ssh=np.squeeze(ds['surf_el'][:,:])
-
-                    ssh_int = interp_to_points_2d(y2, x2, bxy, ssh)
-                    dst_elev['time'][it] = it*24*3600.
+                    ssh_int = interp_to_points_2d(y2, x2, bxy, ssh, inventory.cache)
                     if adjust2D:
-                        elev_adjust = np.interp(blat, lats, msl_shifts)
-                        dst_elev['time_series'][it,ind1:ind2,0,0] = ssh_int + elev_adjust
-                    else:
-                        dst_elev['time_series'][it,ind1:ind2,0,0] = ssh_int 
+                        ssh_int = ssh_int + np.interp(blat, lats, msl_shifts)
+                    dst_elev.write(it, ssh_int, it*24*3600., ind1)
 
                 if TS:
-                    #salt
-                    salt = np.squeeze(ds['salinity'][:,:,:])
+                    salt_int = interp_to_points_3d(dep, y2, x2, bxyz, salt, inventory.cache)
+                    dst_salt.write(it, salt_int.reshape(zcor2.shape), it*24*3600., ind1)
 
-                    salt_int = interp_to_points_3d(dep, y2, x2, bxyz, salt)
-                    salt_int = salt_int.reshape(zcor2.shape)
-                    #timeseries_s[it,:,:,0]=salt_int
-                    dst_salt['time'][it] = it*24*3600.
-                    dst_salt['time_series'][it,ind1:ind2,:,0] = salt_int
+                    temp_int = interp_to_points_3d(dep, y2, x2, bxyz, ptemp, inventory.cache)
+                    dst_temp.write(it, temp_int.reshape(zcor2.shape), it*24*3600., ind1)
 
-                    #temp
-                    temp = np.squeeze(ds['water_temp'][:,:,:])
-
-                    #Convert temp to potential temp
-                    ptemp = ConvertTemp(salt, temp, dep)
+                if UV:
+                    uvel_int = interp_to_points_3d(dep, y2, x2, bxyz, uvel, inventory.cache)
+                    dst_uv.write(it, uvel_int.reshape(zcor2.shape), it*24*3600., ind1, component=0)
 
-                    temp_int = interp_to_points_3d(dep, y2, x2, bxyz, ptemp)
-                    temp_int = temp_int.reshape(zcor2.shape)
-                    #timeseries_t[it,:,:,0]=temp_int
-                    dst_temp['time'][it] = it*24*3600.
-                    dst_temp['time_series'][it,ind1:ind2,:,0] = temp_int
+                    vvel_int = interp_to_points_3d(dep, y2, x2, bxyz, vvel, inventory.cache)
+                    dst_uv.write(it, vvel_int.reshape(zcor2.shape), offset=ind1, component=1)
 
-                if UV:
-                    uvel=np.squeeze(ds['water_u'][:,:,:])
-                    vvel=np.squeeze(ds['water_v'][:,:,:])
-
-                    dst_uv['time'][it] = it*24*3600.
-                    #uvel
-                    uvel_int = interp_to_points_3d(dep, y2, x2, bxyz, uvel)
-                    uvel_int = uvel_int.reshape(zcor2.shape)
-                    dst_uv['time_series'][it,ind1:ind2,:,0] = uvel_int
-
-                    #vvel
-                    vvel_int = interp_to_points_3d(dep, y2, x2, bxyz, vvel)
-                    vvel_int = vvel_int.reshape(zcor2.shape)
-                    dst_uv['time_series'][it,ind1:ind2,:,1] = vvel_int
-                    #timeseries_uv[it,:,:,1]=vvel_int
-
-                ds.close()
+        for dst in [dst_elev, dst_salt, dst_temp, dst_uv]:
+            if dst is not None:
+                dst.close()
         logger.info(f'Writing *th.nc takes {time()-t0} seconds')
 
 class Nudge:
@@ -440,35 +419,8 @@ class Nudge:
 
     def gen_nudge(self, outdir: Union[str, os.PathLike], hgrid, rlmax = 1.5, rnu_day=0.25):
 
-        @jit(nopython=True, parallel=True)
-        def compute_nudge(lon, lat, nnode, opbd, out):
-          
-            rnu_max = 1.0 / rnu_day / 86400.0
-            rnu = 0
-
-            for idn in prange(nnode):
-                if idn in opbd:
-                    rnu = rnu_max
-                    distmin = 0.
-                else:
-                    distmin = np.finfo(np.float64).max
-                    for j in opbd:
-                        tmp = np.square(lon[idn]-lon[j]) + np.square(lat[idn]-lat[j])
-                        rl2 = np.sqrt(tmp)
-                        if rl2 < distmin:
-                            distmin=rl2
-                rnu = 0.
-                if distmin <= rlmax:
-                    rnu = (1-distmin/rlmax)*rnu_max
-                    #idxs_nudge[idn]=1 #idn
-                out[idn] = rnu
-
         outdir = pathlib.Path(outdir)
 
-        #get nudge zone
-        lon=hgrid.coords[:,0]
-        lat=hgrid.coords[:,1]
-
         #Get open boundary 
         gdf=hgrid.boundaries.open.copy()
         opbd=[]
@@ -476,27 +428,12 @@ class Nudge:
             opbd.extend(list(boundary.indexes))
         opbd = np.array(opbd)
 
-        elnode=hgrid.elements.array
-        NE, NP = len(elnode), len(lon)
+        NE, NP = len(hgrid.elements), len(hgrid.nodes)
 
-        out = np.zeros([NP])
-        idxs_nudge=np.zeros(NP, dtype=int)
+        #get nudge zone
         t0 = time()
-        #compute_nudge(lon, lat, NP, opbd2, idxs_nudge, out)
-        compute_nudge(lon, lat, NP, opbd, out)
-
-        idxs=np.where(out > 0)[0]
-        idxs_nudge[idxs]=1
-        #expand nudging marker to neighbor nodes
-        idxs=np.where(np.max(out[elnode], axis=1) > 0)[0]
-        fp=elnode[idxs,-1] < 0
-        idxs_nudge[elnode[idxs[fp],:3]]=1
-        idxs_nudge[elnode[idxs[~fp],:]]=1
-
-        #idxs_nudge=np.delete(idxs_nudge, np.where(idxs_nudge == -99))
-        idxs=np.where(idxs_nudge == 1)[0]
-        self.include=idxs
-        #logger.info(f'len of nudge idxs is {len(idxs)}')
+        out, self.include = get_nudge_zone(
+            hgrid.coords, hgrid.elements.connectivity, opbd, rlmax, rnu_day)
         logger.info(f'It took {time() -t0} sencods to calcuate nudge coefficient')
 
         nudge = [f"{rlmax}, {rnu_day}"]
@@ -527,7 +464,18 @@ class Nudge:
 
         return self.include
 
-    def fetch_data(self, outdir: Union[str, os.PathLike], hgrid, vgrid, start_date, rnday):
+    def fetch_data(self, outdir: Union[str, os.PathLike], hgrid, vgrid, start_date, rnday, zlib=False, workers=4, prefetch=2, cache=True, include=None):
+        """Writes TEM_nu.nc and SAL_nu.nc from the daily HYCOM data.
+
+        The days are processed as a pipeline: a pool of workers downloads
+        the daily subsets up to prefetch days ahead, a pool of workers
+        interpolates the salinity and potential temperature of the
+        downloaded days, and the results are written in time order as they
+        come. workers=1 runs everything in this process.
+
+        include is the index of the nodes nudged, as returned by gen_nudge.
+        If None, gen_nudge is called with its default nudging zone.
+        """
 
         outdir = pathlib.Path(outdir)
 
@@ -542,11 +490,8 @@ class Nudge:
         sigma=vd.sigma
 
         #Get the index for nudge
-        include = self.gen_nudge(outdir,hgrid)
-
-        #get coords of SCHISM
-        loni=hgrid.nodes.coords[:,0]
-        lati=hgrid.nodes.coords[:,1]
+        if include is None:
+            include = self.gen_nudge(outdir,hgrid)
 
         #get bathymetry
         depth = hgrid.values
@@ -554,19 +499,15 @@ class Nudge:
         #compute zcor
         zcor = depth[:,None]*sigma
         nvrt=zcor.shape[1]
-        #logger.info(f'zcor at node 1098677 is {zcor[1098676,:]}')
 
         #Get open nudge array 
         nlon = hgrid.coords[include, 0]
         nlat = hgrid.coords[include, 1]
         xi,yi = transform_ll_to_cpp(nlon, nlat)
-        bxy = np.c_[yi, xi]
 
         zcor2=zcor[include,:]
         idxs=np.where(zcor2 > 5000)
-        #logger.info(idxs)
         zcor2[idxs]=5000.0-1.0e-6
-        #logger.info(f'zcor2 at node 200 is {zcor2[199,:]}')
 
         #construct schism grid
         x2i=np.tile(xi,[nvrt,1]).T
@@ -574,112 +515,82 @@ class Nudge:
         bxyz=np.c_[zcor2.reshape(np.size(zcor2)),y2i.reshape(np.size(y2i)),x2i.reshape(np.size(x2i))]
         logger.info('Computing SCHISM zcor is done!')
 
-        #allocate output variables
-        nNode=len(include)
-        one=1
-        ntimes=self.rnday+1
+        inventory = HycomInventory(nlon, nlat, ['salinity', 'water_temp'], cache=cache, workers=workers, prefetch=prefetch)
 
-        timeseries_s=np.zeros([ntimes,nNode,nvrt,one])
-        timeseries_t=np.zeros([ntimes,nNode,nvrt,one])
-        ndt=np.zeros([ntimes])
+        #build the interpolator of the first day before the workers start,
+        #so that forked workers share it
+        _init_nudge_worker(bxyz)
+        args, x2, y2 = inventory.request(self.timevector[0])
+        _get_nudge_interpolator(open_catalog(args[0])[3], y2, x2)
 
         logger.info('**** Accessing GOFS data*****')
         t0=time()
-        for it, date in enumerate(self.timevector):
-
-            database=get_database(date)
-            logger.info(f'Fetching data for {date} from database {database}')
-
-            xmin, xmax = np.min(nlon), np.max(nlon)
-            ymin, ymax = np.min(nlat), np.max(nlat)
-
-            if date.strftime("%Y-%m-%d") >= datetime(2017, 2, 1).strftime("%Y-%m-%d") and  \
-                date.strftime("%Y-%m-%d") < datetime(2017, 6, 1).strftime("%Y-%m-%d") or \
-                date.strftime("%Y-%m-%d") >= datetime(2017, 10, 1).strftime("%Y-%m-%d"):
-                logger.info('Convert xmin and xmax')
-                xmin = xmin + 360. if xmin < 0 else xmin
-                xmax = xmax + 360. if xmax < 0 else xmax
-                bbox = Bbox.from_extents(xmin, ymin, xmax, ymax)
+        #the writers, the downloads and the workers are closed even if a
+        #day fails
+        with ExitStack() as stack:
+            #create netcdf, written one day at a time
+            dst_temp = stack.enter_context(NuNcWriter(outdir / 'TEM_nu.nc', include, nvrt, zlib=zlib))
+            dst_salt = stack.enter_context(NuNcWriter(outdir / 'SAL_nu.nc', include, nvrt, zlib=zlib))
+            subsets = stack.enter_context(closing(inventory.fetch(self.timevector)))
+            if workers <= 1:
+                results = (_interp_nudge(*subset) for subset in subsets)
             else:
-                bbox = Bbox.from_extents(xmin, ymin, xmax, ymax)
-            #logger.info(f'xmin is {xmin}, xmax is {xmax}')
-
-            time_idx, lon_idx1, lon_idx2, lat_idx1, lat_idx2, x2, y2 = get_idxs(date, database, bbox)
-
-            if date.strftime("%Y-%m-%d") >= datetime.now().strftime("%Y-%m-%d"):
-                date2 = datetime.now() - timedelta(days=1)
-                url = f'https://tds.hycom.org/thredds/dodsC/{database}/FMRC/runs/GLBy0.08_930_FMRC_RUN_' + \
-                    f'{date2.strftime("%Y-%m-%dT12:00:00Z")}?depth[0:1:-1],lat[{lat_idx1}:1:{lat_idx2}],' + \
-                    f'lon[{lon_idx1}:1:{lon_idx2}],time[{time_idx}],' + \
-                    f'water_temp[{time_idx}][0:1:39][{lat_idx1}:1:{lat_idx2}][{lon_idx1}:1:{lon_idx2}],' + \
-                    f'salinity[{time_idx}][0:1:39][{lat_idx1}:1:{lat_idx2}][{lon_idx1}:1:{lon_idx2}]'
-
-            else:
-                url=f'https://tds.hycom.org/thredds/dodsC/{database}?lat[{lat_idx1}:1:{lat_idx2}],' + \
-                    f'lon[{lon_idx1}:1:{lon_idx2}],depth[0:1:-1],time[{time_idx}],' + \
-                    f'water_temp[{time_idx}][0:1:39][{lat_idx1}:1:{lat_idx2}][{lon_idx1}:1:{lon_idx2}],' + \
-                    f'salinity[{time_idx}][0:1:39][{lat_idx1}:1:{lat_idx2}][{lon_idx1}:1:{lon_idx2}]'
-            #logger.info(url)
-
-            ds=Dataset(url)
-            salt=np.squeeze(ds['salinity'][:,:,:])
-            temp=np.squeeze(ds['water_temp'][:,:,:])
-            #logger.info(f'The shape of temp is {temp.shape}')
-
-            #Convert temp to potential temp
-            dep=ds['depth'][:]
-            ptemp = ConvertTemp(salt, temp, dep)
-
-            logger.info('****Interpolation starts****')
-
-            ndt[it]=it
-            #salt
-            salt_int = interp_to_points_3d(dep, y2, x2, bxyz, salt)
-            salt_int = salt_int.reshape(zcor2.shape)
-            timeseries_s[it,:,:,0]=salt_int
-
-            #temp
-            temp_int = interp_to_points_3d(dep, y2, x2, bxyz, ptemp)
-            temp_int = temp_int.reshape(zcor2.shape)
-            timeseries_t[it,:,:,0]=temp_int
-
-            ds.close()
- 
-        with Dataset(outdir / 'TEM_nu.nc', 'w', format='NETCDF4') as dst:
-        #dimensions
-            dst.createDimension('node', nNode)
-            dst.createDimension('nLevels', nvrt)
-            dst.createDimension('one', one)
-            dst.createDimension('time', None)
-        #variables
-            dst.createVariable('time', 'f', ('time',))
-            dst['time'][:] = ndt
-
-            dst.createVariable('map_to_global_node', 'i4', ('node',))
-            dst['map_to_global_node'][:] = include+1
-
-            dst.createVariable('tracer_concentration', 'f', ('time', 'node', 'nLevels', 'one'))
-            dst['tracer_concentration'][:,:,:,:] = timeseries_t
-
-        with Dataset(outdir / 'SAL_nu.nc', 'w', format='NETCDF4') as dst:
-        #dimensions
-            dst.createDimension('node', nNode)
-            dst.createDimension('nLevels', nvrt)
-            dst.createDimension('one', one)
-            dst.createDimension('time', None)
-        #variables
-            dst.createVariable('time', 'f', ('time',))
-            dst['time'][:] = ndt
-
-            dst.createVariable('map_to_global_node', 'i4', ('node',))
-            dst['map_to_global_node'][:] = include+1
-
-            dst.createVariable('tracer_concentration', 'f', ('time', 'node', 'nLevels', 'one'))
-            dst['tracer_concentration'][:,:,:,:] = timeseries_s
-
+                executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_nudge_worker, initargs=(bxyz,))
+                stack.callback(executor.shutdown, cancel_futures=True)
+                results = _ordered_results(executor, _interp_nudge, subsets, workers)
+            for it, (salt_int, temp_int) in enumerate(results):
+                logger.info(f'Writing nudging data for {self.timevector[it]}')
+                dst_salt.write(it, salt_int.reshape(zcor2.shape), it)
+                dst_temp.write(it, temp_int.reshape(zcor2.shape), it)
 
         logger.info(f'Writing *_nu.nc takes {time()-t0} seconds')
 
+_nudge_points = None
+_nudge_interpolators = {}
+
+def _init_nudge_worker(bxyz):
+    global _nudge_points
+    if _nudge_points is not bxyz:
+        _nudge_points = bxyz
+        _nudge_interpolators.clear()
+
+def _get_nudge_interpolator(dep, y2, x2):
+    key = tuple(np.asarray(axis, dtype=float).tobytes() for axis in (dep, y2, x2))
+    if key not in _nudge_interpolators:
+        _nudge_interpolators[key] = GridInterpolator((dep, y2, x2), _nudge_points)
+    return _nudge_interpolators[key]
+
+def _interp_nudge(path, x2, y2):
+    """Interpolates the salinity and potential temperature of a staged
+    subset onto the nudging points."""
+    with Dataset(path) as ds:
+        salt = np.squeeze(ds['salinity'][:,:,:])
+        temp = np.squeeze(ds['water_temp'][:,:,:])
+        dep = ds['depth'][:]
+
+    #Convert temp to potential temp, only in the cells used
+    interpolator = _get_nudge_interpolator(dep, y2, x2)
+    ptemp = ConvertTemp(salt, temp, dep, interpolator.cells)
+    out = []
+    for val in (salt, ptemp):
+        val_int = interpolator(val)
+        if np.any(np.isnan(val_int)):
+            logger.info(f'There is still missing value for {val}')
+            sys.exit()
+        out.append(val_int)
+    return out
+
+def _ordered_results(executor, fn, items, depth):
+    """Yields fn(*item) for each item, in order, keeping up to depth calls
+    running in the executor."""
+    futures = deque()
+    for item in items:
+        futures.append(executor.submit(fn, *item))
+        if len(futures) > depth:
+            yield futures.popleft().result()
+    while futures:
+        yield futures.popleft().result()
+
 class DownloadHycom:
 
     def __init__(self, hgrid):
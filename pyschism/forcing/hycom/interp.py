@@ -0,0 +1,243 @@
+"""Interpolation of HYCOM fields onto fixed sets of SCHISM points.
+
+The interpolators precompute the weights of the source values around each
+target point in a sparse matrix, once per source grid and target points,
+so that every time step, level and variable is a matrix product. Source
+values that are nan or larger than 10000 in magnitude (fill values) are
+missing, and the targets that cannot be interpolated take a nearest valid
+value. The nearest values are computed once per missing value mask.
+
+:class:`GridInterpolator` interpolates from a regular grid, as
+``RegularGridInterpolator``, and :class:`TriangulationInterpolator` from
+scattered points, as ``griddata`` with the linear method followed by the
+nearest method for the remaining targets.
+
+The interpolators and their caches may be used from several threads.
+"""
+from collections import OrderedDict
+import hashlib
+import itertools
+import pathlib
+import threading
+
+import numpy as np
+import scipy as sp
+from scipy.spatial import cKDTree, Delaunay
+
+
+def _missing(values):
+    """Returns the values as a float array with the missing values set to
+    zero, and the mask of the missing values."""
+    values = np.array(np.ma.filled(values, np.nan), dtype=float)
+    missing = ~(np.abs(values) <= 10000)
+    values[missing] = 0.
+    return values, missing
+
+
+class SparseInterpolator:
+    """Base class of the interpolators: out = matrix @ values, then the
+    targets in invalid take the value of their nearest valid source or
+    target, computed by _nearest_valid for each missing value mask."""
+
+    @property
+    def cells(self):
+        """Flat indexes of the source values the points depend on."""
+        if not hasattr(self, '_cells'):
+            self._cells = np.unique(self.matrix.indices)
+        return self._cells
+
+    def __call__(self, values):
+        """Interpolates values, of size the number of source values, or
+        stacked along the last axis, e.g. of shape (*grid, k) for k fields
+        interpolated at once into an array of shape (n, k)."""
+        nsrc = self.matrix.shape[1]
+        values = np.asarray(values)
+        if values.size == 0 or values.size % nsrc != 0:
+            raise ValueError(
+                f'Expected {nsrc} source values, got {values.size}.')
+        single = values.size == nsrc
+        values, missing = _missing(values.reshape(nsrc, -1))
+        out = self.matrix @ values
+        masks = {}
+        for column in range(values.shape[1]):
+            key = hashlib.md5(np.packbits(missing[:, column])).hexdigest()
+            masks.setdefault(key, []).append(column)
+            if key not in self._fill:
+                self._fill[key] = self._nearest_valid(missing[:, column])
+        for key, columns in masks.items():
+            invalid, nearest, source = self._fill[key]
+            if nearest is None:
+                out[np.ix_(invalid, columns)] = np.nan
+            else:
+                fill = values if source else out
+                out[np.ix_(invalid, columns)] = fill[np.ix_(nearest, columns)]
+        return out[:, 0] if single else out
+
+
+class GridInterpolator(SparseInterpolator):
+    """Linear interpolation from a regular grid onto a fixed set of points.
+
+    The weights of the grid values around each point are stored in a sparse
+    matrix, so that interpolating a field is a matrix-vector product. Grid
+    values that are nan or larger than 10000 in magnitude (fill values) are
+    missing, and a point that depends on a missing value or lies outside of
+    the grid takes the value of the nearest valid point. The nearest valid
+    points are computed once per missing value mask.
+
+    Args:
+        grid: Ascending axes of the grid, e.g. (dep, y2, x2).
+        points: Array of shape (n, len(grid)) of the target points.
+    """
+
+    def __init__(self, grid, points):
+        self.grid = tuple(np.asarray(axis, dtype=float) for axis in grid)
+        self.points = np.asarray(points, dtype=float).reshape(-1, len(self.grid))
+        shape = tuple(len(axis) for axis in self.grid)
+        self.inside = np.ones(len(self.points), dtype=bool)
+        lower, fractions = [], []
+        for axis, x in zip(self.grid, self.points.T):
+            self.inside &= (x >= axis[0]) & (x <= axis[-1])
+            i = np.clip(np.searchsorted(axis, x) - 1, 0, len(axis) - 2)
+            lower.append(i)
+            fractions.append((x - axis[i]) / (axis[i + 1] - axis[i]))
+        rows, cols, weights = [], [], []
+        for corner in itertools.product((0, 1), repeat=len(shape)):
+            weight = np.ones(len(self.points))
+            for c, fraction in zip(corner, fractions):
+                weight *= fraction if c else 1. - fraction
+            keep = self.inside & (weight != 0.)
+            rows.append(np.flatnonzero(keep))
+            cols.append(np.ravel_multi_index(
+                tuple(i[keep] + c for i, c in zip(lower, corner)), shape))
+            weights.append(weight[keep])
+        self.matrix = sp.sparse.csr_matrix(
+            (np.concatenate(weights), (np.concatenate(rows), np.concatenate(cols))),
+            shape=(len(self.points), np.prod(shape)))
+        self._fill = {}
+
+    def _nearest_valid(self, missing):
+        invalid = ~self.inside | (self.matrix @ missing.astype(float) > 0)
+        valid = np.flatnonzero(~invalid)
+        invalid = np.flatnonzero(invalid)
+        if len(valid) == 0:
+            return invalid, None, False
+        _, nearest = cKDTree(self.points[valid]).query(self.points[invalid])
+        return invalid, valid[nearest], False
+
+    def save(self, path):
+        np.savez(
+            path, points=self.points, inside=self.inside,
+            data=self.matrix.data, indices=self.matrix.indices,
+            indptr=self.matrix.indptr, shape=self.matrix.shape,
+            **{f'grid{i}': axis for i, axis in enumerate(self.grid)})
+
+    @classmethod
+    def load(cls, path):
+        obj = cls.__new__(cls)
+        with np.load(path) as data:
+            obj.grid = tuple(data[f'grid{i}'] for i in range(len(data.files) - 6))
+            obj.points = data['points']
+            obj.inside = data['inside']
+            obj.matrix = sp.sparse.csr_matrix(
+                (data['data'], data['indices'], data['indptr']),
+                shape=tuple(data['shape']))
+        obj._fill = {}
+        return obj
+
+_interpolators = OrderedDict()
+_interpolators_lock = threading.Lock()
+
+def get_interpolator(grid, points, cache=None):
+    """Returns the GridInterpolator of grid and points.
+
+    The last interpolators built are kept in memory and returned again for
+    the same grid and points. If cache is a directory, interpolators are
+    also saved there and loaded by later runs.
+    """
+    md5 = hashlib.md5()
+    for array in (*grid, points):
+        array = np.ascontiguousarray(array, dtype=float)
+        md5.update(str(array.shape).encode())
+        md5.update(array.tobytes())
+    key = md5.hexdigest()
+    with _interpolators_lock:
+        if key in _interpolators:
+            _interpolators.move_to_end(key)
+            return _interpolators[key]
+        path = None if cache is None else pathlib.Path(cache) / f'interp_{key}.npz'
+        if path is not None and path.is_file():
+            interpolator = GridInterpolator.load(path)
+        else:
+            interpolator = GridInterpolator(grid, points)
+            if path is not None:
+                interpolator.save(path)
+        _interpolators[key] = interpolator
+        if len(_interpolators) > 32:
+            _interpolators.popitem(last=False)
+        return interpolator
+
+
+class TriangulationInterpolator(SparseInterpolator):
+    """Linear interpolation from scattered source points onto a fixed set
+    of target points, through the Delaunay triangulation of the sources.
+
+    Same result as griddata with the linear method, then the nearest method
+    over the valid sources for the targets left nan: a target outside of
+    the triangulation or in a simplex with a missing value takes the value
+    of the nearest valid source. The triangulation and the barycentric
+    weights are computed once.
+
+    Args:
+        sources: Array of shape (m, ndim) of the source points.
+        points: Array of shape (n, ndim) of the target points.
+    """
+
+    def __init__(self, sources, points):
+        self.sources = np.asarray(sources, dtype=float)
+        self.points = np.asarray(points, dtype=float).reshape(-1, self.sources.shape[1])
+        ndim = self.sources.shape[1]
+        tri = Delaunay(self.sources)
+        simplex = tri.find_simplex(self.points)
+        self.inside = simplex >= 0
+        transform = tri.transform[simplex[self.inside]]
+        delta = self.points[self.inside] - transform[:, ndim]
+        bary = np.einsum('ijk,ik->ij', transform[:, :ndim], delta)
+        weights = np.c_[bary, 1. - bary.sum(axis=1)]
+        rows = np.repeat(np.flatnonzero(self.inside), ndim + 1)
+        self.matrix = sp.sparse.csr_matrix(
+            (weights.ravel(), (rows, tri.simplices[simplex[self.inside]].ravel())),
+            shape=(len(self.points), len(self.sources)))
+        # missing values propagate through the whole simplex, as in griddata
+        self._support = sp.sparse.csr_matrix(
+            (np.ones(len(rows)), (rows, tri.simplices[simplex[self.inside]].ravel())),
+            shape=self.matrix.shape)
+        self._fill = {}
+
+    def _nearest_valid(self, missing):
+        invalid = np.flatnonzero(~self.inside | (self._support @ missing.astype(float) > 0))
+        valid = np.flatnonzero(~missing)
+        if len(valid) == 0:
+            return invalid, None, True
+        _, nearest = cKDTree(self.sources[valid]).query(self.points[invalid])
+        return invalid, valid[nearest], True
+
+
+_triangulations = OrderedDict()
+_triangulations_lock = threading.Lock()
+
+def get_triangulation_interpolator(sources, points):
+    """Returns the TriangulationInterpolator of sources and points, keeping
+    the last ones built in memory."""
+    md5 = hashlib.md5()
+    for array in (sources, points):
+        array = np.ascontiguousarray(array, dtype=float)
+        md5.update(str(array.shape).encode())
+        md5.update(array.tobytes())
+    key = md5.hexdigest()
+    with _triangulations_lock:
+        if key not in _triangulations:
+            _triangulations[key] = TriangulationInterpolator(sources, points)
+            if len(_triangulations) > 32:
+                _triangulations.popitem(last=False)
+        _triangulations.move_to_end(key)
+        return _triangulations[key]
@@ -0,0 +1,111 @@
+"""Potential temperature of the HYCOM in-situ temperature.
+
+:func:`ptmp` is the UNESCO 1983 potential temperature of
+``seawater.ptmp``, evaluated in float32 with numpy. :func:`potential_temperature`
+applies it to HYCOM tiles: only the valid cells, optionally restricted to
+the cells used by an interpolator, are computed, and the pressure of the
+cells is read from a grid cached per depth vector.
+"""
+from collections import OrderedDict
+import hashlib
+import threading
+
+import numpy as np
+
+
+def T68conv(T90):
+    return T90 * np.float32(1.00024)
+
+
+def T90conv(t):
+    return t / np.float32(1.00024)
+
+
+def adtg(s, T68, p):
+    """Adiabatic temperature gradient [degC/db] of seawater.ptmp, as a
+    function of the IPTS-68 temperature."""
+    f = np.float32
+    return (
+        f(3.5803e-5)
+        + (f(8.5258e-6) + (f(-6.836e-8) + f(6.6228e-10) * T68) * T68) * T68
+        + (f(1.8932e-6) + f(-4.2393e-8) * T68) * (s - f(35.))
+        + ((f(1.8741e-8) + (f(-6.7795e-10) + (f(8.733e-12) + f(-5.4481e-14) * T68) * T68) * T68)
+           + (f(-1.1351e-10) + f(2.7759e-12) * T68) * (s - f(35.))) * p
+        + (f(-4.6206e-13) + (f(1.8676e-14) + f(-2.1687e-16) * T68) * T68) * p * p
+    )
+
+
+def ptmp(s, t, p, pr=0.):
+    """Potential temperature [degC, ITS-90] relative to pr of salinity s
+    [psu], in-situ temperature t [degC, ITS-90] and pressure p [db].
+
+    Same Runge-Kutta integration as seawater.ptmp, in float32.
+    """
+    s, t, p = (np.asarray(x, dtype=np.float32) for x in (s, t, p))
+    pr = np.float32(pr)
+    half = np.float32(0.5)
+    sqrt2 = np.float32(2 ** 0.5)
+
+    del_P = pr - p
+    del_th = del_P * adtg(s, T68conv(t), p)
+    th = T68conv(t) + half * del_th
+    q = del_th
+
+    del_th = del_P * adtg(s, th, p + half * del_P)
+    th = th + (1 - 1 / sqrt2) * (del_th - q)
+    q = (2 - sqrt2) * del_th + (-2 + 3 / sqrt2) * q
+
+    del_th = del_P * adtg(s, th, p + half * del_P)
+    th = th + (1 + 1 / sqrt2) * (del_th - q)
+    q = (2 + sqrt2) * del_th + (-2 - 3 / sqrt2) * q
+
+    del_th = del_P * adtg(s, th, p + del_P)
+    return T90conv(th + (del_th - 2 * q) / np.float32(6.))
+
+
+_pressures = OrderedDict()
+_pressures_lock = threading.Lock()
+
+
+def get_pressure(dep, shape):
+    """Returns the flat float32 pressure [db] of the cells of a (depth, lat,
+    lon) or (time, depth, lat, lon) grid of the given shape.
+
+    The depth in meters is used as the pressure in decibars, as HYCOM
+    potential temperatures have always been computed here. The last grids
+    are cached, since every day of a run has the same depth vector and
+    subset shape.
+    """
+    dep = np.asarray(dep, dtype=np.float32)
+    key = (hashlib.md5(dep.tobytes()).hexdigest(), tuple(shape))
+    with _pressures_lock:
+        if key not in _pressures:
+            pres = np.tile(np.repeat(dep, int(np.prod(shape[-2:]))), int(np.prod(shape[:-3])))
+            pres.flags.writeable = False
+            _pressures[key] = pres
+            if len(_pressures) > 4:
+                _pressures.popitem(last=False)
+        _pressures.move_to_end(key)
+        return _pressures[key]
+
+
+def potential_temperature(salt, temp, dep, cells=None):
+    """Returns the potential temperature of HYCOM salt and temp, of shape
+    (depth, lat, lon) or (time, depth, lat, lon), as float32.
+
+    Cells where salt or temp is masked, nan or a fill value (larger than
+    10000 in magnitude) are nan. If cells, the flat indexes of the cells
+    that are used, is given, the other cells are nan too.
+    """
+    shape = np.shape(temp)
+    pres = get_pressure(dep, shape)
+    salt = np.ma.filled(np.ma.asarray(salt, dtype=np.float32), np.nan).reshape(-1)
+    temp = np.ma.filled(np.ma.asarray(temp, dtype=np.float32), np.nan).reshape(-1)
+    if cells is None:
+        cells = np.flatnonzero((np.abs(salt) <= 10000) & (np.abs(temp) <= 10000))
+    else:
+        cells = np.asarray(cells)
+        cells = cells[(np.abs(salt[cells]) <= 10000) & (np.abs(temp[cells]) <= 10000)]
+    out = np.full(salt.size, np.nan, dtype=np.float32)
+    out[cells] = ptmp(salt[cells], temp[cells], pres[cells]) * np.float32(1.00024)
+    return out.reshape(shape)
@@ -1,3 +1,4 @@
+import hashlib
 import os
 import sys
 from datetime import datetime,timedelta
@@ -8,44 +9,34 @@ import subprocess
 import shutil
 from typing import Union
 from time import time
-import glob
 
+import appdirs
 import numpy as np
-import scipy as sp
 from numba import jit, prange
 import netCDF4 as nc
 from netCDF4 import Dataset
 import pandas as pd
-import xarray as xr
 from matplotlib.transforms import Bbox
 import seawater as sw
 
-from pyschism.mesh.base import Nodes, Elements
+from pyschism.mesh.base import Nodes, Elements, transform_ll_to_cpp
 from pyschism.mesh.vgrid import Vgrid
-from pyschism.forcing.hycom.hycom2schism import Nudge
+from pyschism.forcing.bctides.ncwriter import NuNcWriter, ThNcWriter
+from pyschism.forcing.hycom.hycom2schism import Nudge, interp_to_points_2d, interp_to_points_3d
 
 logger = logging.getLogger(__name__)
 
-def get_idxs(date, ds, bbox):
+RTOFS_BASEURL = 'http://nomads.ncep.noaa.gov:80/dods/rtofs/rtofs_global'
 
-    time1=ds['time']
-    times=nc.num2date(time1,units=time1.units,only_use_cftime_datetimes=False)
-    
-    lon=ds['lon'][:]
-    lat=ds['lat'][:]
-    lat_idxs=np.where((lat>=bbox.ymin-2.0)&(lat<=bbox.ymax+2.0))[0]
-    lon_idxs=np.where((lon>=bbox.xmin-2.0) & (lon<=bbox.xmax+2.0))[0]
-    lon=lon[lon_idxs]
-    lat=lat[lat_idxs]
-    lon_idx1=lon_idxs[0].item()
-    lon_idx2=lon_idxs[-1].item()
-    lat_idx1=lat_idxs[0].item()
-    lat_idx2=lat_idxs[-1].item()
-    
-    for ilon in np.arange(len(lon)):
-        if lon[ilon] > 180:
-            lon[ilon] = lon[ilon]-360.
-    x2, y2=transform_ll_to_cpp(lon, lat)
+RTOFS_AGGREGATIONS = {
+    'ssh': 'rtofs_glo_2ds_forecast_3hrly_diag',
+    'salinity': 'rtofs_glo_3dz_forecast_daily_salt',
+    'temperature': 'rtofs_glo_3dz_forecast_daily_temp',
+    'u': 'rtofs_glo_3dz_forecast_daily_uvel',
+    'v': 'rtofs_glo_3dz_forecast_daily_vvel',
+}
+
+def get_time_idx(times, date):
 
     idxs=np.where( date == times)[0]
     #check if time_idx is empty
@@ -65,66 +56,170 @@ def get_idxs(date, ds, bbox):
     time_idx=idxs.item()  
     logger.info(f'time_idx is {time_idx}')
 
-    return time_idx, lon_idx1, lon_idx2, lat_idx1, lat_idx2, x2, y2
+    return time_idx
 
-def get_idxs2(date, ds):
+def get_window(lon, lat, bbox):
+    """Returns the lon and lat index slices of bbox, with a margin of 2 degrees."""
+    lat_idxs=np.where((lat>=bbox.ymin-2.0)&(lat<=bbox.ymax+2.0))[0]
+    lon_idxs=np.where((lon>=bbox.xmin-2.0) & (lon<=bbox.xmax+2.0))[0]
+    return slice(lon_idxs[0].item(), lon_idxs[-1].item()+1), slice(lat_idxs[0].item(), lat_idxs[-1].item()+1)
 
-    times = pd.to_datetime(ds['time'])
-    #times=nc.num2date(time1,units=time1.units,only_use_cftime_datetimes=False)
-    idxs=np.where( date == times)[0]
-    time_idx=idxs.item()  
+def get_idxs(date, ds, bbox):
+
+    time1=ds['time']
+    times=nc.num2date(time1,units=time1.units,only_use_cftime_datetimes=False)
 
-    #lon=ds['lon'][:]
-    #lat=ds['lat'][:]
-    lon=ds.lon.values
-    lat=ds.lat.values
-    for ilon in np.arange(len(lon)):
-        if lon[ilon] > 180:
-            lon[ilon] = lon[ilon]-360.
+    lon_idxs, lat_idxs = get_window(ds['lon'][:], ds['lat'][:], bbox)
+    lon=ds['lon'][lon_idxs]
+    lat=ds['lat'][lat_idxs]
+    lon[lon > 180] -= 360.
     x2, y2=transform_ll_to_cpp(lon, lat)
 
-    return time_idx, x2, y2
-
-def transform_ll_to_cpp(lon, lat, lonc=-77.07, latc=24.0):
-    longitude=lon/180*np.pi
-    latitude=lat/180*np.pi
-    radius=6378206.4
-    loncc=lonc/180*np.pi
-    latcc=latc/180*np.pi
-    lon_new=[radius*(longitude[i]-loncc)*np.cos(latcc) for i in np.arange(len(longitude))]
-    lat_new=[radius*latitude[i] for i in np.arange(len(latitude))]
-
-    return np.array(lon_new), np.array(lat_new)
-
-def interp_to_points_3d(dep, y2, x2, bxyz, val):
-    idxs = np.where(abs(val) > 10000)
-    val[idxs] = float('nan')
-
-    val_fd = sp.interpolate.RegularGridInterpolator((dep,y2,x2),np.squeeze(val),'linear', bounds_error=False, fill_value = float('nan'))
-    val_int = val_fd(bxyz)
-    idxs = np.isnan(val_int)
-    if np.sum(idxs) != 0:
-        val_int[idxs] = sp.interpolate.griddata(bxyz[~idxs,:], val_int[~idxs], bxyz[idxs,:],'nearest')
-    idxs = np.isnan(val_int)
-    if np.sum(idxs) != 0:
-        logger.info(f'There is still missing value for {val}')
-        sys.exit()
-    return val_int
-
-def interp_to_points_2d(y2, x2, bxy, val):
-    idxs = np.where(abs(val) > 10000)
-    val[idxs] = float('nan')
-
-    val_fd = sp.interpolate.RegularGridInterpolator((y2,x2),np.squeeze(val),'linear', bounds_error=False, fill_value = float('nan'))
-    val_int = val_fd(bxy)
-    idxs = np.isnan(val_int)
-    if np.sum(idxs) != 0:
-        val_int[idxs] = sp.interpolate.griddata(bxy[~idxs,:], val_int[~idxs], bxy[idxs,:],'nearest')
-    idxs = np.isnan(val_int)
-    if np.sum(idxs) != 0:
-        logger.info(f'There is still missing value for {val}')
-        sys.exit()
-    return val_int
+    time_idx = get_time_idx(times, date)
+
+    return time_idx, lon_idxs.start, lon_idxs.stop-1, lat_idxs.start, lat_idxs.stop-1, x2, y2
+
+def read_records(var, time_idxs, *index):
+    """Reads the time records time_idxs of var in a single request.
+
+    Evenly spaced records are read as one strided slice, other records as
+    the contiguous slab that contains them.
+    """
+    time_idxs = np.asarray(time_idxs)
+    steps = np.diff(time_idxs)
+    if len(time_idxs) > 1 and steps[0] > 0 and np.all(steps == steps[0]):
+        return var[(slice(time_idxs[0], time_idxs[-1]+1, steps[0].item()), *index)]
+    slab = var[(slice(time_idxs.min(), time_idxs.max()+1), *index)]
+    return slab[time_idxs - time_idxs.min()]
+
+def open_staged(path):
+    """Opens a file staged by RtofsInventory and returns the dataset with
+    its projected lon/lat axes."""
+    ds = Dataset(path)
+    lon = ds['lon'][:]
+    lon[lon > 180] -= 360.
+    x2, y2 = transform_ll_to_cpp(lon, ds['lat'][:])
+    return ds, x2, y2
+
+class RtofsInventory:
+    """Stages the RTOFS forecast of a run over a bbox in one local file.
+
+    Each RTOFS aggregation is opened once, its lon/lat index window is
+    derived from the bbox of the points, and the records of all the days
+    are read in one request per variable. The staged file has the
+    variables ssh, salinity, temperature, u and v over the axes time, lev,
+    lat and lon, one record per day. A staged file of the same forecast
+    cycle that covers the bbox, the days and the variables is read instead
+    of downloading again, so the boundary, nudging and initial condition
+    generators of a run can all read the file staged by DownloadRTOFS.
+
+    Args:
+        lon, lat: Coordinates of the points to cover.
+        dates: Daily dates of the run, the first one being the forecast
+            cycle.
+        variables: Names of the RTOFS variables to stage, all by default.
+        cache: Directory of the staged files. True uses the user cache
+            directory and False or None a temporary directory.
+    """
+
+    def __init__(self, lon, lat, dates, variables=None, cache: Union[str, os.PathLike, bool, None] = True):
+        xmin, xmax = np.min(lon), np.max(lon)
+        ymin, ymax = np.min(lat), np.max(lat)
+        # convert hgrid lon [180, 180) to [0, 360)
+        xmin = xmin + 360. if xmin < 0 else xmin
+        xmax = xmax + 360. if xmax < 0 else xmax
+        self.bbox = Bbox.from_extents(xmin, ymin, xmax, ymax)
+        self.dates = list(pd.to_datetime(dates).to_pydatetime())
+        self.variables = list(RTOFS_AGGREGATIONS if variables is None else variables)
+        self.cache = cache
+
+    @property
+    def cache(self):
+        return self._cache
+
+    @cache.setter
+    def cache(self, cache: Union[str, os.PathLike, bool, None]):
+        if cache is None or cache is False:
+            self._tmpdir = tempfile.TemporaryDirectory()
+            self._cache = pathlib.Path(self._tmpdir.name)
+        elif cache is True:
+            self._cache = pathlib.Path(appdirs.user_cache_dir('pyschism/rtofs'))
+        elif isinstance(cache, (str, os.PathLike)):
+            self._cache = pathlib.Path(cache)
+        else:
+            raise TypeError(
+                f"Unhandled argument cache={cache} of type {type(cache)}.")
+        self._cache.mkdir(exist_ok=True, parents=True)
+
+    @property
+    def cycle(self):
+        return self.dates[0]
+
+    def get_url(self, variable):
+        return f'{RTOFS_BASEURL}{self.cycle.strftime("%Y%m%d")}/{RTOFS_AGGREGATIONS[variable]}'
+
+    def find(self):
+        """Returns a staged file that covers this inventory, or None."""
+        for path in sorted(self.cache.glob(f'rtofs_{self.cycle.strftime("%Y%m%d")}_*.nc')):
+            with Dataset(path) as ds:
+                xmin, ymin, xmax, ymax = ds.getncattr('extents')
+                if xmin <= self.bbox.xmin and ymin <= self.bbox.ymin \
+                        and xmax >= self.bbox.xmax and ymax >= self.bbox.ymax \
+                        and len(ds['time']) >= len(self.dates) \
+                        and all(variable in ds.variables for variable in self.variables):
+                    return path
+
+    def stage(self):
+        """Returns the staged file, downloading it if needed."""
+        path = self.find()
+        if path is not None:
+            logger.info(f'Reading staged RTOFS data from {path}')
+            return path
+        key = f'{self.cycle}|{self.bbox.extents}|{len(self.dates)}|{",".join(self.variables)}'
+        path = self.cache / f'rtofs_{self.cycle.strftime("%Y%m%d")}_{hashlib.md5(key.encode()).hexdigest()[:12]}.nc'
+        tmp = path.parent / f'.{path.name}.{os.getpid()}'
+        t0 = time()
+        with Dataset(tmp, 'w', format='NETCDF4') as dst:
+            for variable in self.variables:
+                url = self.get_url(variable)
+                logger.info(f'Staging {variable} from {url}')
+                with Dataset(url) as src:
+                    time1 = src['time']
+                    times = nc.num2date(time1[:], units=time1.units, only_use_cftime_datetimes=False)
+                    #It seems that salt=0 at time_idx=0 in rtofs, use the next record
+                    time_idxs = [get_time_idx(times, date) + 1 for date in self.dates]
+                    lon_idxs, lat_idxs = get_window(src['lon'][:], src['lat'][:], self.bbox)
+                    if 'time' not in dst.dimensions:
+                        self._create_axes(dst, src, lon_idxs, lat_idxs)
+                    elif not np.array_equal(dst['lon'][:], src['lon'][lon_idxs]) \
+                            or not np.array_equal(dst['lat'][:], src['lat'][lat_idxs]):
+                        raise ValueError(f'The grid of {url} differs from the grid of the other RTOFS variables.')
+                    if variable != 'ssh' and 'lev' not in dst.dimensions:
+                        dst.createDimension('lev', len(src['lev']))
+                        dst.createVariable('lev', 'f8', ('lev',))[:] = src['lev'][:]
+                    if variable == 'ssh':
+                        values = read_records(src[variable], time_idxs, 0, lat_idxs, lon_idxs)
+                        dims = ('time', 'lat', 'lon')
+                    else:
+                        values = read_records(src[variable], time_idxs, slice(None), lat_idxs, lon_idxs)
+                        dims = ('time', 'lev', 'lat', 'lon')
+                    attrs = {k: src[variable].getncattr(k) for k in src[variable].ncattrs() if k not in ('_FillValue', 'missing_value')}
+                out = dst.createVariable(variable, 'f4', dims, zlib=True, fill_value=1.e30)
+                out.setncatts(attrs)
+                out[:] = values
+            dst.setncattr('extents', np.array(self.bbox.extents))
+        os.replace(tmp, path)
+        logger.info(f'Staging RTOFS data to {path} took {time()-t0} seconds')
+        return path
+
+    def _create_axes(self, dst, src, lon_idxs, lat_idxs):
+        dst.createDimension('time', None)
+        time1 = dst.createVariable('time', 'f8', ('time',))
+        time1.units = f'days since {self.cycle.strftime("%Y-%m-%d %H:%M:%S")}'
+        time1[:] = nc.date2num(self.dates, time1.units)
+        for name, values in [('lat', src['lat'][lat_idxs]), ('lon', src['lon'][lon_idxs])]:
+            dst.createDimension(name, len(values))
+            dst.createVariable(name, 'f8', (name,))[:] = values
 
 class OpenBoundaryInventory:
 
@@ -132,7 +227,15 @@ class OpenBoundaryInventory:
         self.hgrid = hgrid
         self.vgrid = Vgrid.default() if vgrid is None else vgrid
 
-    def fetch_data(self, outdir: Union[str, os.PathLike], start_date, rnday, elev2D=True, TS=True, UV=True, adjust2D=False, lats=None, msl_shifts=None, cached=False): 
+    def fetch_data(self, outdir: Union[str, os.PathLike], start_date, rnday, elev2D=True, TS=True, UV=True, adjust2D=False, lats=None, msl_shifts=None, cached=False, cache=True, zlib=False): 
+        """Writes the *.th.nc boundary files from the RTOFS forecast of
+        start_date.
+
+        The forecast is staged by RtofsInventory in the cache directory;
+        cached=True reads the file staged by DownloadRTOFS in the current
+        directory.
+        """
+        dst_elev = dst_salt = dst_temp = dst_uv = None
         outdir = pathlib.Path(outdir)
 
         self.start_date = start_date
@@ -164,248 +267,76 @@ class OpenBoundaryInventory:
             nvrt=zcor.shape[1]
 
         #create netcdf
-        ntimes=self.rnday+1
-        nComp1=1
-        nComp2=2
-        one=1
-        ndt=np.zeros([ntimes])
-
         if elev2D:
-            timeseries_el=np.zeros([ntimes,NOP,nComp1])
-            #create netcdf 
-            dst_elev = Dataset(outdir / 'elev2D.th.nc', 'w', format='NETCDF4')
-            #dimensions
-            dst_elev.createDimension('nOpenBndNodes', NOP)
-            dst_elev.createDimension('one', one)
-            dst_elev.createDimension('time', None)
-            dst_elev.createDimension('nLevels', one)
-            dst_elev.createDimension('nComponents', nComp1)
-
-            #variables
-            dst_elev.createVariable('time_step', 'f', ('one',))
-            dst_elev['time_step'][:] = 86400
-
-            dst_elev.createVariable('time', 'f', ('time',))
-            #dst_elev['time'][:] = ndt
-
-            dst_elev.createVariable('time_series', 'f', ('time', 'nOpenBndNodes', 'nLevels', 'nComponents'))
-            #dst_elev['time_series'][:,:,:,:] = timeseries_el
-
+            dst_elev = ThNcWriter(outdir / 'elev2D.th.nc', NOP, zlib=zlib)
         if TS:
-            #timeseries_s=np.zeros([ntimes,NOP,nvrt,nComp1])
-            dst_salt = Dataset(outdir / 'SAL_3D.th.nc', 'w', format='NETCDF4')
-            #dimensions
-            dst_salt.createDimension('nOpenBndNodes', NOP)
-            dst_salt.createDimension('one', one)
-            dst_salt.createDimension('time', None)
-            dst_salt.createDimension('nLevels', nvrt)
-            dst_salt.createDimension('nComponents', nComp1)
-            #variables
-            dst_salt.createVariable('time_step', 'f', ('one',))
-            dst_salt['time_step'][:] = 86400
-
-            dst_salt.createVariable('time', 'f', ('time',))
-            #dst_salt['time'][:] = ndt
-
-            dst_salt.createVariable('time_series', 'f', ('time', 'nOpenBndNodes', 'nLevels', 'nComponents'))
-
-            #temp
-            timeseries_t=np.zeros([ntimes,NOP,nvrt,nComp1])
-
-            dst_temp =  Dataset(outdir / 'TEM_3D.th.nc', 'w', format='NETCDF4')
-            #dimensions
-            dst_temp.createDimension('nOpenBndNodes', NOP)
-            dst_temp.createDimension('one', one)
-            dst_temp.createDimension('time', None)
-            dst_temp.createDimension('nLevels', nvrt)
-            dst_temp.createDimension('nComponents', nComp1)
-            #variables
-            dst_temp.createVariable('time_step', 'f', ('one',))
-            dst_temp['time_step'][:] = 86400
-
-            dst_temp.createVariable('time', 'f', ('time',))
-            #dst_temp['time'][:] = ndt
-
-            dst_temp.createVariable('time_series', 'f', ('time', 'nOpenBndNodes', 'nLevels', 'nComponents'))
-            #dst_temp['time_series'][:,:,:,:] = timeseries_t
+            dst_salt = ThNcWriter(outdir / 'SAL_3D.th.nc', NOP, nvrt, zlib=zlib)
+            dst_temp = ThNcWriter(outdir / 'TEM_3D.th.nc', NOP, nvrt, zlib=zlib)
+        if UV:
+            dst_uv = ThNcWriter(outdir / 'uv3D.th.nc', NOP, nvrt, 2, zlib=zlib)
 
+        variables = ['ssh'] if elev2D else []
+        if TS:
+            variables.extend(['salinity', 'temperature'])
         if UV:
-            #timeseries_uv=np.zeros([ntimes,NOP,nvrt,nComp2])
-            dst_uv = Dataset(outdir / 'uv3D.th.nc', 'w', format='NETCDF4')
-            #dimensions
-            dst_uv.createDimension('nOpenBndNodes', NOP)
-            dst_uv.createDimension('one', one)
-            dst_uv.createDimension('time', None)
-            dst_uv.createDimension('nLevels', nvrt)
-            dst_uv.createDimension('nComponents', nComp2)
-            #variables
-            dst_uv.createVariable('time_step', 'f', ('one',))
-            dst_uv['time_step'][:] = 86400
-
-            dst_uv.createVariable('time', 'f', ('time',))
-            #dst_uv['time'][:] = ndt
-            
-            dst_uv.createVariable('time_series', 'f', ('time', 'nOpenBndNodes', 'nLevels', 'nComponents'))
-            #dst_uv['time_series'][:,:,:,:] = timeseries_uv
-
-        if cached:
-            logger.info('**** Use cached data*****')
-            files = glob.glob('rtofs_*.nc')
-            files.sort()
-            ncfiles = files[-9:]
-            logger.info(f'files are {ncfiles}')
+            variables.extend(['u', 'v'])
+        inventory = RtofsInventory(blon, blat, self.timevector, variables, '.' if cached else cache)
+        logger.info('**** Accessing RTOFS data*****')
+        ds, x2, y2 = open_staged(inventory.stage())
+        if TS or UV:
+            dep = ds['lev'][:]
 
-        else:
-            logger.info('**** Accessing RTOFS data*****')
-            baseurl = f'http://nomads.ncep.noaa.gov:80/dods/rtofs/rtofs_global'
+        #points of each open boundary
+        boundaries = []
+        ind2 = 0
+        for boundary in gdf.itertuples():
+            opbd = list(boundary.indexes)
+            ind1 = ind2
+            ind2 = ind1 + len(opbd)
+            xi,yi = transform_ll_to_cpp(self.hgrid.coords[opbd,0], self.hgrid.coords[opbd,1])
+            bxy = np.c_[yi, xi]
+            bxyz = zcor2 = None
+            if TS or UV:
+                zcor2=zcor[opbd,:]
+                idxs=np.where(zcor2 > 5500)
+                zcor2[idxs]=5500.0-1.0e-6
+
+                #construct schism grid
+                x2i=np.tile(xi,[nvrt,1]).T
+                y2i=np.tile(yi,[nvrt,1]).T
+                bxyz=np.c_[zcor2.reshape(np.size(zcor2)),y2i.reshape(np.size(y2i)),x2i.reshape(np.size(x2i))]
+            boundaries.append((ind1, ind2, self.hgrid.coords[opbd,1], bxy, bxyz, zcor2))
 
         t0=time()
         for it, date in enumerate(self.timevector):
-            logger.info(f'Fetching data for {date}')
-
-            #loop over each open boundary
-            ind1 = 0
-            ind2 = 0
-            for boundary in gdf.itertuples():
-
-                opbd = list(boundary.indexes)
-                ind1 = ind2
-                ind2 = ind1 + len(opbd)
-                blon = self.hgrid.coords[opbd,0]
-                blat = self.hgrid.coords[opbd,1]
-                xi,yi = transform_ll_to_cpp(blon, blat)
-                bxy = np.c_[yi, xi]
+            logger.info(f'Interpolating data for {date}')
 
-                if TS or UV:
-                    zcor2=zcor[opbd,:]
-                    idxs=np.where(zcor2 > 5500)
-                    zcor2[idxs]=5500.0-1.0e-6
-
-                    #construct schism grid
-                    x2i=np.tile(xi,[nvrt,1]).T
-                    y2i=np.tile(yi,[nvrt,1]).T
-                    bxyz=np.c_[zcor2.reshape(np.size(zcor2)),y2i.reshape(np.size(y2i)),x2i.reshape(np.size(x2i))]
-
-                xmin, xmax = np.min(blon), np.max(blon)
-                ymin, ymax = np.min(blat), np.max(blat)
-
-                # convert hgrid lon [180, 180) to [0, 360)
-                xmin = xmin + 360. if xmin < 0 else xmin
-                xmax = xmax + 360. if xmax < 0 else xmax
-                bbox = Bbox.from_extents(xmin, ymin, xmax, ymax)
-                logger.info(f'xmin is {xmin}, xmax is {xmax}')
-
-                logger.info('****Interpolation starts****')
-
-                #ndt[it]=it*24*3600.
+            for ind1, ind2, blat, bxy, bxyz, zcor2 in boundaries:
 
                 if elev2D:
-                    #ssh
-                    if cached:
-                        ds = xr.open_mfdataset(ncfiles, decode_timedelta=True)
-                        time_idx, x2, y2 = get_idxs2(date, ds)
-                        logger.info(f'ssh: time_idx for {date} is {time_idx}')
-                        ssh = ds.ssh.values[time_idx, :, :]
-
-                    else:
-                        ssh_url = f'{baseurl}{self.start_date.strftime("%Y%m%d")}/rtofs_glo_2ds_forecast_3hrly_diag'
-                        ds = Dataset(ssh_url)
-                        logger.info(f'ssh_url is {ssh_url}')
-                        time_idx, lon_idx1, lon_idx2, lat_idx1, lat_idx2, x2, y2 = get_idxs(date, ds, bbox)
-                        ssh = np.squeeze(ds['ssh'][time_idx+1,0,lat_idx1:lat_idx2+1,lon_idx1:lon_idx2+1])
-
-                    ssh_int = interp_to_points_2d(y2, x2, bxy, ssh)
-                    dst_elev['time'][it] = it*24*3600.
+                    ssh_int = interp_to_points_2d(y2, x2, bxy, ds['ssh'][it])
                     if adjust2D:
-                        elev_adjust = np.interp(blat, lats, msl_shifts)
-                        dst_elev['time_series'][it,ind1:ind2,0,0] = ssh_int + elev_adjust
-                    else:
-                        dst_elev['time_series'][it,ind1:ind2,0,0] = ssh_int 
-                    ds.close()
+                        ssh_int = ssh_int + np.interp(blat, lats, msl_shifts)
+                    dst_elev.write(it, ssh_int, it*24*3600., offset=ind1)
 
                 if TS:
-                    #salt
-                    if cached:
-                        ds = xr.open_mfdataset(ncfiles, decode_timedelta=True)
-                        time_idx, x2, y2 = get_idxs2(date, ds)
-                        logger.info(f'salinity: time_idx for {date} is {time_idx}')
-                        salt = ds.salinity.values[time_idx,:,:,:]
-                    else:
-                        salt_url = f'{baseurl}{self.start_date.strftime("%Y%m%d")}/rtofs_glo_3dz_forecast_daily_salt'
-                        ds = Dataset(salt_url)
-                        logger.info(f'salt_url is {salt_url}')
-                        time_idx, lon_idx1, lon_idx2, lat_idx1, lat_idx2, x2, y2 = get_idxs(date, ds, bbox)
-                        salt = np.squeeze(ds['salinity'][time_idx+1,:,lat_idx1:lat_idx2+1,lon_idx1:lon_idx2+1])
-                    dep = ds['lev'][:]
-
-                    salt_int = interp_to_points_3d(dep, y2, x2, bxyz, salt)
-                    salt_int = salt_int.reshape(zcor2.shape)
-                    #timeseries_s[it,:,:,0]=salt_int
-                    dst_salt['time'][it] = it*24*3600.
-                    dst_salt['time_series'][it,ind1:ind2,:,0] = salt_int
-
-                    ds.close()
-
-                    #temp
-                    if cached:
-                        ds = xr.open_mfdataset(ncfiles, decode_timedelta=True)
-                        time_idx, x2, y2 = get_idxs2(date, ds)
-                        logger.info(f'temperature: time_idx for {date} is {time_idx}')
-                        temp = ds.temperature.values[time_idx,:,:,:]
-                    else:
-                        temp_url = f'{baseurl}{self.start_date.strftime("%Y%m%d")}/rtofs_glo_3dz_forecast_daily_temp'
-                        ds = Dataset(temp_url)
-                        logger.info(f'temp_url is {temp_url}')
-                        temp = np.squeeze(ds['temperature'][time_idx+1,:,lat_idx1:lat_idx2+1,lon_idx1:lon_idx2+1])
-                    dep = ds['lev'][:]
-
-                    temp_int = interp_to_points_3d(dep, y2, x2, bxyz, temp)
-                    temp_int = temp_int.reshape(zcor2.shape)
-                    #timeseries_t[it,:,:,0]=temp_int
-                    dst_temp['time'][it] = it*24*3600.
-                    dst_temp['time_series'][it,ind1:ind2,:,0] = temp_int
+                    salt_int = interp_to_points_3d(dep, y2, x2, bxyz, ds['salinity'][it])
+                    dst_salt.write(it, salt_int.reshape(zcor2.shape), it*24*3600., offset=ind1)
 
-                    ds.close()
+                    temp_int = interp_to_points_3d(dep, y2, x2, bxyz, ds['temperature'][it])
+                    dst_temp.write(it, temp_int.reshape(zcor2.shape), it*24*3600., offset=ind1)
 
                 if UV:
-                    if cached:
-                        ds = xr.open_mfdataset(ncfiles, decode_timedelta=True)
-                        time_idx, x2, y2 = get_idxs2(date, ds)
-                        logger.info(f'uvel: time_idx for {date} is {time_idx}')
-                        uvel = ds.u.values[time_idx,:,:,:]
-                    else:
-                        uvel_url = f'{baseurl}{self.start_date.strftime("%Y%m%d")}/rtofs_glo_3dz_forecast_daily_uvel'
-                        ds = Dataset(uvel_url)
-                        logger.info(f'uvel_url is {uvel_url}')
-                        time_idx, lon_idx1, lon_idx2, lat_idx1, lat_idx2, x2, y2 = get_idxs(date, ds, bbox)
-                        uvel = np.squeeze(ds['u'][time_idx+1,:,lat_idx1:lat_idx2+1,lon_idx1:lon_idx2+1])
-                    dep = ds['lev'][:]
-
-                    dst_uv['time'][it] = it*24*3600.
-                    #uvel
-                    uvel_int = interp_to_points_3d(dep, y2, x2, bxyz, uvel)
-                    uvel_int = uvel_int.reshape(zcor2.shape)
-                    dst_uv['time_series'][it,ind1:ind2,:,0] = uvel_int
-                    ds.close()
-
-                    #vvel
-                    if cached:
-                        ds = xr.open_mfdataset(ncfiles, decode_timedelta=True)
-                        time_idx, x2, y2 = get_idxs2(date, ds)
-                        logger.info(f'vvel: time_idx for {date} is {time_idx}')
-                        vvel = ds.v.values[time_idx,:,:,:]
-                    else:
-                        vvel_url = f'{baseurl}{self.start_date.strftime("%Y%m%d")}/rtofs_glo_3dz_forecast_daily_vvel'
-                        ds = Dataset(vvel_url)
-                        logger.info(f'vvel_url is {vvel_url}')
-                        vvel = np.squeeze(ds['v'][time_idx+1,:,lat_idx1:lat_idx2+1,lon_idx1:lon_idx2+1])
-                    dep = ds['lev'][:]
+                    uvel_int = interp_to_points_3d(dep, y2, x2, bxyz, ds['u'][it])
+                    dst_uv.write(it, uvel_int.reshape(zcor2.shape), it*24*3600., offset=ind1, component=0)
 
-                    vvel_int = interp_to_points_3d(dep, y2, x2, bxyz, vvel)
-                    vvel_int = vvel_int.reshape(zcor2.shape)
-                    dst_uv['time_series'][it,ind1:ind2,:,1] = vvel_int
-                    #timeseries_uv[it,:,:,1]=vvel_int
+                    vvel_int = interp_to_points_3d(dep, y2, x2, bxyz, ds['v'][it])
+                    dst_uv.write(it, vvel_int.reshape(zcor2.shape), offset=ind1, component=1)
 
+        ds.close()
+        for dst in [dst_elev, dst_salt, dst_temp, dst_uv]:
+            if dst is not None:
+                dst.close()
         logger.info(f'Writing *th.nc takes {time()-t0} seconds')
 
 class NudgeTS:
@@ -413,7 +344,7 @@ class NudgeTS:
     def __init__(self):
         pass
 
-    def fetch_data(self, outdir: Union[str, os.PathLike], hgrid, vgrid, start_date, rnday, include, cached=False):
+    def fetch_data(self, outdir: Union[str, os.PathLike], hgrid, vgrid, start_date, rnday, include, cached=False, cache=True, zlib=False):
 
         outdir = pathlib.Path(outdir)
 
@@ -423,10 +354,6 @@ class NudgeTS:
         vd = Vgrid.open(vgrid)
         sigma = vd.sigma
 
-        #get coords of SCHISM
-        loni=hgrid.nodes.coords[:,0]
-        lati=hgrid.nodes.coords[:,1]
-
         #get bathymetry
         depth = hgrid.values
 
@@ -438,7 +365,6 @@ class NudgeTS:
         nlon = hgrid.coords[include, 0]
         nlat = hgrid.coords[include, 1]
         xi,yi = transform_ll_to_cpp(nlon, nlat)
-        bxy = np.c_[yi, xi]
 
         zcor2=zcor[include,:]
         idxs=np.where(zcor2 > 5500)
@@ -450,187 +376,42 @@ class NudgeTS:
         bxyz=np.c_[zcor2.reshape(np.size(zcor2)),y2i.reshape(np.size(y2i)),x2i.reshape(np.size(x2i))]
         logger.info('Computing SCHISM zcor is done!')
 
-        #allocate output variables
-        nNode=len(include)
-        one=1
-        ntimes=rnday+1
-
-        timeseries_s=np.zeros([ntimes,nNode,nvrt,one])
-        timeseries_t=np.zeros([ntimes,nNode,nvrt,one])
-        ndt=np.zeros([ntimes])
+        #create netcdf, written one day at a time
+        dst_salt = NuNcWriter(outdir / 'SAL_nu.nc', include, nvrt, zlib=zlib)
+        dst_temp = NuNcWriter(outdir / 'TEM_nu.nc', include, nvrt, zlib=zlib)
 
-
-        xmin, xmax = np.min(nlon), np.max(nlon)
-        ymin, ymax = np.min(nlat), np.max(nlat)
-
-        # convert hgrid lon [180, 180) to [0, 360)
-        xmin = xmin + 360. if xmin < 0 else xmin
-        xmax = xmax + 360. if xmax < 0 else xmax
-        bbox = Bbox.from_extents(xmin, ymin, xmax, ymax)
-        logger.info(f'xmin is {xmin}, xmax is {xmax}')
-
-        if cached:
-            logger.info('**** Use cached data*****')
-            files = glob.glob('rtofs_*.nc')
-            files.sort()
-            ncfiles = files[-9:]
-            logger.info(f'files are {ncfiles}')
-        else:
-            logger.info('**** Accessing RTOFS data*****')
-            baseurl = f'http://nomads.ncep.noaa.gov:80/dods/rtofs/rtofs_global'
+        inventory = RtofsInventory(nlon, nlat, timevector, ['salinity', 'temperature'], '.' if cached else cache)
+        logger.info('**** Accessing RTOFS data*****')
+        ds, x2, y2 = open_staged(inventory.stage())
+        dep = ds['lev'][:]
 
         t0=time()
         for it, date in enumerate(timevector):
 
-            logger.info(f'Fetching data for {date}')
-
-            ndt[it]=it
-             
-            #salt
-            if cached:
-                ds = xr.open_mfdataset(ncfiles, decode_timedelta=True)
-                time_idx, x2, y2 = get_idxs2(date, ds)
-                salt = ds.salinity.values[time_idx,:,:,:]
-            else:
-                salt_url = f'{baseurl}{start_date.strftime("%Y%m%d")}/rtofs_glo_3dz_forecast_daily_salt'
-                ds = Dataset(salt_url)
-                time_idx, lon_idx1, lon_idx2, lat_idx1, lat_idx2, x2, y2 = get_idxs(date, ds, bbox)
-                #It seems that salt=0 at time_idx=0 in rtofs 
-                salt = np.squeeze(ds['salinity'][time_idx+1,:,lat_idx1:lat_idx2+1,lon_idx1:lon_idx2+1])
-            dep = ds['lev'][:]
-
-            salt_int = interp_to_points_3d(dep, y2, x2, bxyz, salt)
-            salt_int = salt_int.reshape(zcor2.shape)
-            #timeseries_s[it,:,:,0]=salt_int
-            timeseries_s[it,:,:,0] = salt_int
+            logger.info(f'Interpolating data for {date}')
 
-            ds.close()
+            salt_int = interp_to_points_3d(dep, y2, x2, bxyz, ds['salinity'][it])
+            dst_salt.write(it, salt_int.reshape(zcor2.shape), it)
 
-            #temp
-            if cached:
-                ds = xr.open_mfdataset(ncfiles, decode_timedelta=True)
-                time_idx, x2, y2 = get_idxs2(date, ds)
-                temp = ds.temperature.values[time_idx,:,:,:]
-            else:
-                temp_url = f'{baseurl}{start_date.strftime("%Y%m%d")}/rtofs_glo_3dz_forecast_daily_temp'
-                ds = Dataset(temp_url)
-                temp = np.squeeze(ds['temperature'][time_idx+1,:,lat_idx1:lat_idx2+1,lon_idx1:lon_idx2+1])
-            dep = ds['lev'][:]
+            temp_int = interp_to_points_3d(dep, y2, x2, bxyz, ds['temperature'][it])
+            dst_temp.write(it, temp_int.reshape(zcor2.shape), it)
 
-            temp_int = interp_to_points_3d(dep, y2, x2, bxyz, temp)
-            temp_int = temp_int.reshape(zcor2.shape)
-            #timeseries_t[it,:,:,0]=temp_int
-            timeseries_t[it,:,:,0] = temp_int
-            ds.close()
-
-        with Dataset(outdir / 'SAL_nu.nc', 'w', format='NETCDF4') as dst:
-        #dimensions
-            dst.createDimension('node', nNode)
-            dst.createDimension('nLevels', nvrt)
-            dst.createDimension('one', one)
-            dst.createDimension('time', None)
-        #variables
-            dst.createVariable('time', 'f', ('time',))
-            dst['time'][:] = ndt
-
-            dst.createVariable('map_to_global_node', 'i4', ('node',))
-            dst['map_to_global_node'][:] = include+1
-
-            dst.createVariable('tracer_concentration', 'f', ('time', 'node', 'nLevels', 'one'))
-            dst['tracer_concentration'][:,:,:,:] = timeseries_s
-
-        with Dataset(outdir / 'TEM_nu.nc', 'w', format='NETCDF4') as dst:
-        #dimensions
-            dst.createDimension('node', nNode)
-            dst.createDimension('nLevels', nvrt)
-            dst.createDimension('one', one)
-            dst.createDimension('time', None)
-        #variables
-            dst.createVariable('time', 'f', ('time',))
-            dst['time'][:] = ndt
-
-            dst.createVariable('map_to_global_node', 'i4', ('node',))
-            dst['map_to_global_node'][:] = include+1
-
-            dst.createVariable('tracer_concentration', 'f', ('time', 'node', 'nLevels', 'one'))
-            dst['tracer_concentration'][:,:,:,:] = timeseries_t
+        ds.close()
+        dst_salt.close()
+        dst_temp.close()
 
         logger.info(f'Writing *_nu.nc takes {time()-t0} seconds')
 
 class DownloadRTOFS:
+    """Stages the RTOFS forecast over the bbox of hgrid, for the boundary,
+    nudging and initial condition generators to read with cached=True."""
 
-    def __init__(self):
-        pass
+    def __init__(self, hgrid):
+        self.hgrid = hgrid
 
-    def fetch_data(self, startdate, rnday=9):
+    def fetch_data(self, startdate, rnday=7, outdir: Union[str, os.PathLike] = '.'):
         logger.info(f'startdate is {startdate}')
-        idx_x1 = 2687
-        idx_x2 = 2714
-        idx_y1 = 1181
-        idx_y2 = 1634
-        logger.info(f'idx_x1 is {idx_x1}, idx_x2 is {idx_x2}, idx_y1 is {idx_y1}, idx_y2 is {idx_y2}')
-        enddate = startdate + timedelta(days=rnday)
-        datevector = np.arange(startdate, enddate, np.timedelta64(1, 'D'),dtype='datetime64')
-        logger.info(datevector)
-        datevector = pd.to_datetime(datevector)
-
-        url_2d = f'http://nomads.ncep.noaa.gov:80/dods/rtofs/rtofs_global{startdate.strftime("%Y%m%d")}/rtofs_glo_2ds_forecast_3hrly_diag'
-        url_3d = f'http://nomads.ncep.noaa.gov:80/dods/rtofs/rtofs_global{startdate.strftime("%Y%m%d")}/rtofs_glo_3dz_forecast_daily_'
-
-        for it, date in enumerate(datevector):
-            if it == 0:
-                continue
-
-            salt = []
-            temp = []
-            uvel = []
-            vvel = []
-            ssh = []
-            vars = {'salt': ['salinity', salt], 'temp': ['temperature', temp], 'uvel': ['u', uvel], 'vvel': ['v', vvel],'ssh': ['ssh', ssh]}
-
-            foutname = f'rtofs_{date.strftime("%Y%m%d")}.nc'
-            logger.info(f'filename is {foutname}')
-
-            attrs = {}
-            for ivar, (key, var) in enumerate(vars.items()):
-                if key == 'ssh':
-                    url = url_2d
-                else:
-                    url = url_3d + key
-                logger.info(f'url is {url}')
-                ds = xr.open_dataset(url)
-                if ivar == 0:
-                    time=ds['time'][it].values
-                    lon = ds['lon'][idx_x1:idx_x2+1].astype('float32')
-                    lat = ds['lat'][idx_y1:idx_y2+1].astype('float32')
-                    depth = ds['lev'][:].astype('float32')
-                values = ds[var[0]]
-
-                if key == 'ssh':
-                    var[1].append(values[it*8, 0, idx_y1:idx_y2+1, idx_x1:idx_x2+1].astype('float32'))
-                else: 
-                    var[1].append(values[it, :, idx_y1:idx_y2+1, idx_x1:idx_x2+1].astype('float32'))
-                attrs[key] = ds[var[0]].attrs
-                #print(attrs)
-
-            fout = xr.Dataset({
-                    'salinity': (['time','lev', 'lat', 'lon'], np.array(salt)),
-                    'temperature': (['time','lev', 'lat', 'lon'], np.array(temp)),
-                    'u': (['time','lev', 'lat', 'lon'], np.array(uvel)),
-                    'v': (['time','lev', 'lat', 'lon'], np.array(vvel)),
-                    'ssh': (['time','lat', 'lon'], np.array(ssh)),
-                    },
-                    coords = {
-                        'time': np.atleast_1d(time),
-                        'lev': depth,
-                        'lat': lat,
-                        'lon': lon,
-                    })
-            fout.salinity.attrs = attrs['salt']
-            fout.temperature.attrs = attrs['temp']
-            fout.u.attrs = attrs['uvel']
-            fout.v.attrs = attrs['vvel']
-            fout.ssh.attrs = attrs['ssh']
-            fout.time.encoding['units'] = 'days since 0001-01-01 00:00:00'
-            
-            fout.to_netcdf(foutname, 'w', unlimited_dims='time')
+        timevector = np.arange(startdate, startdate + timedelta(days=rnday+1), \
+            timedelta(days=1)).astype(datetime)
+        inventory = RtofsInventory(self.hgrid.coords[:, 0], self.hgrid.coords[:, 1], timevector, cache=outdir)
+        return inventory.stage()
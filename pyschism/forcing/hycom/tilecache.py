@@ -0,0 +1,261 @@
+"""Persistent on-disk cache of GOFS (HYCOM) data tiles.
+
+The lat/lon grid of a dataset is split into square tiles, and each tile of
+one time record of one variable is stored as a ``.npy`` file keyed by
+(dataset, variable, time, tile). :class:`CachedDataset` reads like a
+``netCDF4.Dataset`` opened on the OPeNDAP url, but reads the tiles from the
+cache first and opens the url only to fetch the tiles that are missing, so
+reruns of the same cycle and domains sharing a boundary region download the
+data once. The axes of a dataset are cached as well. The GOFS datasets are
+growing aggregations, so the time axis is read again whenever the url can
+be opened, and the cached axes are used when it can not.
+
+The cache is limited in size: the least recently used tiles are removed
+when it grows over ``max_size`` bytes. The size of the cache is counted
+once, then kept up to date as tiles are added.
+"""
+import hashlib
+import logging
+import os
+import pathlib
+import threading
+from typing import Union
+
+import appdirs
+from netCDF4 import Dataset
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class TileCache:
+    """On-disk LRU cache of GOFS tiles.
+
+    Args:
+        path: Directory of the cache. True uses the user cache directory.
+        max_size: Maximum size of the cache in bytes, None for no limit.
+        tile_size: Number of grid cells along each side of a tile.
+    """
+
+    def __init__(
+            self,
+            path: Union[str, os.PathLike, bool] = True,
+            max_size: int = 5 * 2**30,
+            tile_size: int = 64,
+    ):
+        if path is True:
+            path = appdirs.user_cache_dir('pyschism/gofs')
+        self.path = pathlib.Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self.tile_size = tile_size
+        self._size = None
+        self._lock = threading.Lock()
+
+    def dataset(self, url):
+        return CachedDataset(url, self)
+
+    def get(self, path):
+        """Returns the tile stored at path, or None."""
+        try:
+            tile = np.load(path)
+        except FileNotFoundError:
+            return None
+        os.utime(path)
+        return tile
+
+    def put(self, path, tile):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.parent / f'.{path.name}.{os.getpid()}.{threading.get_ident()}'
+        with open(tmp, 'wb') as f:
+            np.save(f, tile)
+        size = tmp.stat().st_size
+        os.replace(tmp, path)
+        with self._lock:
+            if self._size is not None:
+                self._size += size
+
+    @property
+    def size(self):
+        """Size of the tiles in bytes, counted on the first call only.
+        Tiles written by other processes afterwards are not counted until
+        the next eviction."""
+        with self._lock:
+            if self._size is None:
+                self._size = sum(path.stat().st_size for path in self.path.rglob('*.npy'))
+            return self._size
+
+    def evict(self):
+        """Removes the least recently used tiles until the cache fits in
+        max_size. The cache is only walked when its size is over
+        max_size."""
+        if self.max_size is None or self.size <= self.max_size:
+            return
+        with self._lock:
+            files = []
+            for path in self.path.rglob('*.npy'):
+                stat = path.stat()
+                files.append((stat.st_mtime, stat.st_size, path))
+            size = sum(file[1] for file in files)
+            for _, file_size, path in sorted(files):
+                if size <= self.max_size:
+                    break
+                path.unlink(missing_ok=True)
+                size -= file_size
+            self._size = size
+
+
+class CachedAxis(np.ndarray):
+    """Cached coordinate variable, with the attributes of the remote one."""
+
+    def __new__(cls, values, attrs):
+        obj = np.asarray(values).view(cls)
+        obj.__dict__.update(attrs)
+        return obj
+
+    def __array_finalize__(self, obj):
+        if obj is not None:
+            self.__dict__.update(getattr(obj, '__dict__', {}))
+
+
+class CachedDataset:
+    """Read-only view of a GOFS OPeNDAP dataset backed by a TileCache.
+
+    Coordinate variables are read from the cache, data variables are read
+    through :class:`CachedVariable`. The url is opened on the first cache
+    miss only.
+    """
+
+    axes = ('time', 'lon', 'lat', 'depth')
+
+    def __init__(self, url, cache: TileCache):
+        self.url = url
+        self.cache = cache
+        self.path = cache.path / hashlib.md5(url.encode()).hexdigest()[:16]
+        self._remote = None
+        self._axes = None
+
+    @property
+    def remote(self):
+        if self._remote is None:
+            logger.info(f'Opening {self.url}')
+            self._remote = Dataset(self.url)
+        return self._remote
+
+    def __getitem__(self, name):
+        if name in self.axes:
+            return self._get_axes()[name]
+        return CachedVariable(self, name)
+
+    def _get_axes(self):
+        if self._axes is not None:
+            return self._axes
+        path = self.path / 'axes.npz'
+        cached = None
+        if path.is_file():
+            with np.load(path) as data:
+                cached = {name: data[name] for name in data.files}
+        try:
+            values = self._read_axes(cached)
+        except OSError as e:
+            if cached is None:
+                raise
+            logger.info(f'Using the cached axes of {self.url}: {e}')
+            values = cached
+        if values is not cached and (
+                cached is None or not np.array_equal(values['time'], cached['time'])):
+            self.path.mkdir(parents=True, exist_ok=True)
+            tmp = self.path / f'.axes.{os.getpid()}.{threading.get_ident()}.npz'
+            np.savez(tmp, **values)
+            os.replace(tmp, path)
+        self._axes = {
+            name: CachedAxis(values[name], {'units': str(values[f'{name}_units'])})
+            for name in self.axes}
+        for axis in self._axes.values():
+            axis.flags.writeable = False
+        return self._axes
+
+    def _read_axes(self, cached=None):
+        """Reads the axes from the url. Only time, which grows with the
+        aggregation, is read if the other axes are cached."""
+        values = {} if cached is None else dict(cached)
+        for name in ('time',) if cached is not None else self.axes:
+            var = self.remote[name]
+            values[name] = np.asarray(var[:])
+            values[f'{name}_units'] = np.array(getattr(var, 'units', ''))
+        return values
+
+    def close(self):
+        if self._remote is not None:
+            self._remote.close()
+            self._remote = None
+
+
+class CachedVariable:
+    """Data variable of a CachedDataset.
+
+    Supports the indexing used on GOFS variables: an integer time index,
+    then any depth index for 3D variables, then lat and lon indexes.
+    """
+
+    def __init__(self, dataset: CachedDataset, name):
+        self.dataset = dataset
+        self.name = name
+
+    def __getitem__(self, key):
+        time_idx, *middle, lat_idxs, lon_idxs = key
+        axes = self.dataset._get_axes()
+        lat_idxs = np.arange(len(axes['lat']))[lat_idxs]
+        lon_idxs = np.arange(len(axes['lon']))[lon_idxs]
+        block, lat0, lon0 = self._read_block(
+            int(time_idx), np.atleast_1d(lat_idxs), np.atleast_1d(lon_idxs))
+        out = block[(..., lat_idxs - lat0, slice(None))][..., lon_idxs - lon0]
+        return out[tuple(middle)] if middle else out
+
+    def _tile_path(self, time_idx, row, col):
+        time = self.dataset._get_axes()['time'][time_idx]
+        return self.dataset.path / self.name / f't{float(time):.6f}' / f'{row}_{col}.npy'
+
+    def _read_block(self, time_idx, lat_idxs, lon_idxs):
+        """Returns the tiles covering lat_idxs and lon_idxs assembled in one
+        array, with the lat and lon index of its first cell."""
+        cache = self.dataset.cache
+        size = cache.tile_size
+        nlat = len(self.dataset._get_axes()['lat'])
+        nlon = len(self.dataset._get_axes()['lon'])
+        rows = range(lat_idxs.min() // size, lat_idxs.max() // size + 1)
+        cols = range(lon_idxs.min() // size, lon_idxs.max() // size + 1)
+        tiles = {}
+        missing = []
+        for row in rows:
+            for col in cols:
+                tiles[row, col] = cache.get(self._tile_path(time_idx, row, col))
+                if tiles[row, col] is None:
+                    missing.append((row, col))
+        if missing:
+            # fetch all the missing tiles in one request
+            row0 = min(row for row, _ in missing)
+            row1 = max(row for row, _ in missing)
+            col0 = min(col for _, col in missing)
+            col1 = max(col for _, col in missing)
+            lat_slice = slice(row0 * size, min((row1 + 1) * size, nlat))
+            lon_slice = slice(col0 * size, min((col1 + 1) * size, nlon))
+            logger.info(
+                f'Downloading {self.name}[{time_idx}] tiles {missing} from '
+                f'{self.dataset.url}')
+            var = self.dataset.remote[self.name]
+            values = var[(time_idx, *[slice(None)] * (var.ndim - 3), lat_slice, lon_slice)]
+            values = np.ma.filled(np.ma.asarray(values, dtype=np.float32), np.nan)
+            for row, col in missing:
+                tile = values[
+                    ...,
+                    row * size - lat_slice.start:min((row + 1) * size, nlat) - lat_slice.start,
+                    col * size - lon_slice.start:min((col + 1) * size, nlon) - lon_slice.start]
+                tile = np.ascontiguousarray(tile)
+                cache.put(self._tile_path(time_idx, row, col), tile)
+                tiles[row, col] = tile
+            cache.evict()
+        block = np.concatenate([
+            np.concatenate([tiles[row, col] for col in cols], axis=-1)
+            for row in rows], axis=-2)
+        return block, rows[0] * size, cols[0] * size
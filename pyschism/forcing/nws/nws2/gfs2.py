@@ -1,33 +1,41 @@
 from datetime import datetime, timedelta
 import logging
 import pathlib
+import re
 import tempfile
 from time import time
 import glob
-import multiprocessing as mp
 
-import boto3
-from botocore import UNSIGNED
-from botocore.config import Config
 import numpy as np
 import xarray as xr
 import pandas as pd
 
 from pyschism.dates import nearest_cycle
+from pyschism.forcing.nws.nws2.grib2 import decode_files, download_files, get_grid
+from pyschism.utils.s3 import S3Downloader, get_client
 
 logger = logging.getLogger(__name__)
 
 class AWSGrib2Inventory:
 
+    # messages read from each file, as VARIABLE:level in its .idx
+    messages = (
+        'TMP:2 m above ground', 'SPFH:2 m above ground', 'UGRD:10 m above ground',
+        'VGRD:10 m above ground', 'PRMSL:mean sea level', 'PRATE:surface',
+        'DLWRF:surface', 'DSWRF:surface',
+    )
+
     def __init__(
             self,
             start_date: datetime = None,
             record = 1,
             pscr = None,
             product='atmos',
+            download=True,
     ):
         """
-        This will download the GFS data.
+        This will download the GFS data, or only list the files to
+        download if download is False.
         """
         self.start_date = nearest_cycle() if start_date is None else start_date
         self.record = record
@@ -49,17 +57,13 @@ class AWSGrib2Inventory:
         file_metadata = list(sorted([
             _['Key'] for _ in data if '0p25' in _['Key'] and 'pgrb2' in _['Key'] and not 'goessim' in _['Key'] and not 'anl' in _['Key'] and not 'idx' in _['Key']]))
 
-        for key in file_metadata[1:self.record*24+1]:
-            key2 = key + '.grib2'
-            filename = pathlib.Path(self.tmpdir) / key2
-            filename.parent.mkdir(parents=True, exist_ok=True)
-
-            with open(filename, 'wb') as f:
-                logger.info(f'Downloading file {key}, ')
-                try:
-                    self.s3.download_fileobj(self.bucket, key, f)
-                except:
-                    logger.info(f'file {key} is not available')
+        keys = file_metadata[1:self.record*24+1]
+        self.requests = [(key, pathlib.Path(self.tmpdir) / f'{key}.grib2') for key in keys]
+        #forecast hour of each file, from its .fHHH suffix
+        self.hours = [int(re.search(r'\.f(\d+)$', key).group(1)) for key in keys]
+        if download:
+            with S3Downloader(self.bucket, self.s3) as downloader:
+                download_files(downloader, self.requests, self.messages)
 
     @property
     def bucket(self):
@@ -67,12 +71,7 @@ class AWSGrib2Inventory:
 
     @property
     def s3(self):
-        try:
-            return self._s3
-        except AttributeError:
-            self._s3 = boto3.client(
-                's3', config=Config(signature_version=UNSIGNED))
-            return self._s3
+        return get_client()
 
     @property
     def tmpdir(self):
@@ -87,7 +86,25 @@ class AWSGrib2Inventory:
         return grbfiles
 
 class GFS:
-    def __init__(self, start_date=None, rnday=None, pscr=None, record=1, bbox=None):
+
+    # messages decoded from each file, by the keys cfgrib used to filter them
+    fields = {
+        'spfh': {'paramId': 174096},
+        'stmp': {'paramId': 167},
+        'uwind': {'paramId': 165},
+        'vwind': {'paramId': 166},
+        'prmsl': {'typeOfLevel': 'meanSea', 'discipline': 0,
+                  'parameterCategory': 3, 'parameterNumber': 1},
+        'prate': {'typeOfLevel': 'surface', 'stepType': 'instant', 'discipline': 0,
+                  'parameterCategory': 1, 'parameterNumber': 7},
+        'dlwrf': {'typeOfLevel': 'surface', 'stepType': 'avg', 'discipline': 0,
+                  'parameterCategory': 5, 'parameterNumber': 192},
+        'dswrf': {'typeOfLevel': 'surface', 'stepType': 'avg', 'discipline': 0,
+                  'parameterCategory': 4, 'parameterNumber': 192},
+    }
+
+    def __init__(self, start_date=None, rnday=None, pscr=None, record=1, bbox=None,
+                 download_workers=8, decode_workers=None):
 
         start_date = nearest_cycle() if start_date is None else start_date 
         logger.info(f'start_date is {start_date}')
@@ -99,94 +116,89 @@ class GFS:
                 dtype='datetime64')
         datevector = pd.to_datetime(datevector)
 
-        npool = len(datevector) if len(datevector) < mp.cpu_count() else mp.cpu_count()
-        logger.info(f'npool is {npool}')
-        pool = mp.Pool(npool)
-
-        pool.starmap(self.gen_sflux, [(date, record, pscr) for date in datevector])
-
-        pool.close()
+        self.gen_sflux(datevector, record, pscr, download_workers, decode_workers)
 
-    def gen_sflux(self, date, record, pscr):
+    def gen_sflux(self, dates, record, pscr, download_workers=8, decode_workers=None):
+        """Writes the sflux file of each of dates.
 
-        inventory = AWSGrib2Inventory(date, record, pscr)
-        grbfiles = inventory.files
+        The files of all the dates are downloaded by download_workers
+        threads while decode_workers processes (the number of CPUs by
+        default) decode the files already downloaded.
+        """
+        dates = pd.to_datetime(np.atleast_1d(dates))
+        inventories = [AWSGrib2Inventory(date, record, pscr, download=False) for date in dates]
+        hours = [(iday, ihour) for iday, inventory in enumerate(inventories)
+                 for ihour in range(len(inventory.requests))]
+        for date, inventory in zip(dates, inventories):
+            if not inventory.requests:
+                logger.warning(f'No file of {date} is listed, its sflux file is not written')
+        grid = {}
+
+        def window(grbfile):
+            #Get lon/lat
+            grid['lon'], grid['lat'], idx_ymin, idx_ymax, idx_xmin, idx_xmax = \
+                self.modified_latlon(grbfile)
+            #rows are read north to south, so that lat is in ascending order
+            return (slice(idx_ymax, idx_ymin-1 if idx_ymin > 0 else None, -1),
+                    slice(idx_xmin, idx_xmax+1))
+
+        #each file is decoded into its time step of the arrays of its date
+        Vars = {}
+        decoded = [np.zeros(len(inventory.requests), dtype=bool) for inventory in inventories]
+        remaining = [len(inventory.requests) for inventory in inventories]
+        with S3Downloader(inventories[0].bucket, inventories[0].s3,
+                          workers=download_workers) as downloader:
+            for i, values in decode_files(
+                    downloader,
+                    [request for inventory in inventories for request in inventory.requests],
+                    AWSGrib2Inventory.messages, self.fields, window, decode_workers):
+                iday, ihour = hours[i]
+                logger.info(f'file {ihour} of {dates[iday]} is decoded')
+                if values is not None:
+                    if iday not in Vars:
+                        Vars[iday] = {
+                            name: np.empty((len(decoded[iday]), *grid['lon'].shape), dtype='float32')
+                            for name in self.fields}
+                    for name, value in values.items():
+                        Vars[iday][name][ihour] = value
+                    decoded[iday][ihour] = True
+                remaining[iday] -= 1
+                if remaining[iday] > 0:
+                    continue
+                if iday not in Vars:
+                    logger.warning(f'No file of {dates[iday]} could be read, '
+                                   f'its sflux file is not written')
+                    continue
+                #the files that could not be read are left out, and the
+                #time of each record is its forecast hour
+                ok = decoded[iday]
+                if not ok.all():
+                    logger.warning(f'Forecast hours {np.array(inventories[iday].hours)[~ok]} of '
+                                   f'{dates[iday]} could not be read')
+                self.write_sflux(
+                    dates[iday],
+                    {name: value if ok.all() else value[ok]
+                     for name, value in Vars.pop(iday).items()},
+                    grid['lon'], grid['lat'], np.array(inventories[iday].hours)[ok])
+
+    def write_sflux(self, date, Vars, lon, lat, hours=None):
+        hours = np.arange(1, len(Vars['stmp'])+1) if hours is None else hours
         cycle = date.hour
 
         path = pathlib.Path(date.strftime("%Y%m%d"))
         path.mkdir(parents=True, exist_ok=True)
-        
-        prate = []
-        dlwrf = []
-        dswrf = []
-        stmp = []
-        spfh = []
-        uwind = []
-        vwind = []
-        prmsl = []
-
-        Vars = {
-            'group1': {'sh2': ['174096', spfh], 't2m': ['167', stmp],
-            'u10': ['165', uwind], 'v10': ['166', vwind]},
-            'group2': {'prmsl': ['meanSea', prmsl]},
-            'group3': {'prate': ['surface', prate]},
-            'group4': {'dlwrf': ['surface', dlwrf], 'dswrf': ['surface', dswrf]}
-        }
 
-        #Get lon/lat
-        lon, lat, idx_ymin, idx_ymax, idx_xmin, idx_xmax = self.modified_latlon(grbfiles[0])
-
-        for ifile, file in enumerate(grbfiles):
-            logger.info(f'file {ifile} is {file}')
-
-            for key, value in Vars.items():
-                if key == 'group1':
-                    for key2, value2 in value.items():
-                        ds = xr.open_dataset(file,
-                                engine='cfgrib',
-                                backend_kwargs=dict(filter_by_keys={'paramId':int(value2[0])}))
-                        tmp = ds[key2][idx_ymin:idx_ymax+1, idx_xmin:idx_xmax+1].astype('float32')
-                        value2[1].append(tmp[::-1,:])
-                        ds.close()
-
-                elif key == 'group2':
-                    ds = xr.open_dataset(file,
-                            engine='cfgrib',
-                            backend_kwargs=dict(filter_by_keys={'typeOfLevel':'meanSea'}))
-                    for key2, value2 in value.items():
-                        tmp = ds[key2][idx_ymin:idx_ymax+1, idx_xmin:idx_xmax+1].astype('float32')
-                        value2[1].append(tmp[::-1,:])
-                    ds.close()
-
-                elif key == 'group3':
-                    ds = xr.open_dataset(file,
-                            engine='cfgrib',
-                            backend_kwargs=dict(filter_by_keys={'stepType': 'instant','typeOfLevel': 'surface'}))
-                    for key2, value2 in value.items():
-                        tmp = ds[key2][idx_ymin:idx_ymax+1, idx_xmin:idx_xmax+1].astype('float32')
-                        value2[1].append(tmp[::-1, :])
-                    ds.close()
-
-                else:
-                    ds = xr.open_dataset(file,
-                            engine='cfgrib',
-                            backend_kwargs=dict(filter_by_keys={'stepType': 'avg','typeOfLevel': 'surface'}))
-                    for key2, value2 in value.items():
-                        tmp = ds[key2][idx_ymin:idx_ymax+1, idx_xmin:idx_xmax+1].astype('float32')
-                        value2[1].append(tmp[::-1, :])
-                    ds.close()
-
-        fout = xr.Dataset({'stmp': (['time', 'ny_grid', 'nx_grid'], np.array(stmp)),
-                'spfh': (['time', 'ny_grid', 'nx_grid'], np.array(spfh)),
-                'uwind': (['time', 'ny_grid', 'nx_grid'], np.array(uwind)),
-                'vwind': (['time', 'ny_grid', 'nx_grid'], np.array(vwind)),
-                'prmsl': (['time', 'ny_grid', 'nx_grid'], np.array(prmsl)),
-                'prate': (['time', 'ny_grid', 'nx_grid'], np.array(prate)),
-                'dlwrf': (['time', 'ny_grid', 'nx_grid'], np.array(dlwrf)),
-                'dswrf': (['time', 'ny_grid', 'nx_grid'], np.array(dswrf)),
+        fout = xr.Dataset({'stmp': (['time', 'ny_grid', 'nx_grid'], Vars['stmp']),
+                'spfh': (['time', 'ny_grid', 'nx_grid'], Vars['spfh']),
+                'uwind': (['time', 'ny_grid', 'nx_grid'], Vars['uwind']),
+                'vwind': (['time', 'ny_grid', 'nx_grid'], Vars['vwind']),
+                'prmsl': (['time', 'ny_grid', 'nx_grid'], Vars['prmsl']),
+                'prate': (['time', 'ny_grid', 'nx_grid'], Vars['prate']),
+                'dlwrf': (['time', 'ny_grid', 'nx_grid'], Vars['dlwrf']),
+                'dswrf': (['time', 'ny_grid', 'nx_grid'], Vars['dswrf']),
                 },
                 coords={
-                    'time': np.round(np.arange(1, len(grbfiles)+1)/24, 4).astype('float32'),
+                    'time': np.round(np.asarray(hours)/24, 4).astype('float32'),
                     'lon': (['ny_grid', 'nx_grid'], lon),
                     'lat': (['ny_grid', 'nx_grid'], lat)
                 })
@@ -266,13 +278,11 @@ class GFS:
         xmin = xmin + 360 if xmin < 0 else xmin
         xmax = xmax + 360 if xmax < 0 else xmax
 
-        ds=xr.open_dataset(grbfile,
-                engine='cfgrib',
-                backend_kwargs=dict(filter_by_keys={'stepType': 'instant','typeOfLevel': 'surface'}))
-        lon=ds.longitude.astype('float32')
-        lat=ds.latitude.astype('float32')
-        lon_idxs=np.where((lon.values >= xmin-1.0) & (lon.values <= xmax+1.0))[0]
-        lat_idxs=np.where((lat.values >= ymin-1.0) & (lat.values <= ymax+1.0))[0]
+        lat, lon = get_grid(grbfile)
+        lon=lon.astype('float32')
+        lat=lat.astype('float32')
+        lon_idxs=np.where((lon >= xmin-1.0) & (lon <= xmax+1.0))[0]
+        lat_idxs=np.where((lat >= ymin-1.0) & (lat <= ymax+1.0))[0]
         idx_ymin = lat_idxs[0]
         idx_ymax = lat_idxs[-1]
         idx_xmin = lon_idxs[0]
@@ -285,6 +295,4 @@ class GFS:
         #make sure lat is in ascending order
         nx_grid, ny_grid=np.meshgrid(lon2, lat2[::-1])
 
-        ds.close()
-
         return nx_grid, ny_grid, idx_ymin, idx_ymax, idx_xmin, idx_xmax
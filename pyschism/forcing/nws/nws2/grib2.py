@@ -0,0 +1,255 @@
+"""Partial downloads of the GRIB2 files of the NOAA buckets.
+
+Every GFS and HRRR GRIB2 file on S3 comes with a ``.idx`` sidecar listing
+the byte offset, variable and level of each of its messages, e.g.::
+
+    581:384592210:d=2022030100:TMP:2 m above ground:1 hour fcst:
+
+:func:`download_messages` reads the sidecar, requests only the byte ranges
+of the messages that are needed, concurrently, and concatenates them into
+a slim local GRIB2 file that cfgrib reads like the full one. The messages
+are selected by ``VARIABLE:level`` as written in the sidecar. Files without
+a sidecar are downloaded whole. The requests go through a
+:class:`~pyschism.utils.s3.S3Downloader`, which retries them.
+
+:class:`Grib2Decoder` reads the fields needed from a GRIB2 file in a
+single pass over its messages with eccodes, instead of opening the file
+with cfgrib once per group of fields. Only the headers of the other
+messages are read. :func:`decode_files` decodes files in worker processes
+while the next ones are downloaded.
+"""
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import logging
+import os
+import pathlib
+import threading
+
+from botocore.exceptions import BotoCoreError, ClientError
+import eccodes
+import numpy as np
+
+from pyschism.utils.s3 import is_missing
+
+logger = logging.getLogger(__name__)
+
+
+IdxRecord = namedtuple(
+    'IdxRecord', ['number', 'offset', 'date', 'variable', 'level', 'forecast'])
+
+
+def parse_idx(text):
+    """Returns the IdxRecords of the text of a ``.idx`` file."""
+    records = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        fields = line.split(':')
+        records.append(IdxRecord(
+            fields[0], int(fields[1]), fields[2][2:], fields[3], fields[4],
+            fields[5]))
+    return records
+
+
+def get_ranges(records, messages):
+    """Returns the (first, last) byte of the records matching messages,
+    consecutive messages merged in one range. last is None for the last
+    message of the file, which ends with the file."""
+    ranges = []
+    for i, record in enumerate(records):
+        if f'{record.variable}:{record.level}' not in messages:
+            continue
+        end = records[i + 1].offset - 1 if i + 1 < len(records) else None
+        if ranges and ranges[-1][1] is not None \
+                and ranges[-1][1] + 1 == record.offset:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((record.offset, end))
+    return ranges
+
+
+def download_messages(downloader, key, path, messages):
+    """Downloads the messages of the GRIB2 object key into path.
+
+    Args:
+        downloader: S3Downloader of the bucket.
+        key: Key of the GRIB2 object. Its sidecar is ``key + '.idx'``.
+        path: Local GRIB2 file written.
+        messages: ``VARIABLE:level`` of the messages to download.
+
+    Returns path.
+    """
+    path = pathlib.Path(path)
+    try:
+        idx = downloader.get(f'{key}.idx')
+    except ClientError as e:
+        if not is_missing(e):
+            raise
+        logger.info(f'No index for {key}, downloading the whole file')
+        return downloader.download(key, path)
+    ranges = get_ranges(parse_idx(idx.decode()), messages)
+    if not ranges:
+        raise ValueError(f'None of the messages {messages} are in {key}.')
+    chunks = downloader.get_ranges(key, ranges)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.parent / f'.{path.name}.{os.getpid()}.{threading.get_ident()}'
+    with open(tmp, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+    os.replace(tmp, path)
+    logger.info(f'Downloaded {len(ranges)} ranges, '
+                f'{sum(len(chunk) for chunk in chunks)} bytes of {key}')
+    return path
+
+
+def _download(downloader, request, messages):
+    key, path = request
+    logger.info(f'Downloading file {key}, ')
+    try:
+        return download_messages(downloader, key, path, messages)
+    except (ClientError, BotoCoreError, OSError, ValueError) as e:
+        logger.info(f'file {key} is not available: {e}')
+        return None
+
+
+def download_files(downloader, requests, messages):
+    """Downloads the messages of the (key, path) requests concurrently.
+    Returns the path of each request, or None for the files that could not
+    be downloaded."""
+    paths = downloader.map(lambda request: _download(downloader, request, messages), requests)
+    logger.info(f'Downloaded from {downloader.bucket}: {downloader.metrics.summary()}')
+    return paths
+
+
+def get_grid(path):
+    """Returns the latitudes and longitudes of the first message of path,
+    as cfgrib does: 1D for regular lat/lon grids, 2D otherwise, in the
+    order of the values."""
+    with open(path, 'rb') as f:
+        handle = eccodes.codes_grib_new_from_file(f)
+    if handle is None:
+        raise ValueError(f'No GRIB message in {path}')
+    try:
+        shape = (eccodes.codes_get(handle, 'Nj'), eccodes.codes_get(handle, 'Ni'))
+        lat = eccodes.codes_get_array(handle, 'latitudes').reshape(shape)
+        lon = eccodes.codes_get_array(handle, 'longitudes').reshape(shape)
+        if eccodes.codes_get(handle, 'gridType') == 'regular_ll':
+            return lat[:, 0], lon[0, :]
+        return lat, lon
+    finally:
+        eccodes.codes_release(handle)
+
+
+class Grib2Decoder:
+    """Decodes fields of GRIB2 files in one pass over their messages.
+
+    Args:
+        fields: Dict of the name of each field to the GRIB keys and values
+            that identify its message, e.g. ``{'stmp': {'paramId': 167}}``.
+            The first message matching is used.
+        window: (rows, columns) slices of the values that are kept.
+    """
+
+    def __init__(self, fields, window=(slice(None), slice(None))):
+        self.fields = fields
+        self.window = tuple(window)
+
+    def _match(self, handle, found):
+        for name, keys in self.fields.items():
+            if name in found:
+                continue
+            for key, value in keys.items():
+                try:
+                    if eccodes.codes_get(handle, key, type(value)) != value:
+                        break
+                except eccodes.KeyValueNotFoundError:
+                    break
+            else:
+                return name
+
+    def decode(self, path, out=None):
+        """Returns the window of each field of path as float32.
+
+        If out, a dict of the field names to float32 arrays of the shape of
+        the window, is given, the fields are written into it.
+        """
+        found = {}
+        with open(path, 'rb') as f:
+            while len(found) < len(self.fields):
+                handle = eccodes.codes_grib_new_from_file(f)
+                if handle is None:
+                    break
+                try:
+                    name = self._match(handle, found)
+                    if name is None:
+                        continue
+                    shape = (eccodes.codes_get(handle, 'Nj'), eccodes.codes_get(handle, 'Ni'))
+                    values = eccodes.codes_get_values(handle)
+                    if eccodes.codes_get(handle, 'bitmapPresent'):
+                        values[values == eccodes.codes_get(handle, 'missingValue')] = np.nan
+                    values = values.reshape(shape)[self.window]
+                    if out is None:
+                        found[name] = values.astype(np.float32)
+                    else:
+                        out[name][...] = values
+                        found[name] = out[name]
+                finally:
+                    eccodes.codes_release(handle)
+        missing = [name for name in self.fields if name not in found]
+        if missing:
+            raise ValueError(f'No {missing} in {path}')
+        return found
+
+
+def _decode(fields, window, path):
+    return Grib2Decoder(fields, window).decode(path)
+
+
+def decode_files(downloader, requests, messages, fields, window, workers=None):
+    """Downloads the messages of the (key, path) requests and decodes the
+    fields of each file as soon as it is downloaded.
+
+    The files are downloaded in the thread pool of downloader while a pool
+    of worker processes decodes the ones already downloaded.
+
+    Args:
+        downloader: S3Downloader of the bucket.
+        requests: (key, path) of the GRIB2 files.
+        messages: ``VARIABLE:level`` of the messages to download.
+        fields: Fields decoded, as for Grib2Decoder.
+        window: Window of the fields decoded, or function of the path of
+            the first file downloaded returning it.
+        workers: Number of decoding processes, the number of CPUs by
+            default.
+
+    Yields (index, fields) of each request, in the order the files are
+    decoded. fields is None for the files that could not be downloaded or
+    decoded.
+    """
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # the worker processes are forked before the download threads start
+        pool.submit(int).result()
+        downloads = {
+            downloader.submit(_download, downloader, request, messages): i
+            for i, request in enumerate(requests)}
+        decodes = {}
+        while downloads or decodes:
+            done, _ = wait([*downloads, *decodes], return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in downloads:
+                    i = downloads.pop(future)
+                    path = future.result()
+                    if path is None:
+                        yield i, None
+                        continue
+                    if callable(window):
+                        window = window(path)
+                    decodes[pool.submit(_decode, fields, window, path)] = i
+                else:
+                    i = decodes.pop(future)
+                    try:
+                        values = future.result()
+                    except (OSError, ValueError, eccodes.GribInternalError) as e:
+                        logger.info(f'file {requests[i][0]} could not be decoded: {e}')
+                        values = None
+                    yield i, values
@@ -1,33 +1,40 @@
 from datetime import datetime, timedelta
 import pathlib
+import re
 import tempfile
 import logging
 from time import time
 from typing import Union
 import os
 import glob
-import multiprocessing as mp
 
 #from appdirs import user_data_dir
-import boto3
-from botocore import UNSIGNED
-from botocore.config import Config
 import numpy as np
 import pandas as pd
 import xarray as xr
 
 from pyschism.dates import nearest_cycle
+from pyschism.forcing.nws.nws2.grib2 import decode_files, download_files, get_grid
+from pyschism.utils.s3 import S3Downloader, get_client
 
 logger = logging.getLogger(__name__)
 
 class AWSGrib2Inventory:
 
+    # messages read from each file, as VARIABLE:level in its .idx
+    messages = (
+        'TMP:2 m above ground', 'SPFH:2 m above ground', 'UGRD:10 m above ground',
+        'VGRD:10 m above ground', 'MSLMA:mean sea level', 'PRATE:surface',
+        'DLWRF:surface', 'DSWRF:surface',
+    )
+
     def __init__(
             self,
             start_date: datetime = None,
             record = 2,
             pscr = None, #tmpdir to save grib files
             product='conus',
+            download=True, #only list the files to download if False
     ):
         self.start_date = nearest_cycle() if start_date is None else start_date
         self.pscr = pscr
@@ -50,16 +57,13 @@ class AWSGrib2Inventory:
             _['Key'] for _ in data if 'wrfsfcf' in _['Key'] and tz in _['Key'] and not 'idx' in _['Key']
         ]))
 
-        for key in self.file_metadata[1:record*24+1]:
-            filename = pathlib.Path(self.tmpdir) / key
-            filename.parent.mkdir(parents=True, exist_ok=True)
-
-            with open(filename, 'wb') as f:
-                logger.info(f'Downloading file {key}, ')
-                try:
-                    self.s3.download_fileobj(self.bucket, key, f)
-                except:
-                    logger.info(f'file {key} is not available')
+        keys = self.file_metadata[1:record*24+1]
+        self.requests = [(key, pathlib.Path(self.tmpdir) / key) for key in keys]
+        #forecast hour of each file, from its wrfsfcfHH name
+        self.hours = [int(re.search(r'wrfsfcf(\d+)', key).group(1)) for key in keys]
+        if download:
+            with S3Downloader(self.bucket, self.s3) as downloader:
+                download_files(downloader, self.requests, self.messages)
         #return filename
 
     @property
@@ -74,12 +78,7 @@ class AWSGrib2Inventory:
 
     @property
     def s3(self):
-        try:
-            return self._s3
-        except AttributeError:
-            self._s3 = boto3.client(
-                's3', config=Config(signature_version=UNSIGNED))
-            return self._s3
+        return get_client()
 
     @property
     def tmpdir(self):
@@ -95,7 +94,24 @@ class AWSGrib2Inventory:
 
 class HRRR:
 
-    def __init__(self, start_date=None, rnday=None, pscr=None, record=2, bbox=None):
+    # messages decoded from each file, by the keys cfgrib used to filter them
+    fields = {
+        'spfh': {'paramId': 174096},
+        'stmp': {'paramId': 167},
+        'uwind': {'paramId': 165},
+        'vwind': {'paramId': 166},
+        'prmsl': {'typeOfLevel': 'meanSea', 'discipline': 0,
+                  'parameterCategory': 3, 'parameterNumber': 198},
+        'prate': {'typeOfLevel': 'surface', 'stepType': 'instant', 'discipline': 0,
+                  'parameterCategory': 1, 'parameterNumber': 7},
+        'dlwrf': {'typeOfLevel': 'surface', 'stepType': 'instant', 'discipline': 0,
+                  'parameterCategory': 5, 'parameterNumber': 192},
+        'dswrf': {'typeOfLevel': 'surface', 'stepType': 'instant', 'discipline': 0,
+                  'parameterCategory': 4, 'parameterNumber': 192},
+    }
+
+    def __init__(self, start_date=None, rnday=None, pscr=None, record=2, bbox=None,
+                 download_workers=8, decode_workers=None):
 
         start_date = nearest_cycle() if start_date is None else start_date 
         self.bbox = bbox
@@ -107,82 +123,89 @@ class HRRR:
                 dtype='datetime64')
         datevector = pd.to_datetime(datevector)
 
-        npool = len(datevector) if len(datevector) < mp.cpu_count() else mp.cpu_count()
-        logger.info(f'npool is {npool}')
-        pool = mp.Pool(npool)
-
-        pool.starmap(self.gen_sflux, [(date, record, pscr) for date in datevector])
-
-        pool.close()
-        
-    def gen_sflux(self, date, record, pscr):
-
-        inventory = AWSGrib2Inventory(date, record, pscr)
-        grbfiles = inventory.files
+        self.gen_sflux(datevector, record, pscr, download_workers, decode_workers)
+
+    def gen_sflux(self, dates, record, pscr, download_workers=8, decode_workers=None):
+        """Writes the sflux file of each of dates.
+
+        The files of all the dates are downloaded by download_workers
+        threads while decode_workers processes (the number of CPUs by
+        default) decode the files already downloaded.
+        """
+        dates = pd.to_datetime(np.atleast_1d(dates))
+        inventories = [AWSGrib2Inventory(date, record, pscr, download=False) for date in dates]
+        hours = [(iday, ihour) for iday, inventory in enumerate(inventories)
+                 for ihour in range(len(inventory.requests))]
+        for date, inventory in zip(dates, inventories):
+            if not inventory.requests:
+                logger.warning(f'No file of {date} is listed, its sflux file is not written')
+        grid = {}
+
+        def window(grbfile):
+            #Get lon/lat
+            grid['lon'], grid['lat'], idx_ymin, idx_ymax, idx_xmin, idx_xmax = \
+                self.modified_latlon(grbfile)
+            return slice(idx_ymin, idx_ymax+1), slice(idx_xmin, idx_xmax+1)
+
+        #each file is decoded into its time step of the arrays of its date
+        Vars = {}
+        decoded = [np.zeros(len(inventory.requests), dtype=bool) for inventory in inventories]
+        remaining = [len(inventory.requests) for inventory in inventories]
+        with S3Downloader(inventories[0].bucket, inventories[0].s3,
+                          workers=download_workers) as downloader:
+            for i, values in decode_files(
+                    downloader,
+                    [request for inventory in inventories for request in inventory.requests],
+                    AWSGrib2Inventory.messages, self.fields, window, decode_workers):
+                iday, ihour = hours[i]
+                logger.info(f'file {ihour} of {dates[iday]} is decoded')
+                if values is not None:
+                    if iday not in Vars:
+                        Vars[iday] = {
+                            name: np.empty((len(decoded[iday]), *grid['lon'].shape), dtype='float32')
+                            for name in self.fields}
+                    for name, value in values.items():
+                        Vars[iday][name][ihour] = value
+                    decoded[iday][ihour] = True
+                remaining[iday] -= 1
+                if remaining[iday] > 0:
+                    continue
+                if iday not in Vars:
+                    logger.warning(f'No file of {dates[iday]} could be read, '
+                                   f'its sflux file is not written')
+                    continue
+                #the files that could not be read are left out, and the
+                #time of each record is its forecast hour
+                ok = decoded[iday]
+                if not ok.all():
+                    logger.warning(f'Forecast hours {np.array(inventories[iday].hours)[~ok]} of '
+                                   f'{dates[iday]} could not be read')
+                self.write_sflux(
+                    dates[iday],
+                    {name: value if ok.all() else value[ok]
+                     for name, value in Vars.pop(iday).items()},
+                    grid['lon'], grid['lat'], np.array(inventories[iday].hours)[ok])
+
+    def write_sflux(self, date, Vars, lon, lat, hours=None):
+        hours = np.arange(1, len(Vars['stmp'])+1) if hours is None else hours
         cycle = date.hour
 
         path = pathlib.Path(date.strftime("%Y%m%d"))
         path.mkdir(parents=True, exist_ok=True)
 
-        stmp = [] 
-        spfh = []
-        uwind = []
-        vwind = []
-        prmsl = []
-        prate = [] 
-        dlwrf = [] 
-        dswrf = [] 
-
-        Vars = {
-            'group1': {'sh2': ['174096', spfh], 't2m': ['167', stmp],'u10': ['165', uwind], 'v10': ['166', vwind]},
-            'group2': {'mslma': ['meanSea', prmsl]},
-            'group3': {'prate': ['surface', prate], 'dlwrf': ['surface', dlwrf], 'dswrf': ['surface', dswrf]}
-        }
-
-        #Get lon/lat
-        lon, lat, idx_ymin, idx_ymax, idx_xmin, idx_xmax = self.modified_latlon(grbfiles[0])
-
-        for ifile, file in enumerate(grbfiles):
-            logger.info(f'file {ifile} is {file}')
-
-            for key, value in Vars.items():
-                if key == 'group1':
-                    for key2, value2 in value.items():
-                        ds=xr.open_dataset(file,
-                            engine='cfgrib',
-                            backend_kwargs=dict(filter_by_keys={'paramId':int(value2[0])}))
-                        value2[1].append(ds[key2][idx_ymin:idx_ymax+1, idx_xmin:idx_xmax+1].astype('float32'))
-                        ds.close()
-
-                elif key == 'group2':
-                    ds=xr.open_dataset(file,
-                        engine='cfgrib',
-                        backend_kwargs=dict(filter_by_keys={'typeOfLevel':'meanSea'}))
-                    for key2, value2 in value.items():
-                        value2[1].append(ds[key2][idx_ymin:idx_ymax+1, idx_xmin:idx_xmax+1].astype('float32'))
-                    ds.close()
-
-                else:
-                    ds=xr.open_dataset(file,
-                        engine='cfgrib',
-                        backend_kwargs=dict(filter_by_keys={'stepType': 'instant','typeOfLevel': 'surface'}))
-                    for key2, value2 in value.items():
-                        value2[1].append(ds[key2][idx_ymin:idx_ymax+1, idx_xmin:idx_xmax+1].astype('float32'))
-                    ds.close()    
-
         #write netcdf
         fout = xr.Dataset({
-            'stmp': (['time', 'ny_grid', 'nx_grid'], np.array(stmp)),
-            'spfh': (['time', 'ny_grid', 'nx_grid'], np.array(spfh)),
-            'uwind': (['time', 'ny_grid', 'nx_grid'], np.array(uwind)),
-            'vwind': (['time', 'ny_grid', 'nx_grid'], np.array(vwind)),
-            'prmsl': (['time', 'ny_grid', 'nx_grid'], np.array(prmsl)),
-            'prate': (['time', 'ny_grid', 'nx_grid'], np.array(prate)),
-            'dlwrf': (['time', 'ny_grid', 'nx_grid'], np.array(dlwrf)),
-            'dswrf': (['time', 'ny_grid', 'nx_grid'], np.array(dswrf)),
+            'stmp': (['time', 'ny_grid', 'nx_grid'], Vars['stmp']),
+            'spfh': (['time', 'ny_grid', 'nx_grid'], Vars['spfh']),
+            'uwind': (['time', 'ny_grid', 'nx_grid'], Vars['uwind']),
+            'vwind': (['time', 'ny_grid', 'nx_grid'], Vars['vwind']),
+            'prmsl': (['time', 'ny_grid', 'nx_grid'], Vars['prmsl']),
+            'prate': (['time', 'ny_grid', 'nx_grid'], Vars['prate']),
+            'dlwrf': (['time', 'ny_grid', 'nx_grid'], Vars['dlwrf']),
+            'dswrf': (['time', 'ny_grid', 'nx_grid'], Vars['dswrf']),
             },
             coords={
-                'time': np.round(np.arange(1, len(grbfiles)+1)/24, 4).astype('float32'),
+                'time': np.round(np.asarray(hours)/24, 4).astype('float32'),
                 'lon': (['ny_grid', 'nx_grid'], lon),
                 'lat': (['ny_grid', 'nx_grid'], lat)})
 
@@ -259,13 +282,11 @@ class HRRR:
         xmin = xmin + 360 if xmin < 0 else xmin
         xmax = xmax + 360 if xmax < 0 else xmax
        
-        ds=xr.open_dataset(grbfile,
-            engine='cfgrib',
-            backend_kwargs=dict(filter_by_keys={'stepType': 'instant','typeOfLevel': 'surface'}))
-        lon=ds.longitude.astype('float32')
-        lon_idxs=(lon.values >= xmin) & (lon.values <= xmax)
-        lat=ds.latitude.astype('float32')
-        lat_idxs=(lat.values >= ymin) & (lat.values <= ymax + 2.0)
+        lat, lon = get_grid(grbfile)
+        lon=lon.astype('float32')
+        lon_idxs=(lon >= xmin) & (lon <= xmax)
+        lat=lat.astype('float32')
+        lat_idxs=(lat >= ymin) & (lat <= ymax + 2.0)
         idxs = lon_idxs & lat_idxs
         idxs = np.argwhere(idxs)
         idx_ymin = np.min(idxs[:,0])
@@ -273,11 +294,10 @@ class HRRR:
         idx_xmin = np.min(idxs[:,1])
         idx_xmax = np.max(idxs[:,1])
      
-        lon2 = lon.values[idx_ymin:idx_ymax+1, idx_xmin:idx_xmax+1]
-        lat2 = lat.values[idx_ymin:idx_ymax+1, idx_xmin:idx_xmax+1]
+        lon2 = lon[idx_ymin:idx_ymax+1, idx_xmin:idx_xmax+1]
+        lat2 = lat[idx_ymin:idx_ymax+1, idx_xmin:idx_xmax+1]
         idxs = np.where(lon2 > 180)
         lon2[idxs] -= 360
         logger.info(f'idx_ymin is {idx_ymin}, idx_ymax is {idx_ymax}, idx_xmin is {idx_xmin}, idx_xmax is {idx_xmax}')
-        ds.close()
 
         return lon2, lat2, idx_ymin, idx_ymax, idx_xmin, idx_xmax
@@ -320,19 +320,17 @@ class SourceSink:
                 sink_max[element_id] = np.min(
                     [sink_max[element_id], data["flow"]])
 
-        aggregate_gdf = []
-        for element_id, maxflow in {**source_max, **sink_max}.items():
-            element_index = hgrid.elements.get_index_by_id(element_id)
-            aggregate_gdf.append(
-                {
-                    "element_id": element_id,
-                    "geometry": hgrid.elements.gdf.iloc[element_index].geometry,
-                    "maxflow": maxflow,
-                }
-            )
-        aggregate_gdf = gpd.GeoDataFrame(aggregate_gdf, crs=hgrid.crs).sort_values(
-            by="maxflow", key=abs, ascending=False
-        )
+        maxflow = {**source_max, **sink_max}
+        element_indexes = hgrid.elements.get_indexes_by_id(list(maxflow))
+        aggregate_gdf = gpd.GeoDataFrame(
+            {
+                "element_id": list(maxflow),
+                "geometry": hgrid.elements.get_gdf(
+                    element_indexes).geometry.values,
+                "maxflow": list(maxflow.values()),
+            },
+            crs=hgrid.crs,
+        ).sort_values(by="maxflow", key=abs, ascending=False)
 
         aggregation_mapping = {}
         for row in aggregate_gdf.itertuples():
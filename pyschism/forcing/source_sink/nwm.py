@@ -7,7 +7,6 @@ from multiprocessing import Pool, cpu_count
 import os
 import pathlib
 import posixpath
-import shutil
 
 import tarfile
 import tempfile
@@ -15,9 +14,7 @@ from time import time
 from typing import Union
 import urllib
 import appdirs
-import boto3
-from botocore import UNSIGNED
-from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
 import fiona
 import geopandas as gpd
 import matplotlib.pyplot as plt
@@ -33,6 +30,7 @@ from pyschism import dates
 from pyschism.mesh.base import Gr3
 
 from pyschism.forcing.source_sink.base import SourceSink, Sources, Sinks
+from pyschism.utils.s3 import S3Downloader, get_client
 
 DATADIR = pathlib.Path(appdirs.user_data_dir("pyschism/nwm"))
 DATADIR.mkdir(exist_ok=True, parents=True)
@@ -157,15 +155,15 @@ class NWMElementPairings:
                     d1 = segment_origin.distance(poi)
                     downstream = segment.interpolate(
                         d1 + np.finfo(np.float32).eps)
-                    element = hgrid.elements.gdf.iloc[idxs[row.Index]]
+                    element_id = hgrid.elements.get_id_by_index(idxs[row.Index])
                     if (
                         box(*LineString([poi, downstream]).bounds)
                         .intersection(hull)
                         .intersects(downstream)
                     ):
-                        sources[element.id].append(reaches.iloc[row.reachIndex].feature_id)
+                        sources[element_id].append(reaches.iloc[row.reachIndex].feature_id)
                     else:
-                        sinks[element.id].append(reaches.iloc[row.reachIndex].feature_id)
+                        sinks[element_id].append(reaches.iloc[row.reachIndex].feature_id)
                     break
 
         logger.info(
@@ -377,6 +375,15 @@ def streamflow_lookup(file, indexes, threshold=-1e-5):
     nc.close()
     return data
 
+def download_file(downloader, key, filename):
+    """Downloads key to filename. The sources need every hourly file, so
+    a file that can not be downloaded stops the inventory."""
+    try:
+        return downloader.download(key, filename)
+    except (ClientError, BotoCoreError, OSError, ValueError) as e:
+        raise IOError(f'NWM file {key} could not be downloaded: {e}') from e
+
+
 class AWSDataInventory(ABC):
     def __new__(
         cls, start_date, rnday, product=None, verbose=False, fallback=True, cache=None
@@ -510,9 +517,15 @@ class AWSHindcastInventory(AWSDataInventory):
 
         for requested_time in self._files:
             logger.info(f"Requesting NWM data for time {requested_time}")
-            self._files[requested_time] = self.request_data(
-                timefile.get(requested_time)
-            )
+        keys = [timefile.get(requested_time) for requested_time in self._files]
+        missing = [t for t, key in zip(self._files, keys) if key is None]
+        if missing:
+            raise IOError(f'No NWM hindcast file for {missing}.')
+        self.downloader = S3Downloader(self.bucket, self.s3)
+        with self.downloader:
+            filenames = self.downloader.map(self.request_data, keys)
+        logger.info(f"Downloaded NWM data: {self.downloader.metrics.summary()}")
+        self._files = dict(zip(self._files, filenames))
 
     def request_data(self, key):
         filename = self.tmpdir / key
@@ -522,12 +535,8 @@ class AWSHindcastInventory(AWSDataInventory):
                 filename = cached_file[0]
                 logger.info(f"Using cached file {filename}, ")
             else:
-                filename.parent.mkdir(parents=True, exist_ok=True)
-                tmpfile = tempfile.NamedTemporaryFile().name
-                with open(tmpfile, "wb") as f:
-                    logger.info(f"Downloading file {key}, ")
-                    self.s3.download_fileobj(self.bucket, key, f)
-                shutil.move(tmpfile, filename)
+                logger.info(f"Downloading file {key}, ")
+                download_file(self.downloader, key, filename)
         return filename
 
     @property
@@ -537,12 +546,7 @@ class AWSHindcastInventory(AWSDataInventory):
 
     @property
     def s3(self):
-        try:
-            return self._s3
-        except AttributeError:
-            self._s3 = boto3.client(
-                "s3", config=Config(signature_version=UNSIGNED))
-            return self._s3
+        return get_client()
 
     @property
     def output_interval(self) -> timedelta:
@@ -772,16 +776,16 @@ class AWSForecastInventory(AWSDataInventory):
         filedir.mkdir(exist_ok=True, parents=True)
 
         filedict = {}
-        for key in file_metadata[0:days*24+1]:
-            filetime = self.key2date(key)
-            filename = nwmdate.strftime("%Y%m%d") + '/' + key
-            filesubdir = pathlib.Path(filename)
-            filesubdir.parent.mkdir(parents=True, exist_ok=True)
-
+        keys = file_metadata[0:days*24+1]
+        filenames = [nwmdate.strftime("%Y%m%d") + '/' + key for key in keys]
+        for key, filename in zip(keys, filenames):
             logger.info(f"Downloading file {key}, ")
-            self.s3.download_file(self.bucket, key, filename)
-            filedict[filetime] = filename
-       
+            filedict[self.key2date(key)] = filename
+
+        with S3Downloader(self.bucket, self.s3) as downloader:
+            downloader.map(lambda key, filename: download_file(downloader, key, filename),
+                           keys, filenames)
+        logger.info(f"Downloaded NWM data: {downloader.metrics.summary()}")
         return filedict
 
     def key2date(self, key):
@@ -800,12 +804,7 @@ class AWSForecastInventory(AWSDataInventory):
     
     @property
     def s3(self):
-        try:
-            return self._s3
-        except AttributeError:
-            self._s3 = boto3.client(
-                "s3", config=Config(signature_version=UNSIGNED))
-            return self._s3
+        return get_client()
 
     @property
     def output_interval(self) -> timedelta:
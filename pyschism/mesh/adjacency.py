@@ -0,0 +1,116 @@
+"""Compressed sparse row (CSR) adjacency tables for mesh topology.
+
+An :class:`Adjacency` maps each of ``n`` rows (nodes or elements) onto a
+variable-length list of 0-based indexes, stored as the ``indptr`` and
+``indices`` arrays of a CSR matrix, so that row ``i`` is
+``indices[indptr[i]:indptr[i+1]]``.
+"""
+from typing import Dict
+
+import numpy as np
+
+
+class Adjacency:
+    def __init__(self, indptr, indices):
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices)
+
+    @classmethod
+    def from_pairs(cls, rows, cols, n: int, unique: bool = False):
+        """Builds the adjacency from (row, col) index pairs.
+
+        Within each row, the columns keep the order in which they are given
+        (the sort is stable). If unique is True, duplicate pairs are removed
+        and the columns of each row are sorted instead.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols)
+        if unique:
+            keys = np.sort(rows * n + cols)
+            keep = np.ones(keys.size, dtype=bool)
+            keep[1:] = keys[1:] != keys[:-1]
+            keys = keys[keep]
+            rows, cols = np.divmod(keys, n)
+        else:
+            order = np.argsort(rows, kind="stable")
+            rows, cols = rows[order], cols[order]
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+        return cls(indptr, cols.astype(np.int32))
+
+    def __len__(self):
+        return self.indptr.size - 1
+
+    def __getitem__(self, index: int) -> np.ndarray:
+        return self.indices[self.indptr[index]:self.indptr[index + 1]]
+
+    @property
+    def counts(self) -> np.ndarray:
+        """Number of entries in each row."""
+        return np.diff(self.indptr)
+
+    @property
+    def rows(self) -> np.ndarray:
+        """Row index of each entry of :attr:`indices`."""
+        return np.repeat(np.arange(len(self)), self.counts)
+
+    def to_list(self):
+        """Returns the rows as a list of arrays."""
+        return np.split(self.indices, self.indptr[1:-1])
+
+    def to_dict(self) -> Dict[str, np.ndarray]:
+        return {"indptr": self.indptr, "indices": self.indices}
+
+    def reduce(self, values, how: str = "max", fill_value=np.nan):
+        """Reduces values defined on the columns onto the rows.
+
+        Args:
+            values: Array of shape (m,) or (m, k) indexed by the columns
+                (e.g. an element field for a node to element adjacency).
+            how: One of 'max', 'min', 'sum' or 'mean'.
+            fill_value: Value assigned to empty rows.
+        """
+        ufuncs = {"max": np.maximum, "min": np.minimum, "sum": np.add,
+                  "mean": np.add}
+        if how not in ufuncs:
+            raise ValueError(
+                f"Argument how must be one of {list(ufuncs)}, not {how}.")
+        values = np.asarray(values)
+        counts = self.counts
+        nonempty = counts > 0
+        dtype = np.result_type(values.dtype, np.float64) \
+            if how == "mean" or np.isnan(fill_value) else values.dtype
+        out = np.full((len(self),) + values.shape[1:], fill_value, dtype=dtype)
+        if self.indices.size == 0:
+            return out
+        reduced = ufuncs[how].reduceat(
+            values[self.indices], self.indptr[:-1][nonempty], axis=0)
+        if how == "mean":
+            reduced = reduced / counts[nonempty].reshape(
+                (-1,) + (1,) * (values.ndim - 1))
+        out[nonempty] = reduced
+        return out
+
+    def expand(self, indexes, order: int = 1) -> np.ndarray:
+        """Returns the sorted union of indexes and of the rows reachable from
+        them in at most order steps (the k-ring neighbourhood)."""
+        if not isinstance(order, int) or order < 0:
+            raise ValueError("Argument order must be a non-negative int.")
+        visited = np.zeros(len(self), dtype=bool)
+        frontier = np.unique(np.atleast_1d(indexes))
+        visited[frontier] = True
+        for _ in range(order):
+            if frontier.size == 0:
+                break
+            neighbors = self.gather(frontier)
+            frontier = np.unique(neighbors[~visited[neighbors]])
+            visited[frontier] = True
+        return np.flatnonzero(visited)
+
+    def gather(self, indexes) -> np.ndarray:
+        """Returns the concatenated rows of indexes."""
+        indexes = np.asarray(indexes, dtype=np.int64)
+        starts = self.indptr[indexes]
+        counts = self.indptr[indexes + 1] - starts
+        offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+        return self.indices[offsets + np.arange(counts.sum())]
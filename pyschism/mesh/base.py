@@ -1,9 +1,7 @@
 from abc import ABC
-from collections import defaultdict
 from functools import lru_cache
 import hashlib
 import logging
-from itertools import permutations
 import os
 import pathlib
 import tempfile
@@ -11,28 +9,100 @@ from typing import Union, Sequence, Hashable, List, Dict
 
 import geopandas as gpd
 from matplotlib.collections import PolyCollection
-from matplotlib.path import Path
 from matplotlib.tri import Triangulation
 from matplotlib.transforms import Bbox
 import numpy as np
 from pyproj import Transformer, CRS
 import requests
-from shapely import ops
+import shapely
 from shapely.geometry import (
     box,
     LinearRing,
     LineString,
     MultiPolygon,
     Polygon,
-    Point,
 )
+from shapely.strtree import STRtree
 
+from pyschism.mesh import cache as mesh_cache
+from pyschism.mesh.adjacency import Adjacency
 from pyschism.mesh.parsers import grd, sms2dm
 from pyschism.figures import figure
 
 logger = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=None)
+def get_transformer(src_crs: CRS, dst_crs: CRS) -> Transformer:
+    """Returns an always_xy Transformer, reused across calls."""
+    return Transformer.from_crs(src_crs, dst_crs, always_xy=True)
+
+
+def transform_ll_to_cpp(lon, lat, lonc=-77.07, latc=24.0):
+    """Projects longitude/latitude (degrees) onto the Carte Parallelogrammatique
+    Projection (CPP) used by SCHISM, centered at lonc, latc."""
+    longitude = np.asarray(lon, dtype=float) / 180 * np.pi
+    latitude = np.asarray(lat, dtype=float) / 180 * np.pi
+    radius = 6378206.4
+    loncc = lonc / 180 * np.pi
+    latcc = latc / 180 * np.pi
+    x = radius * (longitude - loncc) * np.cos(latcc)
+    y = radius * latitude
+    return x, y
+
+
+class IdIndex:
+    """Maps integer ids onto 0-based array indexes.
+
+    When the ids are the contiguous sequence 1..N (the usual case for gr3
+    files) the mapping is implicit and no lookup table is built. Otherwise a
+    sorted copy of the ids is searched with :func:`numpy.searchsorted`.
+    """
+
+    def __init__(self, id_array: np.ndarray):
+        self.id_array = id_array
+        self.contiguous = bool(
+            np.array_equal(id_array, np.arange(1, id_array.size + 1))
+        )
+        if not self.contiguous:
+            self._sorter = np.argsort(id_array, kind="stable")
+
+    def __call__(self, ids) -> np.ndarray:
+        ids = np.asarray(ids).astype(np.int64)
+        if self.contiguous:
+            indexes = ids - 1
+            valid = (indexes >= 0) & (indexes < self.id_array.size)
+        else:
+            pos = np.searchsorted(self.id_array, ids, sorter=self._sorter)
+            indexes = self._sorter[np.clip(pos, 0, self.id_array.size - 1)]
+            valid = self.id_array[indexes] == ids
+        if not np.all(valid):
+            raise KeyError(ids[~valid].flat[0])
+        return indexes
+
+
+def integer_ids(ids: Sequence):
+    """Returns ids as an int64 array if every id is an integer or the string
+    representation of one, or None otherwise."""
+    ids = np.asarray(ids)
+    if ids.dtype == object:
+        ids = np.asarray(ids.tolist())
+    if ids.ndim != 1:
+        return None
+    if ids.dtype.kind in "iu":
+        return ids.astype(np.int64, copy=False)
+    if ids.dtype.kind != "U":
+        return None
+    try:
+        id_array = ids.astype(np.int64)
+    except (ValueError, OverflowError):
+        return None
+    if not np.array_equal(id_array.astype(str), ids):
+        # e.g. zero-padded string ids, which cannot be round-tripped
+        return None
+    return id_array
+
+
 class Nodes:
     def __init__(self, nodes: Dict[Hashable, List[List]], crs=None):
         """Setter for the nodes attribute.
@@ -55,62 +125,147 @@ class Nodes:
                 )
 
         self._id = list(nodes.keys())
-        self._coords = np.array([coords for coords, _ in nodes.values()])
+        self._id_array = integer_ids(self._id)
+        self._coords = np.array(
+            [coords for coords, _ in nodes.values()], dtype=float
+        ).reshape((-1, 2))
         self._crs = CRS.from_user_input(crs) if crs is not None else crs
         self._values = np.array([value for _, value in nodes.values()])
 
+    @classmethod
+    def from_arrays(cls, coords, values, id=None, crs=None):
+        """Creates a Nodes instance directly from numpy arrays.
+
+        Argument id is an optional integer array of node ids. When omitted,
+        nodes are numbered 1..N. The id list returned by :attr:`id` and the
+        dictionary returned by :meth:`to_dict` are only built on request.
+        """
+        coords = np.asarray(coords, dtype=float)
+        if coords.ndim != 2 or coords.shape[1] != 2:
+            raise ValueError(
+                "Coordinate vertices for a gr3 type must be 2D, but got "
+                f"coordinates array of shape {coords.shape}."
+            )
+        obj = cls.__new__(cls)
+        if id is None:
+            obj._id_array = np.arange(1, coords.shape[0] + 1)
+        else:
+            obj._id_array = integer_ids(id)
+            if obj._id_array is None:
+                obj._id = list(id)
+        obj._coords = coords
+        obj._crs = CRS.from_user_input(crs) if crs is not None else crs
+        obj._values = np.asarray(values, dtype=float)
+        return obj
+
     def transform_to(self, dst_crs):
         dst_crs = CRS.from_user_input(dst_crs)
         if not self.crs.equals(dst_crs):
-            self._coords = self.get_xy(dst_crs)
+            self._coords = self.get_xy(dst_crs).copy()
             self._crs = dst_crs
 
         if hasattr(self, "_gdf"):
             del self._gdf
 
     def transform_to_cpp(self, lonc, latc):
-        longitude = list(self.coord[:, 0]/180*np.pi)
-        latitude = list(self.coord[:, 1]/180*np.pi)
-        radius = 6378206.4
-        loncc = lonc / 180 * np.pi
-        latcc = latc / 180 * np.pi
-        x = [
-            radius * (longitude[i] - loncc) * np.cos(latcc)
-            for i in np.arange(len(longitude))
-        ]
-        y = [radius * latitude[i] for i in np.arange(len(latitude))]
+        x, y = transform_ll_to_cpp(self.coord[:, 0], self.coord[:, 1], lonc, latc)
         self._coords = np.vstack([x, y]).T
         self._crs = None
         return x, y
 
     def get_xy(self, crs: Union[CRS, str] = None):
+        """Node coordinates, transformed to crs if given. Transformed
+        coordinates are computed once per target CRS and returned as
+        read-only arrays until the node coordinates change."""
         if crs is not None:
             crs = CRS.from_user_input(crs)
             if not crs.equals(self.crs):
-                transformer = Transformer.from_crs(self.crs, crs, always_xy=True)
-                x, y = transformer.transform(self.coord[:, 0], self.coord[:, 1])
-                return np.vstack([x, y]).T
+                return self._get_cached_xy(crs)
         return self.coord
 
+    def get_cpp(self, lonc=-77.07, latc=24.0):
+        """Node coordinates in the CPP projection centered at lonc, latc,
+        cached like :meth:`get_xy`. The nodes must be geographic."""
+        return self._get_cached_xy(("cpp", lonc, latc))
+
+    def _get_cached_xy(self, key):
+        if getattr(self, "_xy_cache_coords", None) is not self._coords:
+            self._xy_cache = {}
+            self._xy_cache_coords = self._coords
+        key = (self.crs, key)
+        if key not in self._xy_cache:
+            if isinstance(key[1], CRS):
+                x, y = get_transformer(self.crs, key[1]).transform(
+                    self.coord[:, 0], self.coord[:, 1])
+            else:
+                x, y = transform_ll_to_cpp(
+                    self.coord[:, 0], self.coord[:, 1], *key[1][1:])
+            xy = np.vstack([x, y]).T
+            xy.flags.writeable = False
+            self._xy_cache[key] = xy
+        return self._xy_cache[key]
+
     @property
     def gdf(self):
         if not hasattr(self, "_gdf"):
-            data = []
-            for id, coord, values in zip(self._id, self._coords, self.values):
-                data.append({"geometry": Point(coord), "id": id, "values": values})
-            self._gdf = gpd.GeoDataFrame(data, crs=self.crs)
+            self._gdf = gpd.GeoDataFrame(
+                {
+                    "geometry": shapely.points(self._coords),
+                    "id": self.id,
+                    "values": list(self.values),
+                },
+                crs=self.crs,
+            )
         return self._gdf
 
+    def get_indexes_in_region(self, region) -> np.ndarray:
+        """Sorted indexes of the nodes strictly inside region.
+
+        Argument region is a Polygon, a MultiPolygon or a sequence of them,
+        in the coordinates of the nodes. Candidate nodes are taken from an
+        x-sorted index of the coordinates, which is kept until the
+        coordinates change, and tested against the prepared region with
+        shapely.contains_xy.
+        """
+        if getattr(self, "_x_order_coords", None) is not self._coords:
+            self._x_order = np.argsort(self._coords[:, 0], kind="stable")
+            self._x_sorted = self._coords[self._x_order, 0]
+            self._x_order_coords = self._coords
+        mask = np.zeros(len(self), dtype=bool)
+        for geom in region_geometries(region):
+            xmin, ymin, xmax, ymax = geom.bounds
+            candidates = self._x_order[
+                np.searchsorted(self._x_sorted, xmin, side="left"):
+                np.searchsorted(self._x_sorted, xmax, side="right")
+            ]
+            y = self._coords[candidates, 1]
+            candidates = candidates[(y >= ymin) & (y <= ymax)]
+            shapely.prepare(geom)
+            mask[candidates] |= shapely.contains_xy(
+                geom, self._coords[candidates, 0], self._coords[candidates, 1]
+            )
+        return np.flatnonzero(mask)
+
     @property
     def id(self):
+        if not hasattr(self, "_id"):
+            self._id = self._id_array.astype(str).tolist()
         return self._id
 
+    @property
+    def id_array(self):
+        """Integer node ids, or None if the ids are not integers."""
+        return self._id_array
+
     @property
     def index(self):
         if not hasattr(self, "_index"):
-            self._index = np.arange(len(self._id))
+            self._index = np.arange(len(self._coords))
         return self._index
 
+    def __len__(self):
+        return self._coords.shape[0]
+
     @property
     def crs(self):
         return self._crs
@@ -128,29 +283,43 @@ class Nodes:
         return self.coords
 
     def get_index_by_id(self, id: Hashable):
+        return int(self.get_indexes_by_id([id])[0])
+
+    def get_indexes_by_id(self, ids: Sequence) -> np.ndarray:
+        """Vectorized version of :meth:`get_index_by_id`."""
+        if self._id_array is not None:
+            if not hasattr(self, "_id_index"):
+                self._id_index = IdIndex(self._id_array)
+            return self._id_index(ids)
         if not hasattr(self, "node_id_to_index"):
             self.node_id_to_index = {self.id[i]: i for i in range(len(self.id))}
-        return self.node_id_to_index[id]
+        return np.array([self.node_id_to_index[id] for id in ids], dtype=int)
 
     def get_id_by_index(self, index: int):
-        if not hasattr(self, "node_index_to_id"):
-            self.node_index_to_id = {i: self.id[i] for i in range(len(self.id))}
-        return self.node_index_to_id[index]
+        return self.id[index]
 
     def to_dict(self):
         nodes = {
             nid: (coo, val)
-            for nid, coo, val in zip(self._id, self._coords, self.values)
+            for nid, coo, val in zip(self.id, self._coords, self.values)
         }
         return nodes
 
+    def to_arrays(self):
+        return {
+            "id": self._id_array
+            if self._id_array is not None
+            else np.array(self.id, dtype=object),
+            "coords": self.coords,
+            "values": self.values,
+        }
+
 
 class Elements:
     def __init__(self, nodes: Nodes, elements: Dict[Hashable, Sequence]):
         if not isinstance(elements, dict):
             raise TypeError("Argument elements must be a dict.")
 
-        vertex_id_set = set(nodes.id)
         for id, geom in elements.items():
             if not isinstance(geom, Sequence):
                 raise TypeError(
@@ -158,54 +327,142 @@ class Elements:
                     f"argument must be of type {Sequence}, not "
                     f"type {type(geom)}."
                 )
-            if not set(geom).issubset(vertex_id_set):
-                ValueError(
-                    f"Element with id {id} is not a subset of the " "coordinate id's."
-                )
+        i34 = np.fromiter(map(len, elements.values()), dtype=np.int8,
+                          count=len(elements))
+        if np.any((i34 < 3) | (i34 > 4)):
+            raise ValueError("Elements must be triangles or quadrilaterals.")
+        try:
+            indexes = nodes.get_indexes_by_id(
+                [v for geom in elements.values() for v in geom]
+            )
+        except KeyError as e:
+            raise ValueError(
+                f"Element vertex {e} is not a subset of the coordinate id's."
+            )
+        rank = int(i34.max()) if i34.size > 0 else 3
+        connectivity = np.full((len(elements), rank), -1, dtype=np.int32)
+        connectivity[np.arange(rank) < i34[:, None]] = indexes
         self.nodes = nodes
-        self.elements = elements
+        self.cache = None
+        self._elements = elements
+        self._id = list(elements.keys())
+        self._id_array = integer_ids(self._id)
+        self._connectivity = connectivity
+        self._i34 = i34
+
+    @classmethod
+    def from_array(cls, nodes: Nodes, connectivity, id=None):
+        """Creates an Elements instance from a connectivity table.
+
+        Argument connectivity is an integer array of shape (NE, 3) or (NE, 4)
+        holding 0-based node indexes, where triangle rows are padded with -1.
+        Argument id is an optional integer array of element ids, numbered
+        1..NE by default. The id-keyed dictionary returned by
+        :attr:`elements` is only built on request.
+        """
+        connectivity = np.asarray(connectivity, dtype=np.int32)
+        if connectivity.ndim != 2 or connectivity.shape[1] not in [3, 4]:
+            raise ValueError(
+                "Argument connectivity must be of shape (NE, 3) or (NE, 4), "
+                f"not {connectivity.shape}."
+            )
+        obj = cls.__new__(cls)
+        obj.nodes = nodes
+        obj.cache = None
+        obj._connectivity = connectivity
+        obj._i34 = np.sum(connectivity >= 0, axis=1).astype(np.int8)
+        if id is None:
+            obj._id_array = np.arange(1, connectivity.shape[0] + 1)
+        else:
+            obj._id_array = integer_ids(id)
+            if obj._id_array is None:
+                obj._id = list(id)
+        return obj
 
     def __len__(self):
-        return len(self.elements)
+        return self._connectivity.shape[0]
 
     def to_dict(self):
         return self.elements
 
+    def to_arrays(self):
+        return {
+            "id": self._id_array
+            if self._id_array is not None
+            else np.array(self.id, dtype=object),
+            "connectivity": self._connectivity,
+        }
+
+    def get_cached(self, name, builder):
+        """Returns the dictionary of derived arrays called name from the
+        binary mesh cache, building it with builder() and storing it if it
+        is not cached. Without a cache, builder() is always called."""
+        if self.cache is None:
+            return builder()
+        arrays = self.cache.get(name)
+        if arrays is None:
+            arrays = builder()
+            self.cache.put(name, **arrays)
+        return arrays
+
+    @property
+    def connectivity(self):
+        """Element to node table of 0-based node indexes, of shape (NE, 3)
+        or (NE, 4), where triangle rows are padded with -1."""
+        return self._connectivity
+
+    @property
+    def i34(self):
+        """Number of vertices of each element (3 or 4)."""
+        return self._i34
+
+    @property
+    def elements(self):
+        if not hasattr(self, "_elements"):
+            node_id = np.asarray(self.nodes.id)
+            self._elements = {
+                eid: node_id[row[row >= 0]].tolist()
+                for eid, row in zip(
+                    self._id_array.astype(str).tolist(), self._connectivity
+                )
+            }
+        return self._elements
+
     @property
     def id(self):
         if not hasattr(self, "_id"):
-            self._id = list(self.elements.keys())
+            self._id = self._id_array.astype(str).tolist()
         return self._id
 
+    @property
+    def id_array(self):
+        """Integer element ids, or None if the ids are not integers."""
+        return self._id_array
+
     @property
     def index(self):
         if not hasattr(self, "_index"):
-            self._index = np.arange(len(self.elements))
+            self._index = np.arange(len(self))
         return self._index
 
     def get_index_by_id(self, id: Hashable):
+        return int(self.get_indexes_by_id([id])[0])
+
+    def get_indexes_by_id(self, ids: Sequence) -> np.ndarray:
+        """Vectorized version of :meth:`get_index_by_id`."""
+        if self._id_array is not None:
+            if not hasattr(self, "_id_index"):
+                self._id_index = IdIndex(self._id_array)
+            return self._id_index(ids)
         if not hasattr(self, "element_id_to_index"):
             self.element_id_to_index = {self.id[i]: i for i in range(len(self.id))}
-        return self.element_id_to_index[id]
+        return np.array([self.element_id_to_index[id] for id in ids], dtype=int)
 
     def get_id_by_index(self, index: int):
-        if not hasattr(self, "element_index_to_id"):
-            self.element_index_to_id = {i: self.id[i] for i in range(len(self.id))}
-        return self.element_index_to_id[index]
+        return self.id[index]
 
     def get_indexes_around_index(self, index):
-        if not hasattr(self, "indexes_around_index"):
-
-            def append_geom(geom):
-                for simplex in geom:
-                    for i, j in permutations(simplex, 2):
-                        indexes_around_index[i].add(j)
-
-            indexes_around_index = defaultdict(set)
-            append_geom(self.triangles)
-            append_geom(self.quads)
-            self.indexes_around_index = indexes_around_index
-        return list(self.indexes_around_index[index])
+        return self.node_neighbors[index].tolist()
 
     def get_ball(self, order: int, id=None, index=None):
 
@@ -226,117 +483,182 @@ class Elements:
         if id is not None:
             index = self.get_index_by_id(id)
 
-        eidxs = set([index])
+        eidxs = np.array([index])
         for i in range(order):
-            elements = self.array[list(sorted(eidxs)), :]
-            new_neighbors = list(
-                map(self.get_indexes_around_index, list(set(elements.data.flatten())))
-            )
-            new_neighbors = set([item for sublist in new_neighbors for item in sublist])
-            eidxs = eidxs.union(
-                set(
-                    np.where(
-                        np.logical_and(
-                            np.any(
-                                np.isin(self.array, list(set(new_neighbors))), axis=1
-                            ),
-                            np.any(np.isin(self.array, elements), axis=1),
-                        )
-                    )[0]
-                )
-            )
+            nodes = self._connectivity[eidxs]
+            eidxs = np.unique(self.node_elements.gather(nodes[nodes >= 0]))
         return self.gdf.loc[eidxs].geometry.unary_union.exterior
 
     def get_node_ball(self):
         '''
         compute nodal ball information
         '''
-        elnode = self.array
-        NP = len(self.nodes.values)
-        nne = np.zeros(NP).astype('int')
-        ine = [[] for i in np.arange(NP)]
-        mask = np.any(elnode.mask)
-        for i, element in enumerate(elnode):
-            ele = element[~element.mask]
-            if mask:
-                i34 = len(ele)
-            else:
-                i34 = len(ele[0])
-            inds = elnode[i, :i34]
-            nne[inds] = nne[inds]+1
-            [ine[indi].append(i) for indi in inds]
-        ine = np.array([np.array(ine[i]) for i in np.arange(NP)], dtype='O') 
-        return nne, ine
+        ine = np.empty(len(self.nodes), dtype='O')
+        ine[:] = self.node_elements.to_list()
+        return self.node_elements.counts, ine
 
-    def get_triangulation_mask(self, element_mask):
+    @property
+    def node_elements(self):
+        """:class:`Adjacency` of the elements around each node (the node
+        ball), in ascending element order."""
+        if not hasattr(self, "_node_elements"):
+            self._node_elements = Adjacency(**self.get_cached(
+                "node_elements", self._build_node_elements))
+        return self._node_elements
 
-        triangulation_mask = []
-        for i, element in enumerate(self.elements.values()):
-            if len(element) == 3:
-                if element_mask[i]:
-                    triangulation_mask.append(True)
-                else:
-                    triangulation_mask.append(False)
-        for i, element in enumerate(self.elements.values()):
-            if len(element) == 4:
-                if element_mask[i]:
-                    triangulation_mask.append(True)
-                    triangulation_mask.append(True)
-                else:
-                    triangulation_mask.append(False)
-                    triangulation_mask.append(False)
+    @property
+    def node_neighbors(self):
+        """:class:`Adjacency` of the nodes sharing an element with each
+        node, sorted."""
+        if not hasattr(self, "_node_neighbors"):
+            self._node_neighbors = Adjacency(**self.get_cached(
+                "node_neighbors", self._build_node_neighbors))
+        return self._node_neighbors
 
-        return np.array(triangulation_mask)
+    @property
+    def element_neighbors(self):
+        """:class:`Adjacency` of the elements sharing a side with each
+        element, sorted."""
+        if not hasattr(self, "_element_neighbors"):
+            self._element_neighbors = Adjacency(**self.get_cached(
+                "element_neighbors", self._build_element_neighbors))
+        return self._element_neighbors
+
+    def _build_node_elements(self):
+        valid = self._connectivity >= 0
+        elements = np.broadcast_to(
+            np.arange(len(self))[:, None], valid.shape)[valid]
+        return Adjacency.from_pairs(
+            self._connectivity[valid], elements, len(self.nodes)).to_dict()
+
+    def _build_node_neighbors(self):
+        conn = self._connectivity
+        ncols = conn.shape[1]
+        i, j = np.nonzero(~np.eye(ncols, dtype=bool))
+        rows, cols = conn[:, i].ravel(), conn[:, j].ravel()
+        valid = (rows >= 0) & (cols >= 0)
+        return Adjacency.from_pairs(
+            rows[valid], cols[valid], len(self.nodes), unique=True).to_dict()
+
+    def _build_element_neighbors(self):
+        side_elements = self.side_elements
+        shared = side_elements[side_elements[:, 1] >= 0]
+        return Adjacency.from_pairs(
+            np.concatenate([shared[:, 0], shared[:, 1]]),
+            np.concatenate([shared[:, 1], shared[:, 0]]),
+            len(self), unique=True).to_dict()
+
+    def get_triangulation_mask(self, element_mask):
+        element_mask = np.asarray(element_mask, dtype=bool)
+        return np.concatenate(
+            [element_mask[self.tri_idxs], np.repeat(element_mask[self.qua_idxs], 2)]
+        )
 
     def get_areas(self):
-        if self.nodes.crs.is_geographic:
-            elements = []
-            for row in self.gdf.itertuples():
-                aeqd = CRS.from_user_input(
-                    f"+proj=aeqd +R=6371000 +units=m "
-                    f"+lat_0={row.geometry.centroid.y} +lon_0={row.geometry.centroid.x}"
-                )
-                current_to_aeqd = Transformer.from_crs(
-                    self.nodes.crs, aeqd, always_xy=True
-                ).transform
-                elements.append(ops.transform(current_to_aeqd, row.geometry))
-            return [element.area for element in elements]
-        else:
-            return [row.geometry.area for row in self.gdf.itertuples()]
+        """Element areas. For geographic meshes, each element is projected
+        onto a spherical azimuthal equidistant plane centered at its
+        centroid, and the areas are in square meters."""
+        if self.nodes.crs is not None and self.nodes.crs.is_geographic:
+            lon, lat = self._padded_coords()
+            lon0, lat0 = self.get_centroids().T
+            lon, lat, lon0, lat0 = map(np.radians, (lon, lat, lon0, lat0))
+            lat0, lon0 = lat0[:, None], lon0[:, None]
+            dlon = lon - lon0
+            cos_c = np.sin(lat0) * np.sin(lat) + \
+                np.cos(lat0) * np.cos(lat) * np.cos(dlon)
+            c = np.arccos(np.clip(cos_c, -1., 1.))
+            k = np.divide(c, np.sin(c), out=np.ones_like(c), where=c > 0.)
+            x = 6371000. * k * np.cos(lat) * np.sin(dlon)
+            y = 6371000. * k * (np.cos(lat0) * np.sin(lat) -
+                                np.sin(lat0) * np.cos(lat) * np.cos(dlon))
+            return np.abs(self._shoelace(x, y)[0])
+        return np.abs(self._shoelace(*self._padded_coords())[0])
+
+    def get_centroids(self):
+        """Element centroids, of shape (NE, 2)."""
+        x, y = self._padded_coords()
+        # shift to the first vertex to reduce round-off
+        x0, y0 = x[:, :1], y[:, :1]
+        area, cross = self._shoelace(x - x0, y - y0)
+        xs = (x - x0) + np.roll(x - x0, -1, axis=1)
+        ys = (y - y0) + np.roll(y - y0, -1, axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cx = np.sum(xs * cross, axis=1) / (6. * area)
+            cy = np.sum(ys * cross, axis=1) / (6. * area)
+        # degenerate elements fall back to the vertex mean
+        degenerate = area == 0.
+        cx[degenerate] = np.mean(x - x0, axis=1)[degenerate]
+        cy[degenerate] = np.mean(y - y0, axis=1)[degenerate]
+        return np.column_stack([cx + x0[:, 0], cy + y0[:, 0]])
+
+    def get_indexes_in_region(self, region, predicate="intersects"):
+        """Sorted indexes of the elements matching predicate against region.
+
+        Argument region is a Polygon, a MultiPolygon or a sequence of them.
+        Argument predicate is any binary shapely predicate name (e.g.
+        'intersects', 'within'), or 'vertex_within' to select the elements
+        with at least one vertex strictly inside region. Only the elements
+        whose bounding box overlaps the region are built as polygons.
+        """
+        if predicate == "vertex_within":
+            node_mask = np.zeros(len(self.nodes) + 1, dtype=bool)
+            node_mask[self.nodes.get_indexes_in_region(region)] = True
+            # -1 padding maps onto the trailing False entry
+            return np.flatnonzero(np.any(node_mask[self._connectivity], axis=1))
+        bboxes = self.get_bboxes()
+        mask = np.zeros(len(self), dtype=bool)
+        for geom in region_geometries(region):
+            xmin, ymin, xmax, ymax = geom.bounds
+            candidates = np.flatnonzero(
+                ~mask
+                & (bboxes[:, 0] <= xmax) & (bboxes[:, 2] >= xmin)
+                & (bboxes[:, 1] <= ymax) & (bboxes[:, 3] >= ymin)
+            )
+            shapely.prepare(geom)
+            mask[candidates] = getattr(shapely, predicate)(
+                self.get_gdf(candidates).geometry.values, geom
+            )
+        return np.flatnonzero(mask)
+
+    def get_bboxes(self):
+        """Element bounding boxes as (xmin, ymin, xmax, ymax) rows."""
+        x, y = self._padded_coords()
+        return np.column_stack(
+            [x.min(axis=1), y.min(axis=1), x.max(axis=1), y.max(axis=1)])
+
+    def _padded_coords(self):
+        # (NE, 4) vertex coordinates, with triangles closed on their first
+        # vertex so that the closing side adds nothing to the shoelace sums.
+        conn = self._connectivity
+        if conn.shape[1] == 3:
+            conn = np.column_stack([conn, conn[:, 0]])
+        conn = np.where(conn < 0, conn[:, :1], conn)
+        return self.nodes.coord[conn, 0], self.nodes.coord[conn, 1]
+
+    @staticmethod
+    def _shoelace(x, y):
+        cross = x * np.roll(y, -1, axis=1) - np.roll(x, -1, axis=1) * y
+        return 0.5 * np.sum(cross, axis=1), cross
 
     @property
     def array(self):
         if not hasattr(self, "_array"):
-            rank = int(max(map(len, self.elements.values())))
-            array = np.full((len(self.elements), rank), -1)
-            for i, element in enumerate(self.elements.values()):
-                row = np.array(list(map(self.nodes.get_index_by_id, element)))
-                array[i, : len(row)] = row
-            array = np.ma.masked_equal(array, -1)
-            self._array = array
+            rank = 4 if np.any(self.i34 == 4) else 3
+            self._array = np.ma.masked_equal(
+                self._connectivity[:, :rank].astype(int), -1
+            )
         return self._array
 
     @property
     def triangles(self):
         if not hasattr(self, "_triangles"):
-            self._triangles = np.array(
-                [
-                    list(map(self.nodes.get_index_by_id, element))
-                    for element in self.elements.values()
-                    if len(element) == 3
-                ]
-            )
+            self._triangles = self._connectivity[self.tri_idxs, :3]
         return self._triangles
 
     @property
     def tri_idxs(self):
         if not hasattr(self, "_tri_idxs"):
-            tri_idxs = np.full(len(self.elements), -99, dtype=int)
-            for i, element in enumerate(self.elements.values()):
-                if len(element) == 3:
-                    tri_idxs[i] = i
-            new_arr = np.delete(tri_idxs, np.where(tri_idxs == -99))
-            self._tri_idxs = new_arr
+            self._tri_idxs = np.flatnonzero(self.i34 == 3)
         return self._tri_idxs
 
     @property
@@ -346,75 +668,100 @@ class Elements:
     @property
     def quads(self):
         if not hasattr(self, "_quads"):
-            self._quads = np.array(
-                [
-                    list(map(self.nodes.get_index_by_id, element))
-                    for element in self.elements.values()
-                    if len(element) == 4
-                ]
-            )
+            if self._connectivity.shape[1] == 4:
+                self._quads = self._connectivity[self.qua_idxs]
+            else:
+                self._quads = np.empty((0, 4), dtype=np.int32)
         return self._quads
 
     @property
     def qua_idxs(self):
         if not hasattr(self, "_qua_idxs"):
-            qua_idxs = np.full(len(self.elements), -99, dtype=int)
-            for i, element in enumerate(self.elements.values()):
-                if len(element) == 4:
-                    qua_idxs[i] = i
-            new_arr = np.delete(qua_idxs, np.where(qua_idxs == -99))
-            self._qua_idxs = new_arr
+            self._qua_idxs = np.flatnonzero(self.i34 == 4)
         return self._qua_idxs
 
     @property
     def sides(self):
-        if not hasattr(self, "_sides"):
-
-            sides = []
-            for element in self.elements.values():
-                if len(element) == 3:
-                    results = list(map(self.nodes.get_index_by_id, element))
-                    # print(len(results))
-                    # print(f'nodes are {results[0]}, {results[1]}, {results[2]}')
-                    sides.append([results[1], results[2]])
-                    sides.append([results[2], results[0]])
-                    sides.append([results[0], results[1]])
-
-                elif len(element) == 4:
-                    results = list(map(self.nodes.get_index_by_id, element))
-                    # print(f'nodes are {p1}, {p2}, {p3}, {p4}')
-                    sides.append([results[1], results[2]])
-                    sides.append([results[2], results[3]])
-                    sides.append([results[3], results[0]])
-                    sides.append([results[0], results[1]])
-
-            # from pyPoseidon
-            def remove_reversed_duplicates(iterable):
-                # Create a set for already seen elements
-                seen = set()
-                for item in iterable:
-                    # Lists are mutable so we need tuples for the set-operations.
-                    tup = tuple(item)
-                    if tup not in seen:
-                        # If the tuple is not in the set append it in REVERSED order.
-                        seen.add(tup[::-1])
-                        # If you also want to remove normal duplicates uncomment the next line
-                        # seen.add(tup)
-                        yield item
-
-            self._sides = np.array(list(remove_reversed_duplicates(sides)))
-
-        return self._sides
+        """Side to node table of shape (NS, 2), holding the 0-based node
+        indexes of each unique side in the order in which the sides are
+        first found when walking the elements."""
+        return self.side_tables["sides"]
+
+    @property
+    def side_elements(self):
+        """Side to element table of shape (NS, 2). The first column is the
+        element in which the side was first found, the second one the
+        neighboring element, or -1 for boundary sides."""
+        return self.side_tables["side_elements"]
+
+    @property
+    def element_sides(self):
+        """Element to side table of shape (NE, 3) or (NE, 4), where side j of
+        an element is the one opposite to its vertex j (triangles) or
+        between its vertices j+1 and j+2 (quads). Triangle rows are padded
+        with -1."""
+        return self.side_tables["element_sides"]
+
+    @property
+    def side_tables(self):
+        """Dictionary with the sides, side_elements and element_sides
+        tables, built in a single pass and stored in the mesh cache."""
+        if not hasattr(self, "_side_tables"):
+            self._side_tables = self.get_cached("sides", self._build_sides)
+        return self._side_tables
+
+    def _build_sides(self):
+        conn = self._connectivity
+        NE, ncols = conn.shape
+        cols = np.arange(ncols)
+        tails = np.where(self.i34[:, None] == 3, (cols + 1) % 3, (cols + 1) % 4)
+        heads = np.where(self.i34[:, None] == 3, (cols + 2) % 3, (cols + 2) % 4)
+        rows = np.arange(NE)[:, None]
+        valid = cols[None, :] < self.i34[:, None]
+        # half-edges, in element order
+        sides = np.column_stack(
+            [conn[rows, tails][valid], conn[rows, heads][valid]]
+        ).astype(np.int64)
+        elements = np.broadcast_to(rows, valid.shape)[valid]
+        keys = np.sort(sides, axis=1)
+        keys = keys[:, 0] * len(self.nodes) + keys[:, 1]
+        # unique sides, using a stable sort so that first points to the
+        # first occurrence of each side
+        sort = np.argsort(keys, kind="stable")
+        starts = np.ones(keys.size, dtype=bool)
+        starts[1:] = keys[sort[1:]] != keys[sort[:-1]]
+        first = sort[starts]
+        inverse = np.empty_like(sort)
+        inverse[sort] = np.cumsum(starts) - 1
+        # renumber unique sides by first occurrence
+        order = np.argsort(first)
+        rank = np.empty_like(order)
+        rank[order] = np.arange(order.size)
+        side_index = rank[inverse]
+        side_elements = np.full((order.size, 2), -1, dtype=np.int32)
+        is_first = np.zeros(side_index.size, dtype=bool)
+        is_first[first] = True
+        side_elements[side_index[is_first], 0] = elements[is_first]
+        side_elements[side_index[~is_first], 1] = elements[~is_first]
+        element_sides = np.full((NE, ncols), -1, dtype=np.int32)
+        element_sides[valid] = side_index
+        return {
+            "sides": sides[first[order]],
+            "side_elements": side_elements,
+            "element_sides": element_sides,
+        }
 
     @property
     def triangulation(self):
         if not hasattr(self, "_triangulation"):
-            triangles = self.triangles.tolist()
-            for quad in self.quads:
-                triangles.append([quad[0], quad[1], quad[3]])
-                triangles.append([quad[1], quad[2], quad[3]])
+            quads = self.quads
+            split_quads = np.empty((2 * len(quads), 3), dtype=np.int32)
+            split_quads[0::2] = quads[:, [0, 1, 3]]
+            split_quads[1::2] = quads[:, [1, 2, 3]]
             self._triangulation = Triangulation(
-                self.nodes.coord[:, 0], self.nodes.coord[:, 1], triangles
+                self.nodes.coord[:, 0],
+                self.nodes.coord[:, 1],
+                np.vstack([self.triangles, split_quads]),
             )
         return self._triangulation
 
@@ -425,22 +772,40 @@ class Elements:
             from time import time
 
             start = time()
-            data = []
-            for id, element in self.elements.items():
-                data.append(
-                    {
-                        "geometry": Polygon(
-                            self.nodes.coord[list(map(self.get_index_by_id, element))]
-                        ),
-                        "id": id,
-                    }
-                )
-            self._gdf = gpd.GeoDataFrame(data, crs=self.nodes.crs)
+            self._gdf = self.get_gdf()
             logger.info(
                 "Generating elements geodataframe took " f"{time()-start} seconds."
             )
         return self._gdf
 
+    def get_gdf(self, indexes=None):
+        """Element polygons as a GeoDataFrame indexed by element index,
+        optionally for a subset of element indexes only."""
+        if indexes is None:
+            indexes = self.index
+        indexes = np.asarray(indexes, dtype=np.int64).reshape(-1)
+        conn = self._connectivity[indexes]
+        i34 = self.i34[indexes].astype(np.int64)
+        # closed rings as ragged arrays, built by GEOS in a single call
+        rings = np.full((len(indexes), conn.shape[1] + 1), -1, dtype=np.int64)
+        rings[:, :-1] = conn
+        rings[np.arange(len(indexes)), i34] = conn[:, 0]
+        ring_offsets = np.zeros(len(indexes) + 1, dtype=np.int64)
+        np.cumsum(i34 + 1, out=ring_offsets[1:])
+        geometry = shapely.from_ragged_array(
+            shapely.GeometryType.POLYGON,
+            self.nodes.coord[rings[rings >= 0]],
+            (ring_offsets, np.arange(len(indexes) + 1)),
+        )
+        return gpd.GeoDataFrame(
+            {
+                "geometry": geometry,
+                "id": np.asarray(self.id, dtype=object)[indexes],
+            },
+            index=indexes,
+            crs=self.nodes.crs,
+        )
+
 
 class Edges:
     def __init__(self, grd: "Gr3"):
@@ -469,7 +834,6 @@ class Edges:
 
 
 class Rings:
-    """Note: This only considers split-quads."""
 
     def __init__(self, grd: "Gr3"):
         self.gr3 = grd
@@ -497,12 +861,40 @@ class Rings:
 
     @lru_cache(maxsize=1)
     def sorted(self):
-        tri = self.gr3.elements.triangulation
-        idxs = np.vstack(list(np.where(tri.neighbors == -1))).T
-        boundary_edges = []
-        for i, j in idxs:
-            boundary_edges.append((tri.triangles[i, j], tri.triangles[i, (j + 1) % 3]))
-        return sort_rings(edges_to_rings(boundary_edges), self.gr3.nodes.coord)
+        arrays = self.gr3.elements.get_cached("rings", self._build_sorted)
+        rings = np.split(arrays["edges"], arrays["indptr"][1:-1])
+        _index_rings = dict()
+        for bnd_id, interior, ring in zip(
+            arrays["bnd_id"].tolist(), arrays["interior"], rings
+        ):
+            _index_rings.setdefault(bnd_id, {"exterior": None, "interiors": []})
+            if interior:
+                _index_rings[bnd_id]["interiors"].append(ring)
+            else:
+                _index_rings[bnd_id]["exterior"] = ring
+        return _index_rings
+
+    def _build_sorted(self):
+        elements = self.gr3.elements
+        boundary_sides = elements.sides[elements.side_elements[:, 1] == -1]
+        _index_rings = sort_rings(
+            edges_to_rings(boundary_sides), self.gr3.nodes.coord
+        )
+        rings, bnd_id, interior = [], [], []
+        for _id, index_rings in _index_rings.items():
+            for ring in [index_rings["exterior"], *index_rings["interiors"]]:
+                rings.append(ring)
+                bnd_id.append(_id)
+                interior.append(ring is not index_rings["exterior"])
+        indptr = np.zeros(len(rings) + 1, dtype=np.int64)
+        np.cumsum([len(ring) for ring in rings], out=indptr[1:])
+        return {
+            "edges": np.concatenate(rings) if len(rings) > 0
+            else np.empty((0, 2), dtype=np.int64),
+            "indptr": indptr,
+            "bnd_id": np.array(bnd_id, dtype=np.int64),
+            "interior": np.array(interior, dtype=bool),
+        }
 
 
 class Hull:
@@ -581,13 +973,17 @@ class Hull:
 class Gr3(ABC):
     def __init__(self, nodes, elements=None, description=None, crs=None):
 
-        self.nodes = Nodes(nodes, crs)
-        self.elements = Elements(self.nodes, elements)
+        self.nodes = nodes if isinstance(nodes, Nodes) else Nodes(nodes, crs)
+        self.elements = (
+            elements
+            if isinstance(elements, Elements)
+            else Elements(self.nodes, elements)
+        )
         self.description = "" if description is None else str(description)
         self.hull = Hull(self)
 
     def __str__(self):
-        return grd.to_string(**self.to_dict())
+        return grd.to_string(**self.to_arrays(), arrays=True)
 
     def to_dict(self):
         return {
@@ -597,9 +993,17 @@ class Gr3(ABC):
             "crs": self.crs,
         }
 
+    def to_arrays(self):
+        return {
+            "description": self.description,
+            "nodes": self.nodes.to_arrays(),
+            "elements": self.elements.to_arrays(),
+            "crs": self.crs,
+        }
+
     def write(self, path, overwrite=False, format="gr3"):
         if format in ["gr3", "grd"]:
-            grd.write(self.to_dict(), path, overwrite)
+            grd.write(self.to_arrays(), path, overwrite, arrays=True)
         elif format in ["sms", "2dm", "sms2dm"]:
             sms2dm.write(
                 {
@@ -656,27 +1060,75 @@ class Gr3(ABC):
         self.nodes.transform_to(dst_crs)
 
     def vertices_around_vertex(self, index):
-        return self.nodes.vertices_around_vertex(index)
+        return self.elements.get_indexes_around_index(index)
 
     def copy(self):
-        return self.__class__(**self.to_dict())
+        return self.__class__.from_arrays(**self._copy_arrays(self.to_arrays()))
+
+    @staticmethod
+    def _copy_arrays(_grd):
+        for key in ["nodes", "elements"]:
+            _grd[key] = {k: np.copy(v) for k, v in _grd[key].items()}
+        return _grd
+
+    @classmethod
+    def from_arrays(cls, nodes, elements, description=None, crs=None, **kwargs):
+        """Creates a mesh from the array dictionaries returned by
+        :func:`pyschism.mesh.parsers.grd.read` when called with
+        ``arrays=True``."""
+        _nodes = Nodes.from_arrays(crs=crs, **nodes)
+        return cls(
+            _nodes,
+            Elements.from_array(_nodes, **elements),
+            description=description,
+            crs=crs,
+            **kwargs,
+        )
 
     @classmethod
-    def open(cls, file: Union[str, os.PathLike], crs: Union[str, CRS] = None):
+    def open(
+        cls,
+        file: Union[str, os.PathLike],
+        crs: Union[str, CRS] = None,
+        cache: Union[bool, str, os.PathLike] = False,
+    ):
+        """Opens a grd-formatted mesh from a path or URL.
+
+        Args:
+            file: Path or URL of the mesh.
+            crs: CRS of the mesh, by default searched for in the description.
+            cache: If True, the parsed arrays are stored in a binary sidecar
+                cache (see :mod:`pyschism.mesh.cache`) that is memory-mapped
+                on later opens. A path selects the cache directory.
+        """
         if str(file).endswith(".ll") and crs is None:
             crs = "epsg:4326"
+        if cache is not False and pathlib.Path(file).is_file():
+            _grd, _cache = mesh_cache.read(
+                file,
+                boundaries=False,
+                crs=crs,
+                cache_dir=None if cache is True else cache,
+            )
+            obj = cls.from_arrays(**_grd)
+            obj.elements.cache = _cache
+            return obj
         try:
             response = requests.get(file)
             response.raise_for_status()
             tmpfile = tempfile.NamedTemporaryFile()
             with open(tmpfile.name, "w") as fh:
                 fh.write(response.text)
-            return cls(
-                **grd.read(pathlib.Path(tmpfile.name), crs=crs), boundaries=False
+            return cls.from_arrays(
+                **grd.read(
+                    pathlib.Path(tmpfile.name), boundaries=False, crs=crs,
+                    arrays=True)
             )
         except Exception:
             pass
-        return cls(**grd.read(pathlib.Path(file), boundaries=False, crs=crs))
+        return cls.from_arrays(
+            **grd.read(pathlib.Path(file), boundaries=False, crs=crs, arrays=True)
+        )
 
     @figure
     def tricontourf(self, axes=None, show=True, figsize=None, **kwargs):
@@ -796,16 +1248,74 @@ class Gr3(ABC):
 
     @property
     def md5(self):
-        return hashlib.md5(str(self).encode()).hexdigest()
+        """MD5 digest of the mesh content: description, ids, coordinates,
+        values and connectivity."""
+        md5 = hashlib.md5(self.description.encode())
+        for arrays in [self.nodes.to_arrays(), self.elements.to_arrays()]:
+            for array in arrays.values():
+                if array.dtype == object:
+                    md5.update(" ".join(map(str, array)).encode())
+                else:
+                    md5.update(np.ascontiguousarray(array).data)
+        return md5.hexdigest()
+
+
+def region_geometries(region):
+    """Returns region (a Polygon, MultiPolygon or a sequence of them) as a
+    list of geometries."""
+    if isinstance(region, (Polygon, MultiPolygon)):
+        return [region]
+    return list(region)
 
 
 def edges_to_rings(edges):
+    """Chains directed boundary edges into closed rings.
+
+    Each edge is linked to the edge leaving its end node, so the rings are
+    the cycles of the next-edge array. The cycles are labeled and ordered
+    with pointer doubling instead of walking them in Python. Returns a list
+    of (n, 2) arrays of edges.
+    """
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
     if len(edges) == 0:
-        return edges
+        return []
+    outgoing = np.argsort(edges[:, 0], kind="stable")
+    incoming = np.argsort(edges[:, 1], kind="stable")
+    if not np.array_equal(edges[outgoing, 0], edges[incoming, 1]):
+        logger.warning(
+            "Boundary edges are not consistently oriented, chaining them "
+            "without orientation."
+        )
+        return _chain_unoriented_edges(edges.tolist())
+    # the k-th edge entering a node continues with the k-th edge leaving it
+    next_edge = np.empty(len(edges), dtype=np.int64)
+    next_edge[incoming] = outgoing
+    # label each ring with its smallest edge index
+    label = np.arange(len(edges))
+    jump = next_edge.copy()
+    while True:
+        new_label = np.minimum(label, label[jump])
+        if np.array_equal(new_label, label):
+            break
+        label = new_label
+        jump = jump[jump]
+    # distance of each edge to the edge closing its ring
+    last = next_edge == label
+    distance = (~last).astype(np.int64)
+    jump = np.where(last, np.arange(len(edges)), next_edge)
+    while np.any(jump != jump[jump]):
+        distance += distance[jump]
+        jump = jump[jump]
+    order = np.lexsort((-distance, label))
+    splits = np.flatnonzero(np.diff(label[order])) + 1
+    return np.split(edges[order], splits)
+
+
+def _chain_unoriented_edges(edges):
     # start ordering the edges into linestrings
     edge_collection = list()
     ordered_edges = [edges.pop(-1)]
-    e0, e1 = [list(t) for t in zip(*edges)]
+    e0, e1 = [list(t) for t in zip(*edges)] if len(edges) > 0 else ([], [])
     while len(edges) > 0:
         if ordered_edges[-1][1] in e0:
             idx = e0.index(ordered_edges[-1][1])
@@ -820,16 +1330,12 @@ def edges_to_rings(edges):
             idx = e0.index(ordered_edges[0][0])
             ordered_edges.insert(0, list(reversed(edges.pop(idx))))
         else:
-            edge_collection.append(tuple(ordered_edges))
+            edge_collection.append(np.asarray(ordered_edges))
             idx = -1
             ordered_edges = [edges.pop(idx)]
         e0.pop(idx)
         e1.pop(idx)
-    # finalize
-    if len(edge_collection) == 0 and len(edges) == 0:
-        edge_collection.append(tuple(ordered_edges))
-    else:
-        edge_collection.append(tuple(ordered_edges))
+    edge_collection.append(np.asarray(ordered_edges))
     return edge_collection
 
 
@@ -840,62 +1346,45 @@ def sort_rings(index_rings, vertices):
     "interior" components. Any doubly-nested rings are considered exterior
     rings.
 
-    TODO: Refactor and optimize. Calls that use :class:matplotlib.path.Path can
-    probably be optimized using shapely.
+    The nesting depth of each ring is found by querying the first vertex of
+    every ring against an STRtree of the ring polygons. Rings at even depth
+    are exteriors, numbered by decreasing area, and rings at odd depth are
+    interiors of the smallest ring containing them.
     """
-
-    # sort index_rings into corresponding "polygons"
-    areas = list()
-    for index_ring in index_rings:
-        e0, e1 = [list(t) for t in zip(*index_ring)]
-        areas.append(float(Polygon(vertices[e0, :]).area))
-
-    # maximum area must be main mesh
-    idx = areas.index(np.max(areas))
-    exterior = index_rings.pop(idx)
-    areas.pop(idx)
-    _id = 0
+    index_rings = [np.asarray(index_ring) for index_ring in index_rings]
+    if len(index_rings) == 0:
+        return {}
+    ring_nodes = np.concatenate([index_ring[:, 0] for index_ring in index_rings])
+    ring_ids = np.repeat(
+        np.arange(len(index_rings)), [len(ring) for ring in index_rings]
+    )
+    polygons = shapely.polygons(
+        shapely.linearrings(vertices[ring_nodes, :2], indices=ring_ids)
+    )
+    areas = shapely.area(polygons)
+    points = shapely.points(
+        vertices[[index_ring[0, 0] for index_ring in index_rings], :2]
+    )
+    ring, container = STRtree(polygons).query(points, predicate="within")
+    ring, container = ring[ring != container], container[ring != container]
+    depth = np.bincount(ring, minlength=len(index_rings))
+    # the immediate parent is the smallest ring containing the first vertex
+    order = np.lexsort((areas[container], ring))
+    ring, container = ring[order], container[order]
+    first = np.ones(ring.size, dtype=bool)
+    first[1:] = ring[1:] != ring[:-1]
+    parent = np.full(len(index_rings), -1)
+    parent[ring[first]] = container[first]
+
+    exteriors = np.flatnonzero(depth % 2 == 0)
+    exteriors = exteriors[np.argsort(-areas[exteriors], kind="stable")]
     _index_rings = dict()
-    _index_rings[_id] = {"exterior": np.asarray(exterior), "interiors": []}
-    e0, e1 = [list(t) for t in zip(*exterior)]
-    path = Path(vertices[e0 + [e0[0]], :], closed=True)
-    while len(index_rings) > 0:
-        # find all internal rings
-        potential_interiors = list()
-        for i, index_ring in enumerate(index_rings):
-            e0, e1 = [list(t) for t in zip(*index_ring)]
-            if path.contains_point(vertices[e0[0], :]):
-                potential_interiors.append(i)
-        # filter out nested rings
-        real_interiors = list()
-        for i, p_interior in reversed(list(enumerate(potential_interiors))):
-            _p_interior = index_rings[p_interior]
-            check = [
-                index_rings[k]
-                for j, k in reversed(list(enumerate(potential_interiors)))
-                if i != j
-            ]
-            has_parent = False
-            for _path in check:
-                e0, e1 = [list(t) for t in zip(*_path)]
-                _path = Path(vertices[e0 + [e0[0]], :], closed=True)
-                if _path.contains_point(vertices[_p_interior[0][0], :]):
-                    has_parent = True
-            if not has_parent:
-                real_interiors.append(p_interior)
-        # pop real rings from collection
-        for i in reversed(sorted(real_interiors)):
-            _index_rings[_id]["interiors"].append(np.asarray(index_rings.pop(i)))
-            areas.pop(i)
-        # if no internal rings found, initialize next polygon
-        if len(index_rings) > 0:
-            idx = areas.index(np.max(areas))
-            exterior = index_rings.pop(idx)
-            areas.pop(idx)
-            _id += 1
-            _index_rings[_id] = {"exterior": np.asarray(exterior), "interiors": []}
-            e0, e1 = [list(t) for t in zip(*exterior)]
-            path = Path(vertices[e0 + [e0[0]], :], closed=True)
+    for _id, i in enumerate(exteriors):
+        _index_rings[_id] = {"exterior": index_rings[i], "interiors": []}
+    bnd_id = np.full(len(index_rings), -1)
+    bnd_id[exteriors] = np.arange(len(exteriors))
+    for i in np.flatnonzero(depth % 2 == 1):
+        _index_rings[bnd_id[parent[i]]]["interiors"].append(index_rings[i])
     return _index_rings
 
 
@@ -0,0 +1,228 @@
+"""Binary sidecar cache for grd-formatted meshes.
+
+The first time a mesh file is opened with caching enabled, the arrays
+produced by :func:`pyschism.mesh.parsers.grd.read` are saved as uncompressed
+``.npy`` files in a directory next to the mesh (``.hgrid.gr3.pyschism``).
+Later opens validate the cache against the size and modification time of the
+mesh file (or optionally its MD5 digest) and memory-map the arrays instead of
+parsing the ASCII file. Derived topology tables (node ball, side table, hull
+rings) can be stored in the same directory with :meth:`MeshCache.put`.
+
+If the directory of the mesh is not writable, the cache is kept under the
+user cache directory instead.
+"""
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import shutil
+import tempfile
+from typing import Dict, Union
+
+import appdirs
+import numpy as np
+
+from pyschism.mesh.parsers import grd
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 1
+
+
+def file_md5(path: Union[str, os.PathLike], blocksize: int = 2**24) -> str:
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+class MeshCache:
+    """Binary cache for a single mesh file.
+
+    Args:
+        path: Path to the grd-formatted mesh file.
+        cache_dir: Directory under which the cache is stored. Defaults to a
+            hidden sidecar directory next to the mesh file.
+    """
+
+    def __init__(
+            self,
+            path: Union[str, os.PathLike],
+            cache_dir: Union[str, os.PathLike] = None
+    ):
+        self.path = pathlib.Path(path).resolve()
+        if cache_dir is None:
+            self.directory = self.path.parent / f'.{self.path.name}.pyschism'
+            if not os.access(self.path.parent, os.W_OK):
+                self.directory = self._user_cache_directory()
+        else:
+            self.directory = pathlib.Path(cache_dir) / \
+                hashlib.md5(str(self.path).encode()).hexdigest()
+
+    def _user_cache_directory(self):
+        return pathlib.Path(appdirs.user_cache_dir('pyschism/mesh')) / \
+            hashlib.md5(str(self.path).encode()).hexdigest()
+
+    @property
+    def meta(self) -> Dict:
+        if not hasattr(self, '_meta'):
+            try:
+                with open(self.directory / 'meta.json') as f:
+                    self._meta = json.load(f)
+            except (OSError, ValueError):
+                self._meta = None
+        return self._meta
+
+    @property
+    def fingerprint(self) -> str:
+        """MD5 digest of the mesh file, computed once when the cache is
+        written."""
+        if self.meta is None:
+            return file_md5(self.path)
+        return self.meta['md5']
+
+    def is_valid(self, validate: str = 'mtime') -> bool:
+        """Checks the cache against the mesh file.
+
+        Args:
+            validate: 'mtime' compares the file size and modification time,
+                'md5' additionally compares the MD5 digest of the file.
+        """
+        if validate not in ['mtime', 'md5']:
+            raise ValueError("Argument validate must be 'mtime' or 'md5'.")
+        meta = self.meta
+        if meta is None or meta.get('version') != CACHE_VERSION:
+            return False
+        stat = self.path.stat()
+        if validate == 'md5':
+            return stat.st_size == meta['size'] and \
+                file_md5(self.path) == meta['md5']
+        return stat.st_size == meta['size'] and \
+            stat.st_mtime_ns == meta['mtime_ns']
+
+    def load(self, validate: str = 'mtime'):
+        """Returns the cached arrays in the form returned by
+        :func:`pyschism.mesh.parsers.grd.read` with ``arrays=True``, or None
+        if the cache is missing or stale. Arrays are memory-mapped
+        copy-on-write, so they can be modified without touching the cache.
+        """
+        if not self.is_valid(validate):
+            self._meta = None
+            return None
+        meta = self.meta
+        _grd = {
+            'description': meta['description'],
+            'nodes': {key: self._load(f'nodes.{key}')
+                      for key in ['id', 'coords', 'values']},
+            'elements': {key: self._load(f'elements.{key}')
+                         for key in ['id', 'connectivity']},
+        }
+        if meta['boundaries'] is not None:
+            boundaries = {}
+            for i, (ibtype, bnd_id) in enumerate(meta['boundaries']):
+                boundaries.setdefault(ibtype, {})[bnd_id] = {
+                    'indexes': self._load(f'boundaries.{i}')}
+            _grd['boundaries'] = boundaries
+        return _grd
+
+    def save(self, _grd):
+        """Writes the arrays returned by :func:`grd.read` to the cache,
+        replacing any previous content."""
+        stat = self.path.stat()
+        meta = {
+            'version': CACHE_VERSION,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'md5': file_md5(self.path),
+            'description': _grd['description'],
+            'boundaries': None,
+            'extras': [],
+        }
+        arrays = {f'nodes.{key}': _grd['nodes'][key]
+                  for key in ['id', 'coords', 'values']}
+        arrays.update({f'elements.{key}': _grd['elements'][key]
+                       for key in ['id', 'connectivity']})
+        if _grd.get('boundaries') is not None:
+            meta['boundaries'] = []
+            for ibtype, bnds in _grd['boundaries'].items():
+                for bnd_id, bnd in bnds.items():
+                    arrays[f'boundaries.{len(meta["boundaries"])}'] = \
+                        bnd['indexes']
+                    meta['boundaries'].append([ibtype, bnd_id])
+        self.directory.parent.mkdir(parents=True, exist_ok=True)
+        tmpdir = pathlib.Path(tempfile.mkdtemp(dir=self.directory.parent))
+        try:
+            for name, array in arrays.items():
+                np.save(tmpdir / f'{name}.npy', np.asarray(array))
+            with open(tmpdir / 'meta.json', 'w') as f:
+                json.dump(meta, f)
+            if self.directory.exists():
+                shutil.rmtree(self.directory)
+            os.rename(tmpdir, self.directory)
+        except Exception:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+            raise
+        self._meta = meta
+
+    def get(self, name: str):
+        """Returns a dictionary of derived arrays stored with :meth:`put`,
+        or None if they are not in the cache."""
+        if self.meta is None or name not in self.meta['extras']:
+            return None
+        prefix = f'extra.{name}.'
+        return {
+            file.name[len(prefix):-len('.npy')]: np.load(file, mmap_mode='c')
+            for file in self.directory.glob(f'{prefix}*.npy')
+        }
+
+    def put(self, name: str, **arrays):
+        """Stores derived arrays (e.g. node ball or side tables) alongside
+        the mesh arrays. Failures are logged and ignored."""
+        if self.meta is None:
+            return
+        try:
+            for key, array in arrays.items():
+                np.save(self.directory / f'extra.{name}.{key}.npy',
+                        np.asarray(array))
+            self._meta['extras'] = sorted(set(self.meta['extras']) | {name})
+            with open(self.directory / 'meta.json', 'w') as f:
+                json.dump(self._meta, f)
+        except OSError as e:
+            logger.warning(f'Could not write {name} to mesh cache: {e}')
+
+    def _load(self, name):
+        try:
+            return np.load(self.directory / f'{name}.npy', mmap_mode='c')
+        except ValueError:
+            # empty arrays cannot be memory-mapped
+            return np.load(self.directory / f'{name}.npy')
+
+
+def read(
+        path: Union[str, os.PathLike],
+        boundaries: bool = True,
+        crs=True,
+        validate: str = 'mtime',
+        cache_dir: Union[str, os.PathLike] = None,
+):
+    """Same as :func:`pyschism.mesh.parsers.grd.read` with ``arrays=True``,
+    but going through the binary cache of the mesh file.
+
+    Returns:
+        The grd dictionary and the :class:`MeshCache` instance.
+    """
+    mesh_cache = MeshCache(path, cache_dir)
+    _grd = mesh_cache.load(validate)
+    if _grd is None:
+        logger.info(f'Building binary cache for {path}.')
+        _grd = grd.read(path, crs=False, arrays=True)
+        try:
+            mesh_cache.save(_grd)
+        except OSError as e:
+            logger.warning(f'Could not write mesh cache for {path}: {e}')
+    if boundaries is False:
+        _grd.pop('boundaries', None)
+    grd.set_crs(_grd, crs, path)
+    return _grd, mesh_cache
@@ -5,8 +5,7 @@ from typing import Union
 import numpy as np
 
 from pyproj import CRS  # type: ignore[import]
-from shapely.geometry import Polygon, MultiPolygon, Point
-import geopandas as gpd
+from shapely.geometry import Polygon, MultiPolygon
 
 from pyschism.mesh.base import Gr3
 from pyschism.mesh.parsers import grd
@@ -53,15 +52,17 @@ class Fgrid(Gr3):
         filename = pathlib.Path(file).name
         if cls.__name__ == "Fgrid":
             return FrictionDispatch[
-                FrictionFilename(filename).name].value(
-                    **grd.read(pathlib.Path(file), boundaries=False, crs=crs))
+                FrictionFilename(filename).name].value.from_arrays(
+                    **grd.read(pathlib.Path(file), boundaries=False, crs=crs,
+                               arrays=True))
         else:
             return super().open(file, crs)
 
     @classmethod
     def constant(cls, hgrid, value):
-        obj = cls(**{k: v for k, v in hgrid.to_dict().items() if k
-                     in ['nodes', 'elements', 'description', 'crs']})
+        obj = cls.from_arrays(
+            **{k: v for k, v in hgrid.copy().to_arrays().items() if k
+               in ['nodes', 'elements', 'description', 'crs']})
         obj.values[:] = value
         obj.description = f'{cls.__name__.lower()} {obj.crs}'
         return obj
@@ -72,17 +73,7 @@ class Fgrid(Gr3):
             value
      ):
         # Assuming input polygons are in EPSG:4326
-        if isinstance(region, Polygon):
-            region = [region]
-        gdf1 = gpd.GeoDataFrame(
-                {'geometry': region}, crs=self.crs)
-
-        points = [Point(*coord) for coord in self.coords]
-        gdf2 = gpd.GeoDataFrame(
-                 {'geometry': points, 'index': list(range(len(points)))},
-                crs=self.crs)
-        gdf_in = gpd.sjoin(gdf2, gdf1, op="within")
-        picks = ([i.index for i in gdf_in.itertuples()])
+        picks = self.nodes.get_indexes_in_region(region)
         self.values[picks] = value
 
     def modify_by_region(self, hgrid, fname, value, depth1, flag):
@@ -97,17 +88,7 @@ class Fgrid(Gr3):
         poly = Polygon(coords)
 
         # Assuming input polygons are in EPSG:4326
-        #if isinstance(region, Polygon):
-        #    region = [region]
-        gdf1 = gpd.GeoDataFrame(
-                {'geometry': [poly]}, crs=self.crs)
-
-        points = [Point(*coord) for coord in self.coords]
-        gdf2 = gpd.GeoDataFrame(
-                 {'geometry': points, 'index': list(range(len(points)))},
-                crs=self.crs)
-        gdf_in = gpd.sjoin(gdf2, gdf1, op="within")
-        picks = [i.index for i in gdf_in.itertuples()]
+        picks = self.nodes.get_indexes_in_region(poly)
         if flag == 0:
             self.values[picks] = value
         else:
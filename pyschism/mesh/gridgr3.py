@@ -4,21 +4,20 @@ import subprocess
 import tempfile
 from typing import Union
 
-import geopandas as gpd
 import numpy as np
-from shapely.geometry import Polygon, MultiPolygon, Point
+from shapely.geometry import Polygon, MultiPolygon
 
 from pyschism.forcing.hycom import Hycom
-from pyschism.mesh.base import Gr3
+from pyschism.mesh.base import Gr3, transform_ll_to_cpp
 
 
 class Gr3Field(Gr3):
     @classmethod
     def constant(cls, hgrid, value):
-        obj = cls(
+        obj = cls.from_arrays(
             **{
                 k: v
-                for k, v in hgrid.to_dict().items()
+                for k, v in hgrid.copy().to_arrays().items()
                 if k in ["nodes", "elements", "description", "crs"]
             }
         )
@@ -31,16 +30,7 @@ class Gr3Field(Gr3):
         raise NotImplementedError(f"No default defined for {cls.__name__}.")
 
     def add_region(self, region: Union[Polygon, MultiPolygon], value):
-        if isinstance(region, Polygon):
-            region = [region]
-        gdf1 = gpd.GeoDataFrame({"geometry": region}, crs=self.crs)
-
-        points = [Point(*coord) for coord in self.coords]
-        gdf2 = gpd.GeoDataFrame(
-            {"geometry": points, "index": list(range(len(points)))}, crs=self.crs
-        )
-        gdf_in = gpd.sjoin(gdf2, gdf1, op="within")
-        picks = [i.index for i in gdf_in.itertuples()]
+        picks = self.nodes.get_indexes_in_region(region)
         self.values[picks] = value
 
     def modify_by_region(self, hgrid, fname, value, depth1, flag):
@@ -55,14 +45,7 @@ class Gr3Field(Gr3):
         poly = Polygon(coords)
 
         #region is in cpp projection 
-        gdf1 = gpd.GeoDataFrame(
-                {'geometry': [poly]})
-
-        points = [Point(*coord) for coord in self.coords]
-        gdf2 = gpd.GeoDataFrame(
-                 {'geometry': points, 'index': list(range(len(points)))})
-        gdf_in = gpd.sjoin(gdf2, gdf1, op="within")
-        picks = [i.index for i in gdf_in.itertuples()]
+        picks = self.nodes.get_indexes_in_region(poly)
         if flag == 0:
             self.values[picks] = value
         else:
@@ -96,17 +79,7 @@ class Watertype(Gr3Field):
 
 
 def transform_to_cpp(coords, lonc, latc):
-    longitude = list(coords[:, 0] / 180 * np.pi)
-    latitude = list(coords[:, 1] / 180 * np.pi)
-    radius = 6378206.4
-    loncc = lonc / 180 * np.pi
-    latcc = latc / 180 * np.pi
-    x = [
-        radius * (longitude[i] - loncc) * np.cos(latcc)
-        for i in np.arange(len(longitude))
-    ]
-    y = [radius * latitude[i] for i in np.arange(len(latitude))]
-    return np.vstack([x, y]).T
+    return np.vstack(transform_ll_to_cpp(coords[:, 0], coords[:, 1], lonc, latc)).T
 
 
 class Shapiro(Gr3Field):
@@ -166,15 +139,8 @@ class Shapiro(Gr3Field):
             dpedy[fpn] = (dpedy[fpn]+dpedy2)/2
             dpedxy[fpn] = (dpedxy[fpn]+dpedxy2)/2
 
-        # get node ball information
-        nne, ine = hgrid.elements.get_node_ball()
-         
-        # interpolate into nodes
-        dpdxy = []
-        for inode in np.arange(len(dp)):
-            ind = ine[inode]
-            dpdxy.append(np.max(dpedxy[ind]))
-        slope = np.array(dpdxy)
+        # interpolate into nodes (maximum over the node ball)
+        slope = hgrid.elements.node_elements.reduce(dpedxy, 'max')
 
         shapiro = shapiro_max*np.tanh(2*slope/threshold_slope)
 
@@ -237,14 +203,7 @@ class ElevIc(IcField):
             poly = Polygon(coords)
 
             #region is in cpp projection 
-            gdf1 = gpd.GeoDataFrame(
-                    {'geometry': [poly]})
-
-            points = [Point(*coord) for coord in hgrid.nodes.coords]
-            gdf2 = gpd.GeoDataFrame(
-                     {'geometry': points, 'index': list(range(len(points)))})
-            gdf_in = gpd.sjoin(gdf2, gdf1, op="within")
-            picks = [i.index for i in gdf_in.itertuples()]
+            picks = hgrid.nodes.get_indexes_in_region(poly)
 
             #generate include.gr3
             obj = cls.constant(hgrid, 0)
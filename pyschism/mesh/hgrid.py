@@ -8,6 +8,7 @@ import numpy as np
 import requests
 
 from pyschism.figures import figure, get_topobathy_kwargs
+from pyschism.mesh import cache as mesh_cache
 from pyschism.mesh.parsers import grd
 from pyschism.mesh.base import Gr3  # , sort_edges, signed_polygon_area
 from pyschism.mesh.boundaries import Boundaries
@@ -23,25 +24,37 @@ class Hgrid(Gr3):
         self._boundaries = Boundaries(self, boundaries)
 
     @staticmethod
-    def open(path, crs=None):
+    def open(path, crs=None, cache=True):
+        """Opens an hgrid file from a path or URL.
+
+        Local files are cached in binary form on first load (see
+        :mod:`pyschism.mesh.cache`). Pass cache=False to always parse the
+        ASCII file, or a path to select the cache directory.
+        """
         if str(path).endswith(".ll") and crs is None:
             crs = "epsg:4326"
 
-        try:
-            response = requests.get(path)
-            response.raise_for_status()
-            tmpfile = tempfile.NamedTemporaryFile()
-            with open(tmpfile.name, "w") as fh:
-                fh.write(response.text)
-            _grd = grd.read(pathlib.Path(tmpfile.name), crs=crs)
-        except Exception:
-            _grd = grd.read(path, crs=crs)
-
-        _grd["nodes"] = {
-            id: (coords, -val) for id, (coords, val) in _grd["nodes"].items()
-        }
-
-        return Hgrid(**_grd)
+        _cache = None
+        if cache is not False and pathlib.Path(path).is_file():
+            _grd, _cache = mesh_cache.read(
+                path, crs=crs, cache_dir=None if cache is True else cache
+            )
+        else:
+            try:
+                response = requests.get(path)
+                response.raise_for_status()
+                tmpfile = tempfile.NamedTemporaryFile()
+                with open(tmpfile.name, "w") as fh:
+                    fh.write(response.text)
+                _grd = grd.read(pathlib.Path(tmpfile.name), crs=crs, arrays=True)
+            except Exception:
+                _grd = grd.read(path, crs=crs, arrays=True)
+
+        _grd["nodes"]["values"] = -_grd["nodes"]["values"]
+
+        hgrid = Hgrid.from_arrays(**_grd)
+        hgrid.elements.cache = _cache
+        return hgrid
 
     def to_dict(self, boundaries=True):
         _grd = super().to_dict()
@@ -58,8 +71,16 @@ class Hgrid(Gr3):
             return _grd
         return _grd
 
+    def to_arrays(self, boundaries=True):
+        _grd = super().to_arrays()
+        if boundaries is True:
+            _grd["nodes"]["values"] = -_grd["nodes"]["values"]
+            _grd["boundaries"] = self.boundaries.data
+        return _grd
+
     def copy(self):
-        return self.__class__(**super().to_dict())
+        return self.__class__.from_arrays(
+            **self._copy_arrays(super().to_arrays()))
 
     @figure
     def make_plot(
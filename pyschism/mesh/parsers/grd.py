@@ -1,4 +1,6 @@
 from collections import defaultdict
+import io
+from itertools import islice
 import os
 import numbers
 import pathlib
@@ -88,7 +90,108 @@ def buffer_to_dict(buf: TextIO):
             'boundaries': boundaries}
 
 
-def to_string(description, nodes, elements, boundaries=None, crs=None):
+def buffer_to_arrays(buf: TextIO):
+    """Reads a grd-formatted buffer directly into contiguous numpy arrays.
+
+    Node and element blocks are parsed in bulk instead of line by line.
+    Element connectivity is returned as 0-based node indexes in an int32
+    table of shape (NE, 4), padded with -1 on triangle rows. Boundary
+    indexes are returned as integer arrays of node ids.
+    """
+    description = buf.readline().strip()
+    NE, NP = map(int, buf.readline().split()[:2])
+    # See note in buffer_to_dict: the mesh is assumed to be strictly 2D.
+    node_block = np.loadtxt(islice(buf, NP), ndmin=2)
+    if node_block.shape[0] != NP:
+        raise ValueError(
+            f'Expected {NP} nodes but found {node_block.shape[0]}.')
+    node_id = node_block[:, 0].astype(np.int64)
+    coords = np.ascontiguousarray(node_block[:, 1:3])
+    values = node_block[:, 3] if node_block.shape[1] == 4 \
+        else node_block[:, 3:]
+    values = np.ascontiguousarray(values)
+    del node_block
+    element_id, connectivity = _element_block_to_array(
+        ''.join(islice(buf, NE)), NE)
+    connectivity = _node_ids_to_indexes(node_id, connectivity)
+    grd = {
+        'description': description,
+        'nodes': {'id': node_id, 'coords': coords, 'values': values},
+        'elements': {'id': element_id, 'connectivity': connectivity},
+    }
+    try:
+        NOPE = int(buf.readline().split()[0])
+    except IndexError:
+        return grd
+    boundaries: Dict = defaultdict(dict)
+    buf.readline()
+    for _bnd_id in range(NOPE):
+        NETA = int(buf.readline().split()[0])
+        boundaries[None][_bnd_id] = {
+            'indexes': np.array(
+                [int(line.split()[0]) for line in islice(buf, NETA)],
+                dtype=np.int64)}
+    NBOU = int(buf.readline().split()[0])
+    buf.readline()
+    for _ in range(NBOU):
+        npts, ibtype = map(int, buf.readline().split()[:2])
+        _bnd_id = len(boundaries[ibtype]) if ibtype in boundaries else 0
+        indexes = [[int(val) for val in line.split() if '.' not in val]
+                   for line in islice(buf, npts)]
+        indexes = np.array(indexes, dtype=np.int64)
+        if indexes.ndim == 2 and indexes.shape[1] == 1:
+            indexes = indexes[:, 0]
+        boundaries[ibtype][_bnd_id] = {'indexes': indexes}
+    grd['boundaries'] = boundaries
+    return grd
+
+
+def _element_block_to_array(text: str, NE: int):
+    tokens = np.fromstring(text, dtype=np.int64, sep=' ')
+    # fast path: the block holds a single element type
+    for nv in (3, 4):
+        if tokens.size == NE * (nv + 2):
+            rows = tokens.reshape((NE, nv + 2))
+            if np.all(rows[:, 1] == nv):
+                connectivity = np.full((NE, 4), -1, dtype=np.int64)
+                connectivity[:, :nv] = rows[:, 2:]
+                return rows[:, 0].copy(), connectivity
+    # mixed triangles and quads: read the element type column to locate
+    # the start of each row in the token stream
+    element_id, nv = np.loadtxt(
+        io.StringIO(text), usecols=(0, 1), dtype=np.int64, ndmin=2).T
+    if element_id.size != NE or np.any((nv < 3) | (nv > 4)):
+        raise ValueError('Malformed element table in grd file.')
+    offsets = np.zeros(NE, dtype=np.int64)
+    np.cumsum(nv[:-1] + 2, out=offsets[1:])
+    connectivity = np.full((NE, 4), -1, dtype=np.int64)
+    for j in range(4):
+        mask = nv > j
+        connectivity[mask, j] = tokens[offsets[mask] + 2 + j]
+    return element_id, connectivity
+
+
+def _node_ids_to_indexes(node_id: np.ndarray, ids: np.ndarray):
+    """Maps an integer array of node ids into 0-based int32 node indexes.
+    Entries equal to -1 are kept as padding."""
+    pad = ids == -1
+    if np.array_equal(node_id, np.arange(1, node_id.size + 1)):
+        indexes = ids - 1
+    else:
+        sorter = np.argsort(node_id)
+        indexes = sorter[np.clip(np.searchsorted(
+            node_id, ids, sorter=sorter), 0, node_id.size - 1)]
+        if not np.all(pad | (node_id[indexes] == ids)):
+            raise ValueError('Element table references unknown node ids.')
+    indexes[pad] = -1
+    return indexes.astype(np.int32)
+
+
+CHUNK_SIZE = 100000
+
+
+def to_string(description, nodes, elements, boundaries=None, crs=None,
+              arrays: bool = False):
     """
     must contain keys:
         description
@@ -99,45 +202,127 @@ def to_string(description, nodes, elements, boundaries=None, crs=None):
         values
         boundaries (optional)
             indexes
+
+    If arrays is True, nodes and elements are expected in the form returned
+    by :func:`buffer_to_arrays`.
     """
-    NE, NP = len(elements), len(nodes)
-    out = [f"{description}", f"{NE} {NP}"]
-    # TODO: Probably faster if using np.array2string
-    for id, (coords, values) in nodes.items():
-        if isinstance(values, numbers.Number):
-            values = [values]
-        line = [f"{id}"]
-        line.extend([f"{x:<.8f}" for x in coords])
-        line.extend([f"{x:<.8f}" for x in values])
-        out.append(" ".join(line))
-
-    for id, element in elements.items():
-        line = [f"{id}"]
-        line.append(f"{len(element)}")
-        line.extend([f"{e}" for e in element])
-        out.append(" ".join(line))
-    if boundaries is None:
-        out.append('')
-        return "\n".join(out)
+    buf = io.StringIO()
+    write_buffer(buf, description, nodes, elements, boundaries, crs, arrays)
+    return buf.getvalue()
+
+
+def write_buffer(buf: TextIO, description, nodes, elements, boundaries=None,
+                 crs=None, arrays: bool = False, chunk_size: int = CHUNK_SIZE):
+    """Streams a grd-formatted mesh into a text buffer.
+
+    Node and element sections are formatted in blocks of chunk_size rows,
+    using a single printf-style operation per block, so memory stays bounded
+    for large meshes. The output is byte-identical to the line by line
+    formatting used by :func:`to_string`.
+    """
+    if not arrays:
+        nodes, elements = _dicts_to_arrays(nodes, elements)
+    node_id = np.asarray(nodes['id'])
+    connectivity = np.asarray(elements['connectivity'])
+    buf.write(f"{description}\n{connectivity.shape[0]} {node_id.shape[0]}\n")
+    _write_nodes(buf, node_id, nodes['coords'], nodes['values'], chunk_size)
+    _write_elements(buf, np.asarray(elements['id']),
+                    np.asarray(elements.get('vertex_id', node_id)),
+                    connectivity, chunk_size)
     if boundaries is not None:
-        out.append(f"{len(boundaries[None]):d} "
-                   "! total number of ocean boundaries")
-        # count total number of ocean boundaries
-        _sum = 0
-        for bnd in boundaries[None].values():
-            _sum += len(bnd['indexes'])
-        out.append(f"{int(_sum):d} ! total number of ocean boundary nodes")
-        # write ocean boundary indexes
-        for i, boundary in boundaries[None].items():
-            out.append(f"{len(boundary['indexes']):d}"
-                       f" ! number of nodes for ocean_boundary_{i}")
-            for idx in boundary['indexes']:
-                out.append(f"{idx}")
-    else:
-        out.append("0 ! total number of ocean boundaries")
-        out.append("0 ! total number of ocean boundary nodes")
+        buf.write("\n".join(_boundaries_to_lines(boundaries)))
+
+
+def _dicts_to_arrays(nodes, elements):
+    values = [[val] if isinstance(val, numbers.Number) else val
+              for _, val in nodes.values()]
+    node_id = np.empty(len(nodes), dtype=object)
+    node_id[:] = list(nodes.keys())
+    _nodes = {
+        'id': node_id,
+        'coords': np.array([coords for coords, _ in nodes.values()],
+                           dtype=float).reshape((-1, 2)),
+        'values': np.array(values, dtype=float).reshape((len(nodes), -1)),
+    }
+    # Element vertices are written exactly as they appear in the dictionary,
+    # which need not be a key of the node dictionary, so they are mapped onto
+    # a table of unique tokens.
+    tokens = {}
+    connectivity = np.full((len(elements), 4), -1, dtype=np.int64)
+    for i, element in enumerate(elements.values()):
+        connectivity[i, :len(element)] = [
+            tokens.setdefault(e, len(tokens)) for e in element]
+    element_id = np.empty(len(elements), dtype=object)
+    element_id[:] = list(elements.keys())
+    vertex_id = np.empty(len(tokens), dtype=object)
+    vertex_id[:] = list(tokens.keys())
+    return _nodes, {'id': element_id, 'connectivity': connectivity,
+                    'vertex_id': vertex_id}
+
+
+def _id_format(ids: np.ndarray):
+    return '%d' if np.issubdtype(ids.dtype, np.integer) else '%s'
+
+
+def _write_nodes(buf, node_id, coords, values, chunk_size):
+    coords = np.asarray(coords, dtype=float)
+    values = np.asarray(values, dtype=float).reshape((coords.shape[0], -1))
+    ncols = 3 + values.shape[1]
+    fmt = _id_format(node_id) + ' %.8f' * (ncols - 1) + '\n'
+    dtype = float if fmt.startswith('%d') else object
+    for i in range(0, coords.shape[0], chunk_size):
+        j = min(i + chunk_size, coords.shape[0])
+        block = np.empty((j - i, ncols), dtype=dtype)
+        block[:, 0] = node_id[i:j]
+        block[:, 1:3] = coords[i:j]
+        block[:, 3:] = values[i:j]
+        buf.write((fmt * (j - i)) % tuple(block.ravel().tolist()))
+
+
+def _write_elements(buf, element_id, node_id, connectivity, chunk_size):
+    if connectivity.shape[0] == 0:
+        return
+    vertex_fmt = _id_format(node_id)
+    fmt = {
+        nv: _id_format(element_id) + f' {nv}' + f' {vertex_fmt}' * nv + '\n'
+        for nv in (3, 4)
+    }
+    dtype = np.int64 if vertex_fmt == '%d' \
+        and _id_format(element_id) == '%d' else object
+    for i in range(0, connectivity.shape[0], chunk_size):
+        j = min(i + chunk_size, connectivity.shape[0])
+        block = connectivity[i:j]
+        quads = block.shape[1] == 4 and np.any(block[:, 3] >= 0)
+        rows = np.empty((j - i, 1 + block.shape[1]), dtype=dtype)
+        rows[:, 0] = element_id[i:j]
+        rows[:, 1:] = node_id[block]
+        if quads:
+            is_quad = block[:, 3] >= 0
+            line_fmt = ''.join(np.where(is_quad, fmt[4], fmt[3]).tolist())
+            rows = rows[np.hstack([np.ones((j - i, 4), dtype=bool),
+                                   is_quad[:, None]])]
+        else:
+            line_fmt = fmt[3] * (j - i)
+            rows = rows[:, :4].ravel()
+        buf.write(line_fmt % tuple(rows.tolist()))
+
+
+def _boundaries_to_lines(boundaries):
+    out = []
+    out.append(f"{len(boundaries[None]):d} "
+               "! total number of ocean boundaries")
+    # count total number of ocean boundaries
+    _sum = 0
+    for bnd in boundaries[None].values():
+        _sum += len(bnd['indexes'])
+    out.append(f"{int(_sum):d} ! total number of ocean boundary nodes")
+    # write ocean boundary indexes
+    for i, boundary in boundaries[None].items():
+        out.append(f"{len(boundary['indexes']):d}"
+                   f" ! number of nodes for ocean_boundary_{i}")
+        for idx in boundary['indexes']:
+            out.append(f"{idx}")
     # remaining boundaries
-    boundaries = {} if boundaries is None else boundaries
     _cnt = 0
     for key in boundaries:
         if key is not None:
@@ -163,22 +348,34 @@ def to_string(description, nodes, elements, boundaries=None, crs=None):
             out.append(' '.join(line))
             for idx in boundary['indexes']:
                 out.append(f"{idx}")
-    return "\n".join(out)
+    return out
 
 
-def read(resource: Union[str, os.PathLike], boundaries: bool = True, crs=True):
+def read(resource: Union[str, os.PathLike], boundaries: bool = True, crs=True,
+         arrays: bool = False):
     """Converts a file-like object representing a grd-formatted unstructured
     mesh into a python dictionary:
 
     Args:
         resource: Path to file on disk or file-like object such as
             :class:`io.StringIO`
+        arrays: If True, nodes, elements and boundaries are returned as
+            numpy arrays (see :func:`buffer_to_arrays`) instead of
+            dictionaries keyed by id.
     """
     resource = pathlib.Path(resource)
     with open(resource, 'r') as stream:
-        grd = buffer_to_dict(stream)
+        grd = buffer_to_arrays(stream) if arrays else buffer_to_dict(stream)
     if boundaries is False:
         grd.pop('boundaries', None)
+    set_crs(grd, crs, resource)
+    return grd
+
+
+def set_crs(grd, crs=True, resource=None):
+    """Adds the 'crs' key to a grd dictionary. If crs is True or None, the
+    CRS is searched for in the mesh description. If crs is False, no 'crs'
+    key is added."""
     if crs is True:
         crs = None
     if crs is None:
@@ -193,12 +390,11 @@ def read(resource: Union[str, os.PathLike], boundaries: bool = True, crs=True):
                       'information and no CRS was given.')
     if crs is not False:
         grd.update({'crs': crs})
-    return grd
 
 
-def write(grd, path, overwrite=False):
+def write(grd, path, overwrite=False, arrays: bool = False):
     path = pathlib.Path(path)
     if path.is_file() and not overwrite:
         raise Exception('File exists, pass overwrite=True to allow overwrite.')
     with open(path, 'w') as f:
-        f.write(to_string(**grd))
+        write_buffer(f, **grd, arrays=arrays)
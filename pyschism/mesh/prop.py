@@ -76,12 +76,12 @@ class Fluxflag(Prop):
             return next_value + 1, next_value
         upstream_val, downstream_val = get_next_value_pair()
 
-        upstream_node_mask = self.gr3.nodes.gdf.within(Polygon(upstream)).to_numpy()
-        upstream_elem_idxs = np.where(np.any(upstream_node_mask[self.gr3.elements.array], axis=1))
+        upstream_elem_idxs = self.gr3.elements.get_indexes_in_region(
+            Polygon(upstream), predicate='vertex_within')
         self.values[upstream_elem_idxs] = upstream_val
 
-        downstream_node_mask = self.gr3.nodes.gdf.within(Polygon(downstream)).to_numpy()
-        downstream_elem_idxs = np.where(np.any(downstream_node_mask[self.gr3.elements.array], axis=1))
+        downstream_elem_idxs = self.gr3.elements.get_indexes_in_region(
+            Polygon(downstream), predicate='vertex_within')
         self.values[downstream_elem_idxs] = downstream_val
 
     @classmethod
@@ -123,14 +123,10 @@ class Tvdflag(Prop):
                 f'Argument region must be an instance of types {Polygon} or '
                 f'{MultiPolygon}, not type {type(region)}.')
 
-        if isinstance(region, Polygon):
-            region = [region]
-
         obj = cls.constant(gr3, np.nan)
-        elements_gdf = gr3.elements.gdf
-        gdf_in = elements_gdf.geometry.intersects(region)
-        obj.values[gdf_in] = inner_value
-        outer_indexes = np.setdiff1d(elements_gdf.index, np.where(gdf_in))
+        inner_indexes = gr3.elements.get_indexes_in_region(region)
+        obj.values[inner_indexes] = inner_value
+        outer_indexes = np.setdiff1d(gr3.elements.index, inner_indexes)
         obj.values[outer_indexes] = outer_value
         return obj
 
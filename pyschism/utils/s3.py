@@ -0,0 +1,262 @@
+"""Concurrent downloads from the public NOAA S3 buckets.
+
+:class:`S3Downloader` downloads the objects of a bucket through one shared
+boto3 client and a bounded thread pool. Large objects are downloaded in
+parts with Range requests. Failed requests are retried with an exponential
+backoff. Each download is written to a temporary file, checked against the
+size and, for single part uploads, the MD5 ETag of the object, and only
+then renamed, so an interrupted or corrupted download never leaves a file
+behind. Missing objects are not retried. :class:`DownloadMetrics` keeps the
+latency and size of each download and reports the overall throughput.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import hashlib
+import logging
+import os
+import pathlib
+import re
+import threading
+from time import sleep, time
+
+import boto3
+from botocore import UNSIGNED
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def get_client():
+    """Returns the unsigned S3 client shared by the downloads. Retries are
+    left to S3Downloader."""
+    return boto3.client('s3', config=Config(
+        signature_version=UNSIGNED,
+        retries={'total_max_attempts': 1, 'mode': 'standard'},
+        max_pool_connections=32))
+
+
+def is_missing(error):
+    """True if error is the S3 error of a missing object."""
+    return isinstance(error, ClientError) and error.response.get(
+        'Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound')
+
+
+class DownloadMetrics:
+    """Latency and size of the requests of a S3Downloader."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.records = {}
+        self.start = None
+        self.end = None
+
+    def add(self, key, nbytes, start, end, attempts=1):
+        with self._lock:
+            self.records[key] = (nbytes, end - start, attempts)
+            self.start = start if self.start is None else min(self.start, start)
+            self.end = end if self.end is None else max(self.end, end)
+
+    @property
+    def nbytes(self):
+        return sum(record[0] for record in self.records.values())
+
+    @property
+    def throughput(self):
+        """Bytes per second, from the first request to the last."""
+        if not self.records or self.end <= self.start:
+            return 0.
+        return self.nbytes / (self.end - self.start)
+
+    def latency(self, key):
+        return self.records[key][1]
+
+    def summary(self):
+        if not self.records:
+            return 'No downloads'
+        latency = np.array([record[1] for record in self.records.values()])
+        retried = sum(record[2] > 1 for record in self.records.values())
+        return (
+            f'{len(self.records)} requests, {self.nbytes / 2**20:.1f} MiB at '
+            f'{self.throughput / 2**20:.1f} MiB/s, latency median '
+            f'{np.median(latency):.2f} s, max {latency.max():.2f} s, '
+            f'{retried} retried')
+
+
+class S3Downloader:
+    """Downloads the objects of a S3 bucket.
+
+    Args:
+        bucket: Name of the bucket.
+        s3: boto3 S3 client, get_client() by default.
+        workers: Number of objects downloaded at once.
+        retries: Number of retries of a failed request.
+        backoff: Seconds before the first retry, doubled at each retry.
+        multipart_threshold: Size in bytes from which objects are
+            downloaded in parts.
+        part_size: Size in bytes of the parts.
+    """
+
+    def __init__(
+            self,
+            bucket,
+            s3=None,
+            workers: int = 8,
+            retries: int = 4,
+            backoff: float = 1.,
+            multipart_threshold: int = 64 * 2**20,
+            part_size: int = 16 * 2**20,
+    ):
+        self.bucket = bucket
+        self.s3 = get_client() if s3 is None else s3
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.multipart_threshold = multipart_threshold
+        self.part_size = part_size
+        self.metrics = DownloadMetrics()
+        self._pool = ThreadPoolExecutor(workers)
+        # parts are downloaded in their own pool, since the downloads that
+        # wait for them may hold all the workers of the first one
+        self._parts = ThreadPoolExecutor(workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._pool.shutdown()
+        self._parts.shutdown()
+
+    def _retry(self, func, key):
+        """Calls func until it succeeds, at most retries + 1 times, and
+        returns its result and the number of attempts."""
+        for attempt in range(self.retries + 1):
+            try:
+                return func(), attempt + 1
+            except (ClientError, BotoCoreError, OSError, ValueError) as e:
+                if is_missing(e) or attempt == self.retries:
+                    raise
+                delay = self.backoff * 2**attempt
+                logger.info(f'Retrying {key} in {delay:.1f} s after: {e}')
+                sleep(delay)
+
+    def get(self, key, first=None, last=None):
+        """Returns the bytes of key, or of its bytes first to last (to the
+        end if last is None)."""
+        kwargs = {}
+        if first is not None:
+            kwargs['Range'] = f'bytes={first}-{"" if last is None else last}'
+
+        def get():
+            response = self.s3.get_object(Bucket=self.bucket, Key=key, **kwargs)
+            data = response['Body'].read()
+            if len(data) != response['ContentLength']:
+                raise ValueError(f'Incomplete read of {key}')
+            return data
+
+        start = time()
+        data, attempts = self._retry(get, key)
+        name = key if first is None else f'{key}[{first}:{"" if last is None else last}]'
+        self.metrics.add(name, len(data), start, time(), attempts)
+        return data
+
+    def get_ranges(self, key, ranges):
+        """Returns the bytes of the (first, last) ranges of key, requested
+        concurrently."""
+        return list(self._parts.map(lambda r: self.get(key, *r), ranges))
+
+    def download(self, key, path):
+        """Downloads key to path and returns path."""
+        path = pathlib.Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.parent / f'.{path.name}.{os.getpid()}.{threading.get_ident()}'
+        start = time()
+        head, _ = self._retry(
+            lambda: self.s3.head_object(Bucket=self.bucket, Key=key), key)
+        size = head['ContentLength']
+        etag = head.get('ETag', '').strip('"')
+
+        def download():
+            if size > self.multipart_threshold:
+                self._download_parts(key, tmp, size)
+            else:
+                self._download_single(key, tmp)
+            self._verify(key, tmp, size, etag)
+
+        try:
+            _, attempts = self._retry(download, key)
+            os.replace(tmp, path)
+        finally:
+            tmp.unlink(missing_ok=True)
+        self.metrics.add(key, size, start, time(), attempts)
+        return path
+
+    def _download_single(self, key, tmp):
+        response = self.s3.get_object(Bucket=self.bucket, Key=key)
+        with open(tmp, 'wb') as f:
+            for chunk in response['Body'].iter_chunks(2**20):
+                f.write(chunk)
+
+    def _download_parts(self, key, tmp, size):
+        with open(tmp, 'wb') as f:
+            f.truncate(size)
+        fd = os.open(tmp, os.O_WRONLY)
+        try:
+            def get_part(first):
+                last = min(first + self.part_size, size) - 1
+
+                def get():
+                    response = self.s3.get_object(
+                        Bucket=self.bucket, Key=key, Range=f'bytes={first}-{last}')
+                    data = response['Body'].read()
+                    if len(data) != last - first + 1:
+                        raise ValueError(f'Incomplete read of {key}')
+                    os.pwrite(fd, data, first)
+                self._retry(get, key)
+            for future in [self._parts.submit(get_part, first)
+                           for first in range(0, size, self.part_size)]:
+                future.result()
+        finally:
+            os.close(fd)
+
+    def _verify(self, key, tmp, size, etag):
+        if tmp.stat().st_size != size:
+            raise ValueError(
+                f'Downloaded {tmp.stat().st_size} bytes of {key}, expected {size}')
+        # the ETag of a single part upload is the MD5 of the object
+        if re.fullmatch('[0-9a-f]{32}', etag):
+            md5 = hashlib.md5()
+            with open(tmp, 'rb') as f:
+                for chunk in iter(lambda: f.read(2**20), b''):
+                    md5.update(chunk)
+            if md5.hexdigest() != etag:
+                raise ValueError(f'MD5 of {key} does not match its ETag')
+
+    def submit(self, func, *args):
+        """Calls func in the thread pool and returns its future."""
+        return self._pool.submit(func, *args)
+
+    def map(self, func, *iterables):
+        """Calls func on the items in the thread pool and returns the
+        results in order."""
+        return list(self._pool.map(func, *iterables))
+
+    def download_many(self, requests):
+        """Downloads the (key, path) requests concurrently. Returns the path
+        of each request, or None for the keys that could not be
+        downloaded."""
+        def download(request):
+            key, path = request
+            try:
+                return self.download(key, path)
+            except (ClientError, BotoCoreError, OSError, ValueError) as e:
+                logger.info(f'file {key} is not available: {e}')
+                return None
+        paths = self.map(download, requests)
+        logger.info(f'Downloaded from {self.bucket}: {self.metrics.summary()}')
+        return paths
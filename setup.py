@@ -124,6 +124,7 @@ setuptools.setup(
         'seawater',
         'xarray',
         'cfgrib',
+        'eccodes',
         'zarr',
         'fsspec',
         'stormevents',
@@ -0,0 +1,72 @@
+#! /usr/bin/env python
+import os
+import pathlib
+import tempfile
+import unittest
+
+import numpy as np
+
+from pyschism.mesh import Hgrid
+from pyschism.mesh.cache import MeshCache
+
+
+HGRID = """mesh with mixed elements
+3 6
+1 0.0 0.0 -1.0
+2 1.0 0.0 -2.0
+3 2.0 0.0 -3.0
+4 0.0 1.0 -4.0
+5 1.0 1.0 -5.0
+6 2.0 1.0 -6.0
+1 4 1 2 5 4
+2 3 2 3 6
+3 3 2 6 5
+1 = Number of open boundaries
+2 = Total number of open boundary nodes
+2 = Number of nodes for open boundary 1
+1
+2
+0 = number of land boundaries
+0 = Total number of land boundary nodes
+"""
+
+
+class MeshCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.tmpdir.name) / 'hgrid.gr3'
+        with open(self.path, 'w') as f:
+            f.write(HGRID)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_cache_roundtrip(self):
+        hgrid = Hgrid.open(self.path, crs='epsg:4326')
+        self.assertTrue(MeshCache(self.path).is_valid())
+        cached = Hgrid.open(self.path, crs='epsg:4326')
+        self.assertEqual(str(hgrid), str(cached))
+        self.assertEqual(hgrid.md5, cached.md5)
+        np.testing.assert_array_equal(
+            cached.boundaries.open.indexes.iloc[0], [0, 1])
+
+    def test_stale_cache(self):
+        Hgrid.open(self.path, crs='epsg:4326')
+        with open(self.path, 'w') as f:
+            f.write(HGRID.replace('-6.0', '-7.0'))
+        os.utime(self.path, ns=(0, 0))
+        self.assertFalse(MeshCache(self.path).is_valid())
+        hgrid = Hgrid.open(self.path, crs='epsg:4326')
+        self.assertEqual(hgrid.values[-1], 7.)
+
+    def test_derived_arrays(self):
+        hgrid = Hgrid.open(self.path, crs='epsg:4326')
+        sides = hgrid.elements.sides
+        cached = Hgrid.open(self.path, crs='epsg:4326')
+        self.assertIsNotNone(cached.elements.cache.get('sides'))
+        np.testing.assert_array_equal(cached.elements.sides, sides)
+
+
+if __name__ == '__main__':
+    unittest.main()
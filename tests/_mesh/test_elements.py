@@ -0,0 +1,122 @@
+#! /usr/bin/env python
+import unittest
+
+import numpy as np
+from shapely.geometry import box
+
+from pyschism.mesh.base import Gr3, edges_to_rings
+
+
+class ElementsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.nodes = {
+            '10': ((0., 0.), -1.),
+            '20': ((1., 0.), -2.),
+            '30': ((2., 0.), -3.),
+            '40': ((0., 1.), -4.),
+            '50': ((1., 1.), -5.),
+            '60': ((2., 1.), -6.),
+        }
+        self.elements = {
+            '1': ['10', '20', '50', '40'],
+            '2': ['20', '30', '60'],
+            '3': ['20', '60', '50'],
+        }
+        self.gr3 = Gr3(self.nodes, self.elements)
+
+    def test_connectivity(self):
+        elements = self.gr3.elements
+        np.testing.assert_array_equal(
+            elements.connectivity, [[0, 1, 4, 3], [1, 2, 5, -1], [1, 5, 4, -1]])
+        np.testing.assert_array_equal(elements.i34, [4, 3, 3])
+        np.testing.assert_array_equal(elements.triangles, [[1, 2, 5], [1, 5, 4]])
+        np.testing.assert_array_equal(elements.quads, [[0, 1, 4, 3]])
+        np.testing.assert_array_equal(elements.tri_idxs, [1, 2])
+        np.testing.assert_array_equal(elements.qua_idxs, [0])
+
+    def test_ids(self):
+        self.assertEqual(self.gr3.nodes.get_index_by_id('50'), 4)
+        self.assertEqual(self.gr3.nodes.get_index_by_id(50), 4)
+        np.testing.assert_array_equal(
+            self.gr3.nodes.get_indexes_by_id(['60', '10']), [5, 0])
+        self.assertEqual(self.gr3.elements.get_index_by_id('3'), 2)
+        self.assertEqual(self.gr3.nodes.get_id_by_index(1), '20')
+        with self.assertRaises(KeyError):
+            self.gr3.nodes.get_index_by_id('70')
+
+    def test_sides(self):
+        np.testing.assert_array_equal(
+            self.gr3.elements.sides,
+            [[1, 4], [4, 3], [3, 0], [0, 1], [2, 5], [5, 1], [1, 2], [5, 4]])
+        np.testing.assert_array_equal(
+            self.gr3.elements.side_elements,
+            [[0, 2], [0, -1], [0, -1], [0, -1],
+             [1, -1], [1, 2], [1, -1], [2, -1]])
+        np.testing.assert_array_equal(
+            self.gr3.elements.element_sides,
+            [[0, 1, 2, 3], [4, 5, 6, -1], [7, 0, 5, -1]])
+
+    def test_adjacency(self):
+        elements = self.gr3.elements
+        nne, ine = elements.get_node_ball()
+        np.testing.assert_array_equal(nne, [1, 3, 1, 1, 2, 2])
+        np.testing.assert_array_equal(ine[1], [0, 1, 2])
+        self.assertEqual(elements.get_indexes_around_index(0), [1, 3, 4])
+        np.testing.assert_array_equal(elements.element_neighbors[2], [0, 1])
+        np.testing.assert_array_equal(
+            elements.node_elements.reduce([1., 2., 3.], 'max'),
+            [1., 3., 2., 1., 3., 3.])
+        np.testing.assert_array_equal(
+            elements.node_elements.reduce([1., 2., 3.], 'mean'),
+            [1., 2., 2., 1., 2., 2.5])
+        np.testing.assert_array_equal(
+            elements.node_neighbors.expand([2], 1), [1, 2, 5])
+
+    def test_rings(self):
+        rings = self.gr3.hull.rings.sorted()
+        self.assertEqual(list(rings), [0])
+        self.assertEqual(rings[0]['interiors'], [])
+        exterior = rings[0]['exterior']
+        np.testing.assert_array_equal(exterior[1:, 0], exterior[:-1, 1])
+        self.assertEqual(sorted(exterior[:, 0]), [0, 1, 2, 3, 4, 5])
+        rings = edges_to_rings([[0, 1], [4, 5], [2, 0], [5, 3], [1, 2], [3, 4]])
+        self.assertEqual(len(rings), 2)
+        np.testing.assert_array_equal(rings[1], [[4, 5], [5, 3], [3, 4]])
+
+    def test_geometry(self):
+        elements = self.gr3.elements
+        np.testing.assert_allclose(elements.get_areas(), [1., 0.5, 0.5])
+        np.testing.assert_allclose(
+            elements.get_centroids(),
+            [[0.5, 0.5], [5. / 3., 1. / 3.], [4. / 3., 2. / 3.]])
+        np.testing.assert_allclose(
+            elements.get_bboxes()[1], [1., 0., 2., 1.])
+        gdf = elements.get_gdf([2, 0])
+        self.assertEqual(list(gdf.index), [2, 0])
+        self.assertEqual(list(gdf.id), ['3', '1'])
+        self.assertTrue(gdf.geometry.iloc[1].equals(elements.gdf.geometry[0]))
+        np.testing.assert_allclose(gdf.area, [0.5, 1.])
+
+    def test_region(self):
+        region = box(0.5, -0.5, 2.5, 0.5)
+        np.testing.assert_array_equal(
+            self.gr3.nodes.get_indexes_in_region(region), [1, 2])
+        np.testing.assert_array_equal(
+            self.gr3.nodes.get_indexes_in_region(
+                [region, box(-0.5, 0.5, 0.5, 1.5)]), [1, 2, 3])
+        np.testing.assert_array_equal(
+            self.gr3.elements.get_indexes_in_region(box(0.1, 0.1, 0.2, 0.2)),
+            [0])
+        np.testing.assert_array_equal(
+            self.gr3.elements.get_indexes_in_region(
+                box(1.5, -0.5, 2.5, 0.5), 'vertex_within'), [1])
+
+    def test_to_dict(self):
+        self.assertEqual(self.gr3.to_dict()['elements'], self.elements)
+        copy = self.gr3.copy()
+        self.assertEqual(copy.elements.to_dict(), self.elements)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+#! /usr/bin/env python
+import io
+import pathlib
+import tempfile
+import unittest
+
+import numpy as np
+
+from pyschism.mesh import Hgrid
+from pyschism.mesh.parsers import grd
+
+
+HGRID = """mesh with mixed elements
+3 6
+10 0.0 0.0 -1.0
+20 1.0 0.0 -2.0
+30 2.0 0.0 -3.0
+40 0.0 1.0 -4.0
+50 1.0 1.0 -5.0
+60 2.0 1.0 -6.0
+1 4 10 20 50 40
+2 3 20 30 60
+3 3 20 60 50
+1 = Number of open boundaries
+2 = Total number of open boundary nodes
+2 = Number of nodes for open boundary 1
+10
+20
+1 = number of land boundaries
+3 = Total number of land boundary nodes
+3 0 = Number of nodes for land boundary 1
+30
+60
+50
+"""
+
+
+class GrdArraysTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.tmpdir.name) / 'hgrid.gr3'
+        with open(self.path, 'w') as f:
+            f.write(HGRID)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_read_arrays(self):
+        _grd = grd.read(self.path, crs=False, arrays=True)
+        np.testing.assert_array_equal(
+            _grd['nodes']['id'], [10, 20, 30, 40, 50, 60])
+        np.testing.assert_array_equal(
+            _grd['nodes']['values'], [-1., -2., -3., -4., -5., -6.])
+        self.assertEqual(_grd['elements']['connectivity'].dtype, np.int32)
+        np.testing.assert_array_equal(
+            _grd['elements']['connectivity'],
+            [[0, 1, 4, 3], [1, 2, 5, -1], [1, 5, 4, -1]])
+        np.testing.assert_array_equal(
+            _grd['boundaries'][None][0]['indexes'], [10, 20])
+        np.testing.assert_array_equal(
+            _grd['boundaries'][0][0]['indexes'], [30, 60, 50])
+
+    def test_matches_dict_reader(self):
+        hgrid = Hgrid.open(self.path, crs='epsg:4326')
+        _grd = grd.read(self.path, crs=False)
+        self.assertEqual(hgrid.elements.to_dict(), _grd['elements'])
+        self.assertEqual(list(hgrid.nodes.to_dict()), list(_grd['nodes']))
+        self.assertEqual(hgrid.boundaries.land.indexes.iloc[0], [2, 5, 4])
+
+    def test_write_matches_dict_writer(self):
+        _grd = grd.read(self.path, crs=False)
+        hgrid = Hgrid.open(self.path, crs='epsg:4326')
+        output = pathlib.Path(self.tmpdir.name) / 'output.gr3'
+        hgrid.write(output)
+        self.assertEqual(output.read_text(), grd.to_string(**_grd))
+        self.assertEqual(
+            grd.to_string(**grd.read(self.path, crs=False, arrays=True),
+                          arrays=True),
+            grd.to_string(**_grd))
+
+    def test_write_chunks(self):
+        _grd = grd.read(self.path, crs=False, arrays=True)
+        buf = io.StringIO()
+        grd.write_buffer(buf, **_grd, arrays=True, chunk_size=2)
+        self.assertEqual(
+            buf.getvalue(), grd.to_string(**_grd, arrays=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
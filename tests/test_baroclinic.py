@@ -0,0 +1,113 @@
+#! /usr/bin/env python
+from datetime import datetime
+import pathlib
+import tempfile
+import types
+import unittest
+
+from netCDF4 import Dataset
+import numpy as np
+import pandas as pd
+from shapely.geometry import LineString
+
+from pyschism.forcing.bctides.baroclinic import BaroclinicBoundaries, merge_windows
+from pyschism.forcing.bctides.ncwriter import ThNcWriter
+from pyschism.forcing.hycom.gofs import GOFS
+
+from test_hycom import make_hycom
+
+
+class MergeWindowsTestCase(unittest.TestCase):
+
+    def test_merge(self):
+        reads = merge_windows({
+            0: ([2, 3, 4], [5, 6]),
+            1: ([3, 4, 5], [5, 6, 7]),
+            2: ([30, 31], [40, 41]),
+        })
+        self.assertEqual(reads, [
+            (slice(5, 8), slice(2, 6), [0, 1]),
+            (slice(40, 42), slice(30, 32), [2]),
+        ])
+
+
+class BaroclinicBoundariesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.tmpdir.name)
+        make_hycom(self.path / 'hycom.nc', [datetime(2018, 1, 1), datetime(2018, 1, 2)])
+        with Dataset(self.path / 'hycom.nc', 'a') as ds:
+            for name, factor in [('water_temp', 0.5), ('water_u', 0.01), ('water_v', -0.02)]:
+                var = ds.createVariable(name, 'i2', ('time', 'depth', 'lat', 'lon'),
+                                        fill_value=-30000)
+                var.scale_factor = 0.001
+                var.add_offset = 0.
+                var[:] = ds['salinity'][:] * factor
+        self.dataset = Dataset(self.path / 'hycom.nc')
+        gofs = GOFS(cache=False)
+        for component in (gofs.elevation, gofs.velocity, gofs.temperature, gofs.salinity):
+            component.get_datasets = lambda *args: {
+                datetime(2018, 1, 1): self.dataset, datetime(2018, 1, 2): self.dataset}
+
+        # two boundaries sharing a region and a distant one
+        xy = np.r_[np.c_[np.linspace(-95., -93., 5), np.full(5, 20.)],
+                   np.c_[np.linspace(-93., -92., 3), np.full(3, 20.5)],
+                   np.c_[np.full(4, -84.), np.linspace(25., 26., 4)]]
+        hgrid = types.SimpleNamespace(
+            values=np.linspace(5., 150., len(xy)), get_xy=lambda crs: xy)
+        vgrid = types.SimpleNamespace(ivcor=1, sigma=np.array([1., 0.5, 0.]), nvrt=3)
+        rows = []
+        for indexes in [np.arange(0, 5), np.arange(5, 8), np.arange(8, 12)]:
+            rows.append({
+                'indexes': indexes,
+                'geometry': LineString(xy[indexes]),
+                'iettype': types.SimpleNamespace(iettype=4, data_component=gofs.elevation),
+                'ifltype': types.SimpleNamespace(ifltype=4, data_component=gofs.velocity),
+                'itetype': types.SimpleNamespace(itetype=4, data_component=gofs.temperature),
+                'isatype': types.SimpleNamespace(isatype=4, data_component=gofs.salinity),
+            })
+        self.bctides = types.SimpleNamespace(
+            gdf=pd.DataFrame(rows), hgrid=hgrid, vgrid=vgrid)
+        self.components = {
+            'elev2D': (gofs.elevation, 1, 1),
+            'uv3D': (gofs.velocity, 3, 2),
+            'TEM_3D': (gofs.temperature, 3, 1),
+            'SAL_3D': (gofs.salinity, 3, 1),
+        }
+
+    def tearDown(self):
+        self.dataset.close()
+        self.tmpdir.cleanup()
+
+    def test_write(self):
+        expected = {}
+        for name, (component, nLevels, nComponents) in self.components.items():
+            with ThNcWriter(self.path / f'expected_{name}.nc', 12, nLevels, nComponents) as dst:
+                offset = 0
+                for boundary in self.bctides.gdf.itertuples():
+                    args = () if name == 'elev2D' else (self.bctides.hgrid, self.bctides.vgrid)
+                    component.put_boundary_ncdata(
+                        *args, boundary, dst, datetime(2018, 1, 1), 1, offset=offset,
+                        pixel_buffer=2, progress_bar=False)
+                    offset += len(boundary.indexes)
+                expected[name] = dst['time_series'][:]
+
+        timings = BaroclinicBoundaries(self.bctides, pixel_buffer=2).write(
+            {name: self.path / f'{name}.th.nc' for name in self.components},
+            datetime(2018, 1, 1), 1, progress_bar=False)
+        self.assertEqual(set(timings), {'read', 'interpolate', 'write'})
+        for name in self.components:
+            with Dataset(self.path / f'{name}.th.nc') as ds:
+                np.testing.assert_array_equal(ds['time_series'][:], expected[name])
+
+    def test_exists(self):
+        (self.path / 'elev2D.th.nc').touch()
+        with self.assertRaises(IOError):
+            BaroclinicBoundaries(self.bctides).write(
+                {'elev2D': self.path / 'elev2D.th.nc'}, datetime(2018, 1, 1), 1,
+                progress_bar=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,232 @@
+#! /usr/bin/env python
+from datetime import datetime
+import os
+import pathlib
+import tempfile
+import types
+import unittest
+from unittest.mock import patch
+
+import eccodes
+from netCDF4 import Dataset
+import numpy as np
+
+from pyschism.forcing.nws.nws2 import gfs2
+from pyschism.forcing.nws.nws2.grib2 import (
+    Grib2Decoder, download_messages, get_grid, get_ranges, parse_idx)
+from pyschism.utils.s3 import S3Downloader
+
+from test_s3 import ObjectStore
+
+
+def make_grib2(messages, filler=100, size=10000):
+    """Returns the bytes and the .idx text of a file holding the messages,
+    of 100 bytes, between filler messages of size bytes."""
+    data, idx = b'', []
+    fields = [(f'FILL{i}', 'surface', size) for i in range(filler // 2)] \
+        + [(*message.split(':'), 100) for message in messages] \
+        + [(f'FILL{i}', 'surface', size) for i in range(filler // 2, filler)]
+    for number, (variable, level, nbytes) in enumerate(fields, start=1):
+        idx.append(f'{number}:{len(data)}:d=2022030100:{variable}:{level}:1 hour fcst:')
+        data += variable.encode().ljust(nbytes, b'.')
+    return data, '\n'.join(idx) + '\n'
+
+
+def make_message(keys, values):
+    """Returns a GRIB2 message of values on a 1 degree lat/lon grid,
+    north to south from 30N, 260E."""
+    handle = eccodes.codes_grib_new_from_samples('GRIB2')
+    try:
+        for key, value in dict(
+                centre=7, Ni=values.shape[1], Nj=values.shape[0],
+                latitudeOfFirstGridPointInDegrees=30.,
+                longitudeOfFirstGridPointInDegrees=260.,
+                latitudeOfLastGridPointInDegrees=31. - values.shape[0],
+                longitudeOfLastGridPointInDegrees=259. + values.shape[1],
+                iDirectionIncrementInDegrees=1., jDirectionIncrementInDegrees=1.,
+                jScansPositively=0, **keys).items():
+            eccodes.codes_set(handle, key, value)
+        eccodes.codes_set_values(handle, values.ravel())
+        return eccodes.codes_get_message(handle)
+    finally:
+        eccodes.codes_release(handle)
+
+
+class Grib2IdxTestCase(unittest.TestCase):
+
+    def test_get_ranges(self):
+        records = parse_idx(
+            '1:0:d=2022030100:PRMSL:mean sea level:1 hour fcst:\n'
+            '2:100:d=2022030100:TMP:2 m above ground:1 hour fcst:\n'
+            '3:250:d=2022030100:SPFH:2 m above ground:1 hour fcst:\n'
+            '4:300:d=2022030100:HGT:surface:1 hour fcst:\n'
+            '5:420:d=2022030100:DSWRF:surface:0-1 hour ave fcst:\n')
+        self.assertEqual(records[1].variable, 'TMP')
+        self.assertEqual(records[4].forecast, '0-1 hour ave fcst')
+        self.assertEqual(
+            get_ranges(records, ['TMP:2 m above ground', 'SPFH:2 m above ground',
+                                 'DSWRF:surface']),
+            [(100, 299), (420, None)])
+
+
+class DownloadMessagesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.tmpdir.name)
+        self.store = ObjectStore()
+        self.downloader = S3Downloader('bucket', self.store.client(), backoff=0.)
+
+    def tearDown(self):
+        self.downloader.close()
+        self.store.close()
+        self.tmpdir.cleanup()
+
+    def test_download_messages(self):
+        data, idx = make_grib2(['TMP:2 m above ground', 'PRATE:surface'])
+        self.store.put('bucket', 'file', data)
+        self.store.put('bucket', 'file.idx', idx.encode())
+        download_messages(self.downloader, 'file', self.path / 'slim.grib2',
+                          ['PRATE:surface', 'TMP:2 m above ground'])
+        self.assertEqual((self.path / 'slim.grib2').read_bytes(),
+                         b'TMP'.ljust(100, b'.') + b'PRATE'.ljust(100, b'.'))
+        self.assertLess(self.store.served, 0.05 * len(data))
+
+    def test_no_idx(self):
+        self.store.put('bucket', 'file', b'GRIB' * 10)
+        download_messages(self.downloader, 'file', self.path / 'file.grib2',
+                          ['TMP:2 m above ground'])
+        self.assertEqual((self.path / 'file.grib2').read_bytes(), b'GRIB' * 10)
+
+    def test_gfs_inventory(self):
+        store = self.store
+        data, idx = make_grib2(gfs2.AWSGrib2Inventory.messages)
+        prefix = 'gfs.20220301/00/atmos/gfs.t00z.pgrb2.0p25'
+        for hour in range(4):
+            self.store.put('noaa-gfs-bdp-pds', f'{prefix}.f{hour:03d}', data)
+            self.store.put('noaa-gfs-bdp-pds', f'{prefix}.f{hour:03d}.idx', idx.encode())
+
+        class LocalInventory(gfs2.AWSGrib2Inventory):
+            s3 = store.client()
+
+        inventory = LocalInventory(datetime(2022, 3, 1), pscr=self.tmpdir.name)
+        self.assertEqual([pathlib.Path(f).name for f in inventory.files],
+                         [f'gfs.t00z.pgrb2.0p25.f{hour:03d}.grib2' for hour in range(1, 4)])
+        for file in inventory.files:
+            self.assertEqual(pathlib.Path(file).stat().st_size, 800)
+        self.assertLess(self.store.served, 0.05 * 3 * len(data))
+
+
+class Grib2DecoderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.tmpdir.name) / 'f.grib2'
+        self.values = np.arange(45.).reshape(5, 9)
+        self.path.write_bytes(
+            make_message({'paramId': 167}, self.values)
+            + make_message({'paramId': 165}, self.values + 100.)
+            + make_message(dict(
+                productDefinitionTemplateNumber=8, discipline=0, parameterCategory=4,
+                parameterNumber=192, typeOfFirstFixedSurface=1,
+                typeOfStatisticalProcessing=0), self.values + 200.))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_decode(self):
+        decoder = Grib2Decoder(
+            {name: gfs2.GFS.fields[name] for name in ('dswrf', 'stmp')},
+            (slice(1, 3), slice(2, 6)))
+        fields = decoder.decode(self.path)
+        self.assertEqual(fields['stmp'].dtype, np.float32)
+        np.testing.assert_allclose(fields['stmp'], self.values[1:3, 2:6], atol=1e-3)
+        np.testing.assert_allclose(fields['dswrf'], self.values[1:3, 2:6] + 200., atol=1e-3)
+
+        out = {'stmp': np.zeros((2, 4), np.float32), 'dswrf': np.zeros((2, 4), np.float32)}
+        decoder.decode(self.path, out)
+        np.testing.assert_array_equal(out['stmp'], fields['stmp'])
+
+    def test_missing(self):
+        with self.assertRaises(ValueError):
+            Grib2Decoder(gfs2.GFS.fields).decode(self.path)
+
+    def test_get_grid(self):
+        lat, lon = get_grid(self.path)
+        np.testing.assert_array_equal(lat, [30., 29., 28., 27., 26.])
+        np.testing.assert_array_equal(lon, np.arange(260., 269.))
+
+
+class GFSTestCase(unittest.TestCase):
+
+    keys = {
+        'TMP:2 m above ground': {'paramId': 167},
+        'SPFH:2 m above ground': {'paramId': 174096},
+        'UGRD:10 m above ground': {'paramId': 165},
+        'VGRD:10 m above ground': {'paramId': 166},
+        'PRMSL:mean sea level': {'shortName': 'prmsl', 'typeOfFirstFixedSurface': 101},
+        'PRATE:surface': dict(
+            discipline=0, parameterCategory=1, parameterNumber=7, typeOfFirstFixedSurface=1),
+        'DLWRF:surface': dict(
+            productDefinitionTemplateNumber=8, discipline=0, parameterCategory=5,
+            parameterNumber=192, typeOfFirstFixedSurface=1, typeOfStatisticalProcessing=0),
+        'DSWRF:surface': dict(
+            productDefinitionTemplateNumber=8, discipline=0, parameterCategory=4,
+            parameterNumber=192, typeOfFirstFixedSurface=1, typeOfStatisticalProcessing=0),
+        'HGT:surface': {'paramId': 129},
+    }
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmpdir.name)
+        self.store = ObjectStore()
+        self.values = np.arange(45.).reshape(5, 9)
+        # hour 5 of day 2 is not listed, hour 7 and all of day 3 can not be read
+        for day in (1, 2, 3):
+            prefix = f'gfs.2022030{day}/00/atmos/gfs.t00z.pgrb2.0p25'
+            for hour in range(25):
+                if (day, hour) == (2, 5):
+                    continue
+                data, idx = b'', []
+                for number, (message, keys) in enumerate(self.keys.items(), start=1):
+                    idx.append(f'{number}:{len(data)}:d=202203{day:02d}00:{message}:')
+                    if (day, hour) == (2, 7) or day == 3:
+                        data += message.encode().ljust(100, b'.')
+                    else:
+                        data += make_message(keys, self.values + 100 * day + hour)
+                self.store.put('noaa-gfs-bdp-pds', f'{prefix}.f{hour:03d}', data)
+                self.store.put('noaa-gfs-bdp-pds', f'{prefix}.f{hour:03d}.idx',
+                               '\n'.join(idx).encode())
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.store.close()
+        self.tmpdir.cleanup()
+
+    def test_gen_sflux(self):
+        with patch.object(gfs2.AWSGrib2Inventory, 's3', self.store.client()), \
+                self.assertLogs(gfs2.logger, 'WARNING') as logs:
+            gfs2.GFS(datetime(2022, 3, 1), 3, pscr=self.tmpdir.name, bbox=types.SimpleNamespace(
+                xmin=-97., xmax=-95., ymin=27., ymax=29.), decode_workers=2)
+        with Dataset('20220301/gfs_2022030100.nc') as ds:
+            np.testing.assert_array_equal(ds['lon'][0], [-98., -97., -96., -95., -94.])
+            np.testing.assert_array_equal(ds['lat'][:, 0], [26., 27., 28., 29., 30.])
+            np.testing.assert_allclose(
+                ds['stmp'][:], [self.values[::-1, 2:7] + 100 + hour for hour in range(1, 25)],
+                atol=1e-3)
+            np.testing.assert_allclose(ds['time'][:], np.round(np.arange(1, 25) / 24, 4))
+        hours = [hour for hour in range(1, 25) if hour not in (5, 7)]
+        with Dataset('20220302/gfs_2022030200.nc') as ds:
+            np.testing.assert_allclose(
+                ds['dswrf'][:], [self.values[::-1, 2:7] + 200 + hour for hour in hours],
+                atol=1e-3)
+            np.testing.assert_allclose(ds['time'][:], np.round(np.array(hours) / 24, 4))
+        self.assertFalse(pathlib.Path('20220303').exists())
+        self.assertEqual(len(logs.records), 2)
+        self.assertTrue(any('[7] of 2022-03-02' in line for line in logs.output))
+        self.assertTrue(any('No file of 2022-03-03' in line for line in logs.output))
+
+
+if __name__ == '__main__':
+    unittest.main()
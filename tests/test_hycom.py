@@ -0,0 +1,216 @@
+#! /usr/bin/env python
+from datetime import datetime
+import pathlib
+import tempfile
+import unittest
+
+from netCDF4 import Dataset, num2date
+import numpy as np
+from scipy.interpolate import RegularGridInterpolator, griddata
+import seawater as sw
+
+from pyschism.forcing.hycom.hycom2schism import (
+    GridInterpolator, HycomInventory, stage_subset)
+from pyschism.forcing.hycom.interp import TriangulationInterpolator
+from pyschism.forcing.hycom.ptemp import potential_temperature
+
+
+def make_hycom(path, dates):
+    """Writes a small dataset laid out like the HYCOM aggregations."""
+    lon = np.arange(260., 280.01, 0.5)
+    lat = np.arange(10., 30.01, 0.5)
+    depth = np.array([0., 10., 50., 200.])
+    with Dataset(path, 'w') as dst:
+        for name, values in [('lon', lon), ('lat', lat), ('depth', depth)]:
+            dst.createDimension(name, len(values))
+            dst.createVariable(name, 'f8', (name,))[:] = values
+        dst.createDimension('time', None)
+        time = dst.createVariable('time', 'f8', ('time',))
+        time.units = 'hours since 2000-01-01 00:00:00'
+        time[:] = [(date - datetime(2000, 1, 1)).total_seconds() / 3600.
+                   for date in dates]
+        shape = (len(dates), len(depth), len(lat), len(lon))
+        values = np.arange(np.prod(shape)).reshape(shape) % 1000 * 0.01
+        for name, dims in [('surf_el', ('time', 'lat', 'lon')),
+                           ('salinity', ('time', 'depth', 'lat', 'lon'))]:
+            var = dst.createVariable(name, 'i2', dims, fill_value=-30000)
+            var.scale_factor = 0.001
+            var.add_offset = 20.
+            var[:] = values[:, 0] if len(dims) == 3 else values
+            var[:, ..., 0] = np.ma.masked
+
+
+class LocalInventory(HycomInventory):
+
+    def __init__(self, url, *args, **kwargs):
+        self.url = url
+        super().__init__(*args, **kwargs)
+
+    def get_url(self, date):
+        return self.url
+
+
+class HycomInventoryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.tmpdir.name) / 'hycom.nc'
+        self.dates = [datetime(2018, 1, 1), datetime(2018, 1, 2)]
+        make_hycom(self.path, self.dates)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_stage_subset(self):
+        out = stage_subset(self.path, self.path.parent / 'subset.nc', 1,
+                           (2, 5), (0, 3), ['surf_el', 'salinity'])
+        with Dataset(self.path) as src, Dataset(out) as dst:
+            self.assertEqual(dst['salinity'].shape, (1, 4, 4, 4))
+            np.testing.assert_array_equal(dst['lat'][:], src['lat'][2:6])
+            for name in ['surf_el', 'salinity']:
+                np.testing.assert_array_equal(
+                    dst[name][:], src[name][1:2, ..., 2:6, 0:4])
+                np.testing.assert_array_equal(
+                    dst[name][:].mask, src[name][1:2, ..., 2:6, 0:4].mask)
+
+    def test_fetch(self):
+        cache = self.path.parent / 'cache'
+        inventory = LocalInventory(
+            self.path, [-95., -90.], [20., 22.], ['surf_el'], cache=cache,
+            workers=2)
+        subsets = list(inventory.fetch(self.dates))
+        self.assertEqual(len(set(path for path, _, _ in subsets)), 2)
+        path, x2, y2 = subsets[1]
+        with Dataset(path) as ds:
+            # 2 degrees margin around the extents
+            np.testing.assert_array_equal(ds['lon'][[0, -1]], [263., 272.])
+            np.testing.assert_array_equal(ds['lat'][[0, -1]], [18., 24.])
+            self.assertEqual(
+                num2date(ds['time'][0], ds['time'].units), self.dates[1])
+            self.assertNotIn('salinity', ds.variables)
+            self.assertEqual(len(x2), len(ds['lon']))
+            self.assertEqual(len(y2), len(ds['lat']))
+        mtime = path.stat().st_mtime_ns
+        inventory.workers = 1
+        self.assertEqual(list(inventory.fetch(self.dates[1:]))[0][0], path)
+        self.assertEqual(path.stat().st_mtime_ns, mtime)
+
+    def test_fetch_prefetch(self):
+        inventory = LocalInventory(
+            self.path, [-95., -90.], [20., 22.], ['surf_el'],
+            cache=self.path.parent / 'cache', workers=2, prefetch=1)
+        dates = self.dates * 2
+        subsets = list(inventory.fetch(dates))
+        # subsets come in the order of the dates
+        for date, (path, _, _) in zip(dates, subsets):
+            with Dataset(path) as ds:
+                self.assertEqual(num2date(ds['time'][0], ds['time'].units), date)
+
+
+class GridInterpolatorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.grid = (np.array([0., 10., 50.]), np.linspace(0., 1., 6),
+                     np.linspace(0., 2., 9))
+        self.values = rng.normal(size=(3, 6, 9))
+        self.points = np.c_[rng.uniform(0., 50., 200),
+                            rng.uniform(0., 1., 200), rng.uniform(0., 2., 200)]
+
+    def test_linear(self):
+        interpolator = GridInterpolator(self.grid, self.points)
+        expected = RegularGridInterpolator(self.grid, self.values)(self.points)
+        np.testing.assert_allclose(interpolator(self.values), expected)
+
+    def test_missing_values(self):
+        values = np.ma.masked_array(self.values, mask=False)
+        values[2, :, :4] = np.ma.masked
+        values.data[values.mask] = -30000.
+        points = np.vstack([self.points, [[60., 0.5, 1.]]])
+        interpolator = GridInterpolator(self.grid, points)
+        out = interpolator(values)
+        invalid = (points[:, 0] > 10.) & (points[:, 2] < 1.) \
+            | (points[:, 0] > 50.)
+        self.assertTrue(np.any(invalid))
+        expected = RegularGridInterpolator(self.grid, values.filled(np.nan))(
+            points[~invalid])
+        np.testing.assert_allclose(out[~invalid], expected)
+        # invalid points take the value of the nearest valid point
+        distances = np.linalg.norm(
+            points[invalid, None, :] - points[None, ~invalid, :], axis=2)
+        np.testing.assert_allclose(
+            out[invalid], out[~invalid][np.argmin(distances, axis=1)])
+
+    def test_save(self):
+        interpolator = GridInterpolator(self.grid, self.points)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = pathlib.Path(tmpdir) / 'interp.npz'
+            interpolator.save(path)
+            loaded = GridInterpolator.load(path)
+        np.testing.assert_array_equal(
+            loaded(self.values), interpolator(self.values))
+        self.assertEqual(len(loaded.grid), 3)
+
+    def test_batched(self):
+        interpolator = GridInterpolator(self.grid, self.points)
+        values = np.stack([self.values, 2. * self.values], axis=-1)
+        values[0, 0, 0, 1] = np.nan
+        out = interpolator(values)
+        self.assertEqual(out.shape, (200, 2))
+        np.testing.assert_allclose(out[:, 0], interpolator(values[..., 0]))
+        np.testing.assert_allclose(out[:, 1], interpolator(values[..., 1]))
+
+
+class TriangulationInterpolatorTestCase(unittest.TestCase):
+
+    def test_griddata(self):
+        rng = np.random.default_rng(0)
+        x, y = np.meshgrid(np.linspace(0., 1., 12), np.linspace(0., 2., 15))
+        sources = np.c_[x.ravel(), y.ravel()]
+        values = np.sin(sources[:, 0]) + sources[:, 1] ** 2
+        values[(sources[:, 0] < 0.3) & (sources[:, 1] > 1.5)] = np.nan
+        points = np.c_[rng.uniform(-0.2, 1.2, 100), rng.uniform(-0.2, 2.2, 100)]
+        expected = griddata(sources, values, points, method='linear')
+        missing = np.isnan(expected)
+        valid = ~np.isnan(values)
+        expected[missing] = griddata(
+            sources[valid], values[valid], points[missing], method='nearest')
+        interpolator = TriangulationInterpolator(sources, points)
+        np.testing.assert_allclose(interpolator(values), expected)
+        np.testing.assert_allclose(
+            interpolator(np.c_[values, values + 1.])[:, 1], expected + 1.)
+
+
+class PotentialTemperatureTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.dep = np.array([0., 100., 1000., 5000.])
+        self.salt = rng.uniform(30., 38., (4, 5, 6))
+        self.temp = rng.uniform(-2., 30., (4, 5, 6))
+        self.expected = sw.ptmp(
+            self.salt, self.temp,
+            self.dep[:, None, None] * np.ones((4, 5, 6)), 0.) * 1.00024
+
+    def test_seawater(self):
+        ptemp = potential_temperature(self.salt, self.temp, self.dep)
+        self.assertEqual(ptemp.dtype, np.float32)
+        np.testing.assert_allclose(ptemp, self.expected, atol=1e-4)
+        ptemp = potential_temperature(
+            self.salt[None], self.temp[None], self.dep)
+        np.testing.assert_allclose(ptemp[0], self.expected, atol=1e-4)
+
+    def test_cells(self):
+        salt = np.ma.masked_array(self.salt, mask=False)
+        salt[0, 0, 0] = np.ma.masked
+        temp = self.temp.copy()
+        temp[1, 0, 0] = -30000.
+        ptemp = potential_temperature(salt, temp, self.dep, [0, 30, 31, 40])
+        self.assertTrue(np.isnan(ptemp.flat[[0, 1, 30]]).all())
+        np.testing.assert_allclose(
+            ptemp.flat[[31, 40]], self.expected.flat[[31, 40]], atol=1e-4)
+        self.assertEqual(np.count_nonzero(~np.isnan(ptemp)), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+#! /usr/bin/env python
+import pathlib
+import tempfile
+import unittest
+
+from netCDF4 import Dataset
+import numpy as np
+
+from pyschism.forcing.bctides.ncwriter import NuNcWriter, ThNcWriter
+
+
+class NcWriterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_th_nc(self):
+        values = np.arange(3 * 5 * 4 * 2, dtype=float).reshape(3, 5, 4, 2)
+        with ThNcWriter(self.path / 'uv3D.th.nc', 5, 4, 2, zlib=True) as dst:
+            for it in range(3):
+                dst.write(it, values[it, :2], it * 86400.)
+                dst.write(it, values[it, 2:, :, 0], offset=2, component=0)
+                dst.write(it, values[it, 2:, :, 1], offset=2, component=1)
+        with Dataset(self.path / 'uv3D.th.nc') as ds:
+            self.assertEqual(ds['time_series'].dtype, np.float32)
+            self.assertEqual(ds['time_series'].chunking(), [1, 5, 4, 2])
+            self.assertTrue(ds['time_series'].filters()['zlib'])
+            np.testing.assert_array_equal(ds['time_series'][:], values)
+            np.testing.assert_array_equal(ds['time'][:], [0., 86400., 172800.])
+            self.assertEqual(ds['time_step'][0], 86400.)
+
+    def test_elev2d(self):
+        with ThNcWriter(self.path / 'elev2D.th.nc', 4) as dst:
+            dst.write(0, [1., 2., 3., 4.], 0.)
+        with Dataset(self.path / 'elev2D.th.nc') as ds:
+            self.assertEqual(ds['time_series'].shape, (1, 4, 1, 1))
+            np.testing.assert_array_equal(
+                ds['time_series'][0, :, 0, 0], [1., 2., 3., 4.])
+
+    def test_nu_nc(self):
+        with NuNcWriter(self.path / 'TEM_nu.nc', [3, 7], 2) as dst:
+            dst.write(0, [[1., 2.], [3., 4.]], 0)
+        with Dataset(self.path / 'TEM_nu.nc') as ds:
+            np.testing.assert_array_equal(ds['map_to_global_node'][:], [4, 8])
+            self.assertEqual(ds['tracer_concentration'].shape, (1, 2, 2, 1))
+            np.testing.assert_array_equal(
+                ds['tracer_concentration'][0, :, :, 0], [[1., 2.], [3., 4.]])
+
+
+if __name__ == '__main__':
+    unittest.main()
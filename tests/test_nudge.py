@@ -0,0 +1,133 @@
+#! /usr/bin/env python
+import argparse
+from datetime import datetime, timedelta
+import multiprocessing as mp
+import pathlib
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from netCDF4 import Dataset
+import numpy as np
+
+from pyschism.cmd._nudge import NudgeCli
+from pyschism.forcing.bctides.ncwriter import NuNcWriter
+from pyschism.forcing.bctides.nudge import get_nudge_zone
+from pyschism.forcing.hycom.hycom2schism import HycomInventory, Nudge
+from pyschism.mesh import Hgrid
+
+from test_hycom import make_hycom
+
+
+class NudgeZoneTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # a strip of 2 x 6 nodes split in triangles, open boundary on x=0
+        x, y = np.meshgrid(np.arange(6.), np.arange(2.))
+        self.xy = np.column_stack([x.ravel(), y.ravel()])
+        connectivity = []
+        for i in range(5):
+            connectivity.append([i, i + 1, i + 7, -1])
+            connectivity.append([i, i + 7, i + 6, -1])
+        self.connectivity = np.array(connectivity)
+
+    def test_linear_ramp(self):
+        rnu, include = get_nudge_zone(
+            self.xy, self.connectivity, [0, 6], rlmax=2., rnu_day=1.)
+        rnu_max = 1. / 86400.
+        np.testing.assert_allclose(
+            rnu[:6], [rnu_max, rnu_max / 2, 0., 0., 0., 0.])
+        # nodes at x=2 are added through the elements touching x=1
+        np.testing.assert_array_equal(include, [0, 1, 2, 6, 7, 8])
+
+    def test_no_open_boundary(self):
+        rnu, include = get_nudge_zone(self.xy, self.connectivity, [])
+        self.assertFalse(np.any(rnu))
+        self.assertEqual(len(include), 0)
+
+
+class NudgeCliTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.tmpdir.name)
+        # a strip of 2 x 6 nodes 0.5 degree apart, open boundary on x=-95
+        nodes = [f'{6 * i + j + 1} {-95 + 0.5 * j} {20 + 0.5 * i} 50.0'
+                 for i in range(2) for j in range(6)]
+        elements = []
+        for j in range(5):
+            elements.append(f'{2 * j + 1} 3 {j + 1} {j + 2} {j + 8}')
+            elements.append(f'{2 * j + 2} 3 {j + 1} {j + 8} {j + 7}')
+        self.hgrid = self.path / 'hgrid.gr3'
+        self.hgrid.write_text(
+            f'hgrid\n{len(elements)} {len(nodes)}\n' + '\n'.join(nodes + elements) + '\n'
+            '1 = Number of open boundaries\n2 = Total number of open boundary nodes\n'
+            '2 = Number of nodes for open boundary 1\n1\n7\n'
+            '0 = number of land boundaries\n0 = Total number of land boundary nodes\n')
+        self.vgrid = self.path / 'vgrid.in'
+        self.vgrid.write_text('1\n3\n' + ' '.join(['1'] * 12) + '\n' + '\n'.join(
+            f'{k + 1} ' + ' '.join([sigma] * 12)
+            for k, sigma in enumerate(['-1.0', '-0.5', '0.0'])) + '\n')
+        make_hycom(self.path / 'hycom.nc', [datetime(2018, 1, 1), datetime(2018, 1, 2)])
+        with Dataset(self.path / 'hycom.nc', 'a') as ds:
+            var = ds.createVariable(
+                'water_temp', 'i2', ('time', 'depth', 'lat', 'lon'), fill_value=-30000)
+            var.scale_factor = 0.001
+            var.add_offset = 0.
+            var[:] = ds['salinity'][:] * 0.5
+        url = str(self.path / 'hycom.nc')
+        self.patches = [
+            patch.object(HycomInventory, 'get_url', lambda self, date: url),
+            patch('appdirs.user_cache_dir', return_value=str(self.path / 'cache')),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.tmpdir.cleanup()
+
+    def parse_args(self, *args):
+        parser = argparse.ArgumentParser()
+        NudgeCli.add_subparser_action(parser.add_subparsers(dest='clitype'))
+        return parser.parse_args(['nudge', str(self.hgrid), str(self.vgrid), *args])
+
+    def test_parse(self):
+        args = self.parse_args(
+            '--start-date', '2022-03-01T00:00:00',
+            '--run-days', '2', '--workers', '3', '--prefetch', '5', '-o', 'out')
+        self.assertEqual(args.clitype, 'nudge')
+        self.assertEqual(len(args.hgrid.boundaries.open), 1)
+        self.assertEqual(args.start_date, datetime(2022, 3, 1))
+        self.assertEqual(args.end_date, timedelta(days=2))
+        self.assertEqual((args.workers, args.prefetch), (3, 5))
+        self.assertEqual(args.output_directory, 'out')
+        self.assertEqual(args.baroclinic_database, 'gofs')
+
+    def test_rlmax(self):
+        NudgeCli(self.parse_args(
+            '--start-date', '2018-01-01T00:00:00', '--run-days', '1', '--rlmax', '0.6',
+            '--rnu_day', '0.5', '--workers', '1', '-o', str(self.path / 'out')))
+        with open(self.path / 'out/TEM_nudge.gr3') as f:
+            self.assertEqual(f.readline().strip(), '0.6, 0.5')
+        # only the nodes within 0.6 degree of the boundary and their neighbours
+        for name in ('TEM_nu.nc', 'SAL_nu.nc'):
+            with Dataset(self.path / 'out' / name) as ds:
+                np.testing.assert_array_equal(ds['map_to_global_node'][:], [1, 2, 3, 7, 8, 9])
+                self.assertEqual(ds['tracer_concentration'].shape, (2, 6, 3, 1))
+
+    def test_failure(self):
+        hgrid = Hgrid.open(self.hgrid)
+        with patch.object(NuNcWriter, 'write', side_effect=OSError('disk full')), \
+                patch.object(NuNcWriter, 'close', autospec=True,
+                             side_effect=NuNcWriter.close) as close:
+            with self.assertRaises(OSError):
+                Nudge().fetch_data(self.path, hgrid, self.vgrid, datetime(2018, 1, 1), 1,
+                                   workers=2, cache=self.path / 'cache')
+        self.assertEqual(close.call_count, 2)
+        self.assertEqual(mp.active_children(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
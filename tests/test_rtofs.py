@@ -0,0 +1,94 @@
+#! /usr/bin/env python
+from datetime import datetime, timedelta
+import pathlib
+import tempfile
+import unittest
+
+from netCDF4 import Dataset, num2date
+import numpy as np
+
+from pyschism.forcing.hycom.rtofs2schism import RtofsInventory
+
+
+def make_rtofs(path, variable, cycle, ndays):
+    """Writes a small dataset laid out like an RTOFS aggregation."""
+    hours = 3 if variable == 'ssh' else 24
+    lon = np.arange(250., 290.01, 0.5)
+    lat = np.arange(10., 30.01, 0.5)
+    lev = np.array([0.]) if variable == 'ssh' else np.array([0., 10., 50.])
+    times = np.arange(ndays * 24 // hours + 1) * hours / 24.
+    with Dataset(path, 'w') as dst:
+        for name, values in [('time', times), ('lev', lev), ('lat', lat),
+                             ('lon', lon)]:
+            dst.createDimension(name, len(values))
+            dst.createVariable(name, 'f8', (name,))[:] = values
+        dst['time'].units = f'days since {cycle:%Y-%m-%d %H:%M:%S}'
+        var = dst.createVariable(
+            variable, 'f4', ('time', 'lev', 'lat', 'lon'), fill_value=1.e30)
+        var[:] = (times[:, None, None, None] * 100.
+                  + np.arange(len(lev))[:, None, None] * 10.
+                  + lat[:, None] * 0. + lon * 0.)
+        var[:, :, :, 0] = np.ma.masked
+
+
+class LocalRtofsInventory(RtofsInventory):
+
+    def __init__(self, urls, *args, **kwargs):
+        self.urls = urls
+        super().__init__(*args, **kwargs)
+
+    def get_url(self, variable):
+        return self.urls[variable]
+
+
+class RtofsInventoryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.tmpdir.name)
+        self.cycle = datetime(2021, 6, 1)
+        self.dates = [self.cycle + timedelta(days=i) for i in range(3)]
+        self.urls = {}
+        for variable in ['ssh', 'salinity']:
+            self.urls[variable] = self.path / f'{variable}.nc'
+            make_rtofs(self.urls[variable], variable, self.cycle, 4)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_stage(self):
+        inventory = LocalRtofsInventory(
+            self.urls, [-95., -90.], [20., 22.], self.dates,
+            ['ssh', 'salinity'], cache=self.path / 'cache')
+        path = inventory.stage()
+        with Dataset(path) as ds:
+            np.testing.assert_array_equal(ds['lon'][[0, -1]], [263., 272.])
+            np.testing.assert_array_equal(ds['lat'][[0, -1]], [18., 24.])
+            self.assertEqual(
+                list(num2date(ds['time'][:], ds['time'].units)), self.dates)
+            # the record after each date is used: 3 hours for ssh, 1 day
+            # for the daily 3D variables
+            np.testing.assert_allclose(
+                ds['ssh'][:, 0, 1], [12.5, 112.5, 212.5])
+            np.testing.assert_allclose(
+                ds['salinity'][:, :, 0, 1],
+                [[100., 110., 120.], [200., 210., 220.], [300., 310., 320.]])
+            self.assertEqual(ds['salinity'].dtype, np.float32)
+
+    def test_reuse(self):
+        path = LocalRtofsInventory(
+            self.urls, [-96., -89.], [19., 23.], self.dates,
+            cache=self.path, variables=['ssh', 'salinity']).stage()
+        # a smaller bbox, fewer days and variables read the staged file
+        inventory = LocalRtofsInventory(
+            {}, [-95., -90.], [20., 22.], self.dates[:2], ['salinity'],
+            cache=self.path)
+        self.assertEqual(inventory.stage(), path)
+        inventory = LocalRtofsInventory(
+            self.urls, [-95., -80.], [20., 22.], self.dates, ['salinity'],
+            cache=self.path)
+        self.assertNotEqual(inventory.stage(), path)
+
+
+if __name__ == '__main__':
+    unittest.main()
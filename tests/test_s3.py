@@ -0,0 +1,154 @@
+#! /usr/bin/env python
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pathlib
+import re
+import tempfile
+import threading
+import unittest
+from urllib.parse import parse_qs, urlparse
+
+import boto3
+from botocore import UNSIGNED
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+from pyschism.utils.s3 import S3Downloader
+
+
+class ObjectStore:
+    """Local stand-in of a public S3 bucket, serving objects over HTTP
+    with Range requests, for boto3 clients created by client().
+
+    The next `corrupt` responses have their first byte changed.
+    """
+
+    def __init__(self):
+        self.objects = {}
+        self.served = 0
+        self.corrupt = 0
+        store = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                self.do_GET(body=False)
+
+            def do_GET(self, body=True):
+                url = urlparse(self.path)
+                bucket, _, key = url.path.lstrip('/').partition('/')
+                query = parse_qs(url.query)
+                if not key and 'list-type' in query:
+                    return self.send(200, store.listing(bucket, query.get('prefix', [''])[0]), body)
+                if (bucket, key) not in store.objects:
+                    return self.send(404, b'<Error><Code>NoSuchKey</Code></Error>', body)
+                data = store.objects[bucket, key]
+                headers = {'ETag': f'"{hashlib.md5(data).hexdigest()}"'}
+                match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+                if match is None:
+                    return self.send(200, data, body, headers)
+                first = int(match.group(1))
+                last = int(match.group(2)) if match.group(2) else len(data) - 1
+                headers['Content-Range'] = f'bytes {first}-{last}/{len(data)}'
+                return self.send(206, data[first:last + 1], body, headers)
+
+            def send(self, status, data, body, headers={}):
+                if body and status < 300 and store.corrupt > 0:
+                    store.corrupt -= 1
+                    data = bytes([data[0] ^ 1]) + data[1:]
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                if body:
+                    self.wfile.write(data)
+                    store.served += len(data)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def listing(self, bucket, prefix):
+        keys = sorted(key for b, key in self.objects if b == bucket and key.startswith(prefix))
+        contents = ''.join(
+            f'<Contents><Key>{key}</Key><Size>{len(self.objects[bucket, key])}</Size></Contents>'
+            for key in keys)
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+            f'<Name>{bucket}</Name><Prefix>{prefix}</Prefix><KeyCount>{len(keys)}</KeyCount>'
+            f'<MaxKeys>1000</MaxKeys><IsTruncated>false</IsTruncated>{contents}'
+            '</ListBucketResult>').encode()
+
+    def put(self, bucket, key, data):
+        self.objects[bucket, key] = data
+
+    def client(self):
+        host, port = self.server.server_address
+        return boto3.client(
+            's3', endpoint_url=f'http://{host}:{port}', region_name='us-east-1',
+            config=Config(signature_version=UNSIGNED, retries={'total_max_attempts': 1}))
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class S3DownloaderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.tmpdir.name)
+        self.store = ObjectStore()
+        self.data = bytes(range(256)) * 400
+        self.store.put('bucket', 'key', self.data)
+        self.downloader = S3Downloader(
+            'bucket', self.store.client(), workers=4, backoff=0.,
+            multipart_threshold=50000, part_size=16384)
+
+    def tearDown(self):
+        self.downloader.close()
+        self.store.close()
+        self.tmpdir.cleanup()
+
+    def test_download(self):
+        self.store.put('bucket', 'small', b'GRIB')
+        paths = self.downloader.download_many(
+            [('key', self.path / 'key'), ('small', self.path / 'a/small')])
+        self.assertEqual(paths, [self.path / 'key', self.path / 'a/small'])
+        self.assertEqual((self.path / 'key').read_bytes(), self.data)
+        self.assertEqual((self.path / 'a/small').read_bytes(), b'GRIB')
+        self.assertEqual(self.downloader.metrics.nbytes, len(self.data) + 4)
+        self.assertGreater(self.downloader.metrics.latency('key'), 0.)
+
+    def test_retry(self):
+        self.store.corrupt = 1
+        self.downloader.download('key', self.path / 'key')
+        self.assertEqual((self.path / 'key').read_bytes(), self.data)
+        self.assertEqual(self.downloader.metrics.records['key'][2], 2)
+
+    def test_corrupted(self):
+        self.downloader.retries = 1
+        self.store.corrupt = 1000
+        with self.assertRaises(ValueError):
+            self.downloader.download('key', self.path / 'key')
+        self.assertEqual(list(self.path.iterdir()), [])
+
+    def test_missing(self):
+        with self.assertRaises(ClientError):
+            self.downloader.download('missing', self.path / 'missing')
+        self.assertEqual(self.downloader.download_many(
+            [('missing', self.path / 'missing')]), [None])
+        self.assertEqual(list(self.path.iterdir()), [])
+
+    def test_get(self):
+        self.assertEqual(self.downloader.get_ranges('key', [(0, 9), (102390, None)]),
+                         [self.data[:10], self.data[102390:]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+#! /usr/bin/env python
+from datetime import datetime
+import pathlib
+import tempfile
+import unittest
+
+from netCDF4 import Dataset
+import numpy as np
+
+from pyschism.forcing.hycom.tilecache import TileCache
+
+from test_hycom import make_hycom
+
+
+class TileCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.tmpdir.name)
+        self.url = str(self.path / 'hycom.nc')
+        make_hycom(self.url, [datetime(2018, 1, 1), datetime(2018, 1, 2)])
+        self.lat_idxs = list(range(3, 20))
+        self.lon_idxs = list(range(0, 30))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def expected(self, name, *key):
+        with Dataset(self.url) as ds:
+            return np.ma.filled(ds[name][key].astype(float), np.nan)
+
+    def test_read(self):
+        cache = TileCache(self.path / 'cache', tile_size=8)
+        ds = cache.dataset(self.url)
+        np.testing.assert_allclose(
+            ds['surf_el'][1, self.lat_idxs, self.lon_idxs],
+            self.expected('surf_el', 1, self.lat_idxs, self.lon_idxs),
+            rtol=1e-6)
+        np.testing.assert_allclose(
+            ds['salinity'][0, :, self.lat_idxs, self.lon_idxs],
+            self.expected('salinity', 0, slice(None), self.lat_idxs,
+                          self.lon_idxs), rtol=1e-6)
+        ds.close()
+        # later runs read the tiles and the axes from the cache only
+        pathlib.Path(self.url).rename(self.path / 'moved.nc')
+        ds = TileCache(self.path / 'cache', tile_size=8).dataset(self.url)
+        self.assertEqual(ds['time'].units, 'hours since 2000-01-01 00:00:00')
+        self.assertEqual(len(ds['lon'][:]), 41)
+        self.assertEqual(
+            ds['surf_el'][1, self.lat_idxs[2:], self.lon_idxs[:-3]].shape,
+            (15, 27))
+
+    def test_growing_time(self):
+        ds = TileCache(self.path / 'cache', tile_size=8).dataset(self.url)
+        self.assertEqual(len(ds['time']), 2)
+        ds['surf_el'][1, self.lat_idxs, self.lon_idxs]
+        ds.close()
+        with Dataset(self.url, 'a') as dst:
+            dst['time'][2] = dst['time'][1] + 24.
+            dst['surf_el'][2] = dst['surf_el'][1][:] + 1.
+        ds = TileCache(self.path / 'cache', tile_size=8).dataset(self.url)
+        self.assertEqual(len(ds['time']), 3)
+        np.testing.assert_allclose(
+            ds['surf_el'][2, self.lat_idxs, self.lon_idxs],
+            self.expected('surf_el', 2, self.lat_idxs, self.lon_idxs), rtol=1e-6)
+        ds.close()
+        # the grown axes are the offline fallback
+        pathlib.Path(self.url).rename(self.path / 'moved.nc')
+        ds = TileCache(self.path / 'cache', tile_size=8).dataset(self.url)
+        self.assertEqual(len(ds['time']), 3)
+
+    def test_size(self):
+        cache = TileCache(self.path / 'cache', tile_size=8)
+        ds = cache.dataset(self.url)
+        ds['surf_el'][0, self.lat_idxs, self.lon_idxs]
+        ds['salinity'][1, :, self.lat_idxs, self.lon_idxs]
+        self.assertEqual(cache.size, sum(
+            path.stat().st_size for path in cache.path.rglob('*.npy')))
+        cache.max_size = cache.size // 2
+        cache.evict()
+        self.assertLessEqual(cache.size, cache.max_size)
+        self.assertEqual(cache.size, sum(
+            path.stat().st_size for path in cache.path.rglob('*.npy')))
+
+    def test_evict(self):
+        cache = TileCache(self.path / 'cache', max_size=0, tile_size=8)
+        ds = cache.dataset(self.url)
+        values = ds['surf_el'][0, self.lat_idxs, self.lon_idxs]
+        np.testing.assert_allclose(
+            values, self.expected('surf_el', 0, self.lat_idxs, self.lon_idxs),
+            rtol=1e-6)
+        self.assertEqual(len(list(cache.path.rglob('*.npy'))), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()